@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from drug_names import fold_variants, lookup_key
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Learned aliases: (raw mention -> normalized name) pairs that the LLM
+# extractor produced and that resolved to a DB record, with hit counts.
+# Approved pairs are merged into the alias table (drug_names) on every DB
+# load. Set ALIAS_MEMORY_PATH to an empty string to disable.
+ALIAS_MEMORY_PATH = os.getenv(
+    "ALIAS_MEMORY_PATH", os.path.join(BASE_DIR, "data", "alias_memory.sqlite")
+)
+# Approve a pending pair once it has been seen this many times (0 = only by
+# review through /admin/aliases).
+ALIAS_MEMORY_AUTO_APPROVE = int(os.getenv("ALIAS_MEMORY_AUTO_APPROVE", "0"))
+# Mentions longer than this are phrases rather than names and are not kept.
+ALIAS_MEMORY_MAX_LENGTH = int(os.getenv("ALIAS_MEMORY_MAX_LENGTH", "40"))
+
+STATUSES = ("pending", "approved", "rejected")
+
+
+class AliasMemory:
+    """
+    Persistent store of learned aliases in a SQLite file.
+
+    A pair is keyed by lookup_key(raw) and the normalized name, so a mention
+    the LLM normalized two different ways shows up as two rows. Every pair
+    starts "pending"; only "approved" ones are returned by approved(), and at
+    most one normalized name per raw key is approved at a time. `revision`
+    changes whenever the approved set does, which is what drug_db watches.
+    """
+
+    def __init__(self, path: Optional[str], auto_approve: int = 0, max_length: int = 40):
+        self.path = path or None
+        self.auto_approve = auto_approve
+        self.max_length = max_length
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"recorded": 0, "auto_approved": 0, "errors": 0}
+
+        if self.path:
+            try:
+                self._init_db()
+            except sqlite3.Error as e:
+                print(f"[!] 无法打开别名学习库 {self.path}，已停用: {e}")
+                self.path = None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS aliases ("
+                " key TEXT NOT NULL,"
+                " raw TEXT NOT NULL,"
+                " normalized TEXT NOT NULL,"
+                " status TEXT NOT NULL DEFAULT 'pending',"
+                " hits INTEGER NOT NULL DEFAULT 0,"
+                " first_seen REAL NOT NULL,"
+                " last_seen REAL NOT NULL,"
+                " reviewed_at REAL,"
+                " PRIMARY KEY (key, normalized))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS aliases_status ON aliases (status, hits)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('revision', 0)")
+
+    def _bump_revision(self, conn: sqlite3.Connection) -> None:
+        conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'revision'")
+
+    def _clean(self, raw: str, normalized: str) -> Optional[Tuple[str, str, str]]:
+        """(key, raw, normalized) for a pair worth keeping, else None."""
+        raw = " ".join(fold_variants(raw).split())
+        normalized = " ".join((normalized or "").upper().split())
+        key = lookup_key(raw)
+        if len(raw) < 2 or len(raw) > self.max_length or not normalized:
+            return None
+        if key == lookup_key(normalized):
+            return None
+        return key, raw, normalized
+
+    def record(self, pairs: Iterable[Tuple[str, str]]) -> int:
+        """
+        Count each (raw, normalized) pair, adding unseen ones as pending;
+        with auto_approve, promote pairs that reached that many hits. Returns
+        the number of pairs stored. Storage errors are logged and ignored.
+        """
+        if not self.path:
+            return 0
+        rows = [row for row in (self._clean(raw, norm) for raw, norm in pairs) if row]
+        if not rows:
+            return 0
+        now = time.time()
+        try:
+            conn = self._conn()
+            with conn:
+                for key, raw, normalized in rows:
+                    conn.execute(
+                        "INSERT INTO aliases (key, raw, normalized, hits, first_seen, last_seen)"
+                        " VALUES (?, ?, ?, 1, ?, ?)"
+                        " ON CONFLICT (key, normalized) DO UPDATE SET hits = hits + 1, last_seen = excluded.last_seen",
+                        (key, raw, normalized, now, now),
+                    )
+                    if self.auto_approve > 0 and self._auto_approve(conn, key, normalized, now):
+                        with self._lock:
+                            self.stats["auto_approved"] += 1
+        except sqlite3.Error as e:
+            with self._lock:
+                self.stats["errors"] += 1
+            print(f"[!] 别名学习记录失败: {e}")
+            return 0
+        with self._lock:
+            self.stats["recorded"] += len(rows)
+        return len(rows)
+
+    def _auto_approve(self, conn: sqlite3.Connection, key: str, normalized: str, now: float) -> bool:
+        # Never overrides a review: the pair must still be pending and no
+        # other normalized name may be approved for the same mention.
+        cur = conn.execute(
+            "UPDATE aliases SET status = 'approved', reviewed_at = ?"
+            " WHERE key = ? AND normalized = ? AND status = 'pending' AND hits >= ?"
+            " AND NOT EXISTS (SELECT 1 FROM aliases WHERE key = ? AND status = 'approved')",
+            (now, key, normalized, self.auto_approve, key),
+        )
+        if cur.rowcount:
+            self._bump_revision(conn)
+        return bool(cur.rowcount)
+
+    def review(self, raw: str, normalized: str, status: str) -> Optional[Dict[str, Any]]:
+        """
+        Set the status of a stored pair and return it, or None if there is
+        no such pair. Approving a pair moves any other approved normalized
+        name of the same mention back to pending.
+        """
+        if status not in STATUSES:
+            raise ValueError(f"Unsupported status: {status}")
+        if not self.path:
+            return None
+        key = lookup_key(raw)
+        normalized = " ".join((normalized or "").upper().split())
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            row = conn.execute(
+                "SELECT status FROM aliases WHERE key = ? AND normalized = ?", (key, normalized)
+            ).fetchone()
+            if row is None:
+                return None
+            if status == "approved":
+                conn.execute(
+                    "UPDATE aliases SET status = 'pending', reviewed_at = ?"
+                    " WHERE key = ? AND normalized != ? AND status = 'approved'",
+                    (now, key, normalized),
+                )
+            conn.execute(
+                "UPDATE aliases SET status = ?, reviewed_at = ? WHERE key = ? AND normalized = ?",
+                (status, now, key, normalized),
+            )
+            if "approved" in (status, row[0]):
+                self._bump_revision(conn)
+        return self.entries(key=key, normalized=normalized)[0]
+
+    def entries(
+        self,
+        status: Optional[str] = None,
+        limit: int = 100,
+        key: Optional[str] = None,
+        normalized: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Stored pairs, most hits first, optionally filtered."""
+        if not self.path:
+            return []
+        where, params = [], []
+        for column, value in (("status", status), ("key", key), ("normalized", normalized)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        sql = "SELECT raw, normalized, status, hits, first_seen, last_seen, reviewed_at FROM aliases"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY hits DESC, last_seen DESC LIMIT ?"
+        columns = ("raw", "normalized", "status", "hits", "first_seen", "last_seen", "reviewed_at")
+        rows = self._conn().execute(sql, (*params, limit)).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def approved(self) -> Dict[str, List[str]]:
+        """Approved pairs as {normalized: [raw]}, the drug_names.install_aliases shape."""
+        if not self.path:
+            return {}
+        result: Dict[str, List[str]] = {}
+        try:
+            rows = self._conn().execute(
+                "SELECT normalized, raw FROM aliases WHERE status = 'approved' ORDER BY key"
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"[!] 无法读取已确认的学习别名: {e}")
+            return {}
+        for normalized, raw in rows:
+            result.setdefault(normalized, []).append(raw)
+        return result
+
+    def revision(self) -> Optional[int]:
+        """Changes whenever the approved set does; None when disabled or unreadable."""
+        if not self.path:
+            return None
+        try:
+            row = self._conn().execute("SELECT value FROM meta WHERE name = 'revision'").fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and sizes for the /stats endpoint."""
+        counts = {status: 0 for status in STATUSES}
+        if self.path:
+            try:
+                for status, n in self._conn().execute("SELECT status, COUNT(*) FROM aliases GROUP BY status"):
+                    counts[status] = n
+            except sqlite3.Error:
+                pass
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            **stats,
+            **counts,
+            "revision": self.revision(),
+            "auto_approve": self.auto_approve,
+            "path": self.path,
+        }
+
+
+ALIAS_MEMORY = AliasMemory(ALIAS_MEMORY_PATH, ALIAS_MEMORY_AUTO_APPROVE, ALIAS_MEMORY_MAX_LENGTH)
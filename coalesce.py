@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one computation.
+
+    The first caller starts the computation as its own task; callers that
+    arrive while it is running await the same task. Because the task is not
+    owned by any one caller, a disconnecting client does not cancel the work
+    for the others. The key is dropped as soon as the task finishes, so
+    later calls start fresh (and are served by the caches if possible).
+    """
+
+    def __init__(self) -> None:
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.stats: Dict[str, int] = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            self.stats["leaders"] += 1
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _t, k=key: self._forget(k, _t))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved; callers re-raise it themselves
+
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+
+class _Broadcast:
+    """Buffer of items produced by one async iterator, replayable by many readers."""
+
+    def __init__(self) -> None:
+        self.items: List[Any] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, item: Any) -> None:
+        async with self._changed:
+            self.items.append(item)
+            self._changed.notify_all()
+
+    async def finish(self, error: BaseException | None = None) -> None:
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    async def read(self) -> AsyncIterator[Any]:
+        pos = 0
+        while True:
+            async with self._changed:
+                while pos >= len(self.items) and not self.done:
+                    await self._changed.wait()
+                batch = self.items[pos:]
+                finished, error = self.done, self.error
+            for item in batch:
+                yield item
+            pos += len(batch)
+            if finished and pos >= len(self.items):
+                if error is not None:
+                    raise error
+                return
+
+
+class StreamFanout:
+    """
+    Single-flight for async iterators: concurrent subscribers with the same
+    key share one producer and each receive every item from the start.
+    """
+
+    def __init__(self) -> None:
+        self._streams: Dict[str, _Broadcast] = {}
+        self.stats: Dict[str, int] = {"leaders": 0, "coalesced": 0}
+
+    def subscribe(
+        self, key: str, factory: Callable[[], AsyncIterator[Any]]
+    ) -> AsyncIterator[Any]:
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self.stats["leaders"] += 1
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            task = asyncio.ensure_future(self._produce(key, broadcast, factory))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            self.stats["coalesced"] += 1
+        return broadcast.read()
+
+    async def _produce(
+        self,
+        key: str,
+        broadcast: _Broadcast,
+        factory: Callable[[], AsyncIterator[Any]],
+    ) -> None:
+        error: BaseException | None = None
+        try:
+            async for item in factory():
+                await broadcast.publish(item)
+        except Exception as e:
+            error = e
+        finally:
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+            await broadcast.finish(error)
+
+    def in_flight(self) -> int:
+        return len(self._streams)
@@ -0,0 +1,379 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Token budgets for the drug context injected into ask_glm prompts.
+# CONTEXT_TOKEN_BUDGET caps the whole block, CONTEXT_DRUG_TOKEN_BUDGET caps a
+# single drug; 0 disables a cap.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_DRUG_TOKEN_BUDGET = int(os.getenv("CONTEXT_DRUG_TOKEN_BUDGET", "2500"))
+
+# "retrieval": for a drug whose label does not fit its budget, inject only the
+# passages most relevant to the question (top CONTEXT_TOP_K, plus all boxed
+# warnings, contraindications and warnings); "budget": inject whole sections in
+# priority order until the budget is used up. Labels that fit are always whole.
+CONTEXT_MODE = os.getenv("CONTEXT_MODE", "retrieval").lower()
+CONTEXT_TOP_K = int(os.getenv("CONTEXT_TOP_K", "6"))
+
+# Use the offline per-language summaries from scripts/build_llm_snippets.py
+# when one exists for a record.
+CONTEXT_USE_SNIPPETS = os.getenv("CONTEXT_USE_SNIPPETS", "1").strip().lower() in ("1", "true", "yes", "on")
+
+# Changes whenever the rendered context would change for the same records;
+# part of the answer cache key.
+CONTEXT_SIGNATURE = (
+    f"v3;budget={CONTEXT_TOKEN_BUDGET};drug_budget={CONTEXT_DRUG_TOKEN_BUDGET};"
+    f"mode={CONTEXT_MODE};top_k={CONTEXT_TOP_K};snippets={int(CONTEXT_USE_SNIPPETS)}"
+)
+
+# Record fields a snippet is generated from; see record_content_hash.
+SNIPPET_SOURCE_FIELDS = (
+    "generic_name", "category", "indications", "contraindications",
+    "cautions", "age_note", "important_warnings",
+)
+
+# Section labels, and the order they are printed in.
+SECTION_LABELS = {
+    "zh": {
+        "summary": "摘要",
+        "boxed_warning": "黑框警示",
+        "indications": "适应证",
+        "contraindications": "禁忌",
+        "cautions": "慎用",
+        "warnings": "警示",
+        "age_note": "年龄相关",
+    },
+    "en": {
+        "summary": "Summary",
+        "boxed_warning": "Boxed warning",
+        "indications": "Indications",
+        "contraindications": "Contraindications",
+        "cautions": "Cautions",
+        "warnings": "Warnings",
+        "age_note": "Age note",
+    },
+}
+DISPLAY_ORDER = ["summary", "boxed_warning", "indications", "contraindications", "cautions", "warnings", "age_note"]
+
+# Which sections get budget first.
+PRIORITY_ORDER = ["summary", "boxed_warning", "contraindications", "indications", "warnings", "cautions", "age_note"]
+
+_CJK_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?;。！？；])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap tokenizer-free estimate: one token per CJK character and roughly
+    four characters per token for everything else.
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _truncate_to_tokens(text: str, tokens: int) -> str:
+    """Cut text to about `tokens` tokens, preferring a word boundary."""
+    if tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    space = cut.rfind(" ")
+    if space > lo // 2:
+        cut = cut[:space]
+    return cut.rstrip(" ,;") + "…"
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_SPLIT_RE.split(text or "") if s.strip()]
+
+
+def _sentence_key(sentence: str) -> str:
+    return " ".join(sentence.lower().split())
+
+
+def _as_list(value: Any) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [str(v) for v in value if v]
+    return [str(value)]
+
+
+def _record_sections(d: Dict[str, Any]) -> Dict[str, List[str]]:
+    """
+    Map a DB record onto context sections.
+
+    The converter copies `warnings` into `cautions`, and `important_warnings`
+    falls back to the same text when a label has no boxed warning. Only a
+    real boxed warning (text not already contained in cautions) is kept as
+    the high-priority "boxed_warning" section.
+    """
+    cautions = _as_list(d.get("cautions"))
+    important = _as_list(d.get("important_warnings"))
+    caution_text = " ".join(cautions)
+    is_fallback = bool(important) and all(w in caution_text for w in important)
+
+    return {
+        "boxed_warning": [] if is_fallback else important,
+        "indications": _as_list(d.get("indications")),
+        "contraindications": _as_list(d.get("contraindications")),
+        "cautions": cautions,
+        "warnings": important if is_fallback else [],
+        "age_note": _as_list(d.get("age_note")),
+    }
+
+
+def record_content_hash(d: Dict[str, Any]) -> str:
+    """
+    Hash of the fields a snippet summarizes. A snippet whose hash no longer
+    matches its record is stale and is not used.
+    """
+    payload = {k: d.get(k) for k in SNIPPET_SOURCE_FIELDS}
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+def snippet_for(d: Dict[str, Any], lang: str, snippets: Optional[Dict[str, Dict[str, Any]]]) -> str:
+    """The stored summary of a record in `lang`, or "" if missing or stale."""
+    if not snippets or not CONTEXT_USE_SNIPPETS:
+        return ""
+    entry = snippets.get(d.get("generic_name") or "")
+    if not entry or entry.get("hash") != record_content_hash(d):
+        return ""
+    return (entry.get("zh" if lang == "zh" else "en") or "").strip()
+
+
+def record_passages(d: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Sentence-level passages of a record, per section (passage index input)."""
+    return {
+        name: [s for item in items for s in split_sentences(item)]
+        for name, items in _record_sections(d).items()
+    }
+
+
+# Sections retrieval never cuts down.
+_ALWAYS_KEPT = ("boxed_warning", "contraindications", "warnings")
+
+
+def _retrieved_sections(
+    d: Dict[str, Any], full: Dict[str, Any], question: str, passage_index: Any, top_k: int
+) -> Optional[Dict[str, List[str]]]:
+    """
+    Sections restricted to the top_k passages relevant to the question, in
+    label order. Boxed warnings, contraindications and warnings are always
+    kept whole, since a question rarely shares words with the safety text
+    that should qualify the answer. `d` is the indexed record,
+    `full` the same record with its text fields loaded. Returns None when
+    nothing scores, so the caller falls back to the whole record.
+    """
+    hits = passage_index.search(question, d, top_k)
+    if not hits:
+        return None
+    sections: Dict[str, List[str]] = {name: [] for name in PRIORITY_ORDER}
+    for section, sentence in passage_index.passages_of(d, sorted(pid for pid, _ in hits), full):
+        sections[section].append(sentence)
+    whole = _record_sections(full)
+    for name in _ALWAYS_KEPT:
+        sections[name] = whole[name]
+    return sections
+
+
+def _dedup_sections(sections: Dict[str, List[str]], seen: set) -> Tuple[Dict[str, List[str]], int]:
+    """
+    Split sections into sentences and drop sentences already seen, walking
+    sections in priority order. Returns the sentences kept and the number of
+    tokens removed as duplicates.
+    """
+    result: Dict[str, List[str]] = {}
+    dropped = 0
+    for name in PRIORITY_ORDER:
+        kept: List[str] = []
+        for item in sections.get(name, []):
+            for sentence in split_sentences(item):
+                key = _sentence_key(sentence)
+                if key in seen:
+                    dropped += estimate_tokens(sentence)
+                    continue
+                seen.add(key)
+                kept.append(sentence)
+        result[name] = kept
+    return result, dropped
+
+
+def _fit_sections(
+    sentences: Dict[str, List[str]], budget: Optional[int]
+) -> Tuple[Dict[str, str], int]:
+    """
+    Fill `budget` tokens (None: no limit) with sections in priority order.
+    The first sentence that does not fit is truncated and the rest dropped.
+    """
+    fitted: Dict[str, str] = {}
+    remaining = budget
+    dropped = 0
+    for name in PRIORITY_ORDER:
+        kept: List[str] = []
+        for sentence in sentences.get(name, []):
+            cost = estimate_tokens(sentence) + 1
+            if remaining is None or cost <= remaining:
+                kept.append(sentence)
+                if remaining is not None:
+                    remaining -= cost
+                continue
+            partial = _truncate_to_tokens(sentence, remaining - 1) if remaining > 8 else ""
+            if partial:
+                kept.append(partial)
+                dropped += cost - estimate_tokens(partial) - 1
+                remaining = 0
+            else:
+                dropped += cost
+        if kept:
+            fitted[name] = " ".join(kept)
+    return fitted, dropped
+
+
+def _header_lines(idx: int, d: Dict[str, Any], lang: str) -> List[str]:
+    name = d.get("generic_name", "")
+    aliases = ", ".join(d.get("aliases", []))
+    category = d.get("category", "")
+    if lang == "zh":
+        return [f"{idx}. 通用名: {name}", f"   别名: {aliases}", f"   类别: {category}"]
+    return [f"{idx}. Generic name: {name}", f"   Aliases: {aliases}", f"   Category: {category}"]
+
+
+def _allocate(needs: List[int], total: Optional[int], per_drug: Optional[int]) -> List[Optional[int]]:
+    """
+    Split the request budget across drugs: drugs that need less than an even
+    share leave the rest to the others (water-filling), each capped at
+    per_drug. None means no limit.
+    """
+    if total is None and per_drug is None:
+        return [None] * len(needs)
+    caps = [min(n, per_drug) if per_drug is not None else n for n in needs]
+    if total is None:
+        return list(caps)
+    alloc: List[Optional[int]] = [0] * len(caps)
+    remaining = total
+    order = sorted(range(len(caps)), key=lambda i: caps[i])
+    for pos, i in enumerate(order):
+        share = remaining // (len(order) - pos)
+        alloc[i] = min(caps[i], share)
+        remaining -= alloc[i]
+    return alloc
+
+
+def build_drug_context(
+    drug_infos: List[Dict[str, Any]],
+    lang: str,
+    request_budget: int = CONTEXT_TOKEN_BUDGET,
+    drug_budget: int = CONTEXT_DRUG_TOKEN_BUDGET,
+    question: Optional[str] = None,
+    passage_index: Any = None,
+    top_k: int = CONTEXT_TOP_K,
+    snippets: Optional[Dict[str, Dict[str, Any]]] = None,
+    hydrate: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+) -> Tuple[str, Dict[str, int]]:
+    """
+    Render matched drug records into the prompt context under a token budget.
+
+    A record with an up-to-date offline snippet in `lang` is rendered as that
+    summary alone. Otherwise, with a question and a passage index (and
+    CONTEXT_MODE=retrieval), a drug whose label text exceeds its budget
+    (drug_budget, or request_budget without one) contributes only its top_k
+    passages for the question plus its safety sections; drugs that fit, or
+    with no relevant passage, keep their whole record. Sections are split into
+    sentences and deduplicated (across sections and drugs), then filled in
+    priority order: boxed warnings, contraindications, indications, warnings,
+    cautions, age notes. Returns the text and a report with "tokens_used",
+    "tokens_dropped" (cut by the budget or left out by retrieval),
+    "tokens_deduplicated", "drugs_retrieved" and "drugs_summarized".
+
+    `hydrate` maps a record to the version with its label text loaded (for
+    DBs that keep text fields on disk); records themselves are what the
+    passage index is keyed on.
+    """
+    report = {
+        "tokens_used": 0,
+        "tokens_dropped": 0,
+        "tokens_deduplicated": 0,
+        "drugs_retrieved": 0,
+        "drugs_summarized": 0,
+    }
+    if not drug_infos:
+        text = (
+            "No drug information in local database."
+            if lang == "en"
+            else "未找到相关药物的本地数据库信息。"
+        )
+        report["tokens_used"] = estimate_tokens(text)
+        return text, report
+
+    labels = SECTION_LABELS["zh" if lang == "zh" else "en"]
+    retrieve = (
+        CONTEXT_MODE == "retrieval" and bool(question) and passage_index is not None and top_k > 0
+    )
+    seen: set = set()
+    prepared = []
+    for idx, d in enumerate(drug_infos, start=1):
+        full = hydrate(d) if hydrate is not None else d
+        header = _header_lines(idx, full, lang)
+        sections = _record_sections(full)
+        snippet = snippet_for(full, lang, snippets)
+        if snippet:
+            report["drugs_summarized"] += 1
+            sentences = {"summary": [snippet]}
+            header_tokens = sum(estimate_tokens(line) for line in header)
+            prepared.append((header, header_tokens, sentences, estimate_tokens(snippet) + 1))
+            continue
+        header_tokens = sum(estimate_tokens(line) for line in header)
+        limit = drug_budget if drug_budget > 0 else request_budget
+        whole_tokens = sum(estimate_tokens(s) + 1 for items in sections.values() for s in items)
+        if retrieve and limit > 0 and whole_tokens > limit - header_tokens and passage_index.has_record(d):
+            retrieved = _retrieved_sections(d, full, question, passage_index, top_k)
+            if retrieved is not None:
+                report["drugs_retrieved"] += 1
+                report["tokens_dropped"] += max(
+                    sum(estimate_tokens(s) for items in sections.values() for s in items)
+                    - sum(estimate_tokens(s) for items in retrieved.values() for s in items),
+                    0,
+                )
+                sections = retrieved
+        sentences, deduped = _dedup_sections(sections, seen)
+        report["tokens_deduplicated"] += deduped
+        body_tokens = sum(estimate_tokens(s) + 1 for ss in sentences.values() for s in ss)
+        prepared.append((header, header_tokens, sentences, body_tokens))
+
+    # Headers (name, aliases, category) are always kept; budgets apply to
+    # the label text below them.
+    header_total = sum(p[1] for p in prepared)
+    body_budget = max(request_budget - header_total, 0) if request_budget > 0 else None
+    drug_body_budget = max(drug_budget - max(p[1] for p in prepared), 0) if drug_budget > 0 else None
+    allocations = _allocate([p[3] for p in prepared], body_budget, drug_body_budget)
+
+    blocks = []
+    for (header, _, sentences, _), allocation in zip(prepared, allocations):
+        fitted, dropped = _fit_sections(sentences, allocation)
+        report["tokens_dropped"] += dropped
+
+        lines = list(header)
+        for name in DISPLAY_ORDER:
+            if fitted.get(name):
+                lines.append(f"   {labels[name]}: {fitted[name]}")
+        blocks.append("\n".join(lines))
+
+    text = "\n\n".join(blocks)
+    report["tokens_used"] = estimate_tokens(text)
+    return text, report
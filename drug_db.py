@@ -1,13 +1,44 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import mmap
 import os
+import pickle
 import re
+import sqlite3
+import struct
+import threading
+import time
 from typing import List, Dict, Any, Optional, Tuple
 
+from alias_memory import ALIAS_MEMORY
+from drug_context import record_passages
+from drug_names import (
+    ALIASES_PATH,
+    LOOKUP_TIERS,
+    alias_names,
+    fold_variants,
+    index_names,
+    load_aliases,
+    lookup_key as _lookup_key,
+    lookup_keys,
+    normalize_name as _normalize_name,
+    resolve_key,
+    surface_names,
+    synonym_keys,
+)
+from fuzzy_index import FuzzyNameIndex, fold
+from metrics import timed
+from name_matcher import NameAutomaton
+from passage_index import QUERY_EXPANSIONS, STOPWORDS, PassageIndex
+from record_store import RecordStore, file_info, split_record, write_record_file
+from sqlite_store import SQLiteDrugDB
+
 # Project root and default OTC database path
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 OTC_DB_PATH = os.path.join(BASE_DIR, "data", "otc_db.json")
+SNIPPETS_PATH = os.path.join(BASE_DIR, "data", "otc_db_snippets.json")
 
 
 # ---------------------------------------------------------------------------
@@ -31,25 +62,18 @@ def load_otc_db() -> List[Dict[str, Any]]:
     return data
 
 
-OTC_DB: List[Dict[str, Any]] = load_otc_db()
-
-
-def _normalize_name(name: str) -> str:
-    """标准化名称：支持中文映射"""
-    if not name: return ""
-    
-    mapping = {
-        "维c": "vitamin c",
-        "维生素c": "vitamin c",
-        "维他命c": "vitamin c",
-        "布洛芬": "ibuprofen",
-        "对乙酰氨基酚": "acetaminophen",
-        "阿司匹林": "aspirin"
-    }
-    
-    n = name.strip().lower()
-
-    return mapping.get(n, n)
+def load_snippets() -> Dict[str, Dict[str, Any]]:
+    """
+    Load the offline bilingual summaries built by scripts/build_llm_snippets.py
+    (generic_name -> {"hash", "en", "zh", ...}). The file is optional.
+    """
+    if not os.path.exists(SNIPPETS_PATH):
+        return {}
+    with open(SNIPPETS_PATH, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("Snippets file must be a dict keyed by generic_name.")
+    return data
 
 
 def _build_name_index(
@@ -66,75 +90,562 @@ def _build_name_index(
     index: List[Tuple[str, Dict[str, Any]]] = []
 
     for entry in db:
-        base_name = _normalize_name(entry.get("base_name", ""))
-        generic_name = _normalize_name(entry.get("generic_name", ""))
+        for n in index_names(entry):
+            index.append((n, entry))
 
-        names = []
-        if generic_name:
-            names.append(generic_name)
-        if base_name and base_name != generic_name:
-            names.append(base_name)
+    return index
 
-        aliases = entry.get("aliases") or []
-        for alias in aliases:
-            if isinstance(alias, str):
-                n = _normalize_name(alias)
-                if n:
-                    names.append(n)
-
-        # de-duplicate
-        seen = set()
-        unique_names = []
-        for n in names:
-            if n not in seen:
-                seen.add(n)
-                unique_names.append(n)
-
-        for n in unique_names:
-            index.append((n, entry))
+
+def _build_name_automaton(
+    db: List[Dict[str, Any]],
+    name_index: List[Tuple[str, Dict[str, Any]]],
+) -> NameAutomaton:
+    """
+    Compile NAME_INDEX into a single automaton. Payloads are positions in db
+    so that matches can be reported in DB order.
+    """
+    position = {id(entry): i for i, entry in enumerate(db)}
+    return NameAutomaton(
+        ((name, position[id(entry)]) for name, entry in name_index),
+        min_length=2,
+    )
+
+
+def _build_lookup_index(
+    db: List[Dict[str, Any]]
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Build the exact-match tiers used by find_by_generic_name (see
+    drug_names.lookup_keys). The first record in DB order wins for a given
+    key in each tier.
+    """
+    index: Dict[str, Dict[str, Dict[str, Any]]] = {tier: {} for tier in LOOKUP_TIERS}
+
+    for entry in db:
+        for tier, key in lookup_keys(entry):
+            index[tier].setdefault(key, entry)
 
     return index
 
 
-NAME_INDEX: List[Tuple[str, Dict[str, Any]]] = _build_name_index(OTC_DB)
+def _lookup_key_in(
+    lookup_index: Dict[str, Dict[str, Dict[str, Any]]], key: str
+) -> Optional[Dict[str, Any]]:
+    for tier in LOOKUP_TIERS:
+        drug = lookup_index[tier].get(key)
+        if drug is not None:
+            return drug
+    return None
 
 
-# ---------------------------------------------------------------------------
-# Matching helpers
-# ---------------------------------------------------------------------------
+def _lookup_in(
+    lookup_index: Dict[str, Dict[str, Dict[str, Any]]], name: str
+) -> Optional[Dict[str, Any]]:
+    """Resolve a name against the exact-match tiers (alias table applied first)."""
+    key = resolve_key(name)
+    if not key:
+        return None
+
+    return _lookup_key_in(lookup_index, key)
 
-def _build_word_boundary_pattern(name: str) -> re.Pattern:
+
+def _local_target(
+    lookup_index: Dict[str, Dict[str, Dict[str, Any]]], shared_keys: set, key: str
+) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    (record, ambiguous) a resolved lookup key points to. A key that is not
+    an exact generic_name but is shared as alias/base_name by records with
+    different generic names (e.g. a drug class) is ambiguous.
+    """
+    drug = _lookup_key_in(lookup_index, key) if key else None
+    ambiguous = drug is not None and key not in lookup_index["generic"] and key in shared_keys
+    return drug, ambiguous
+
+
+def _build_local_matcher(
+    db: List[Dict[str, Any]],
+    lookup_index: Dict[str, Dict[str, Dict[str, Any]]],
+) -> Tuple[NameAutomaton, List[Tuple[Optional[Dict[str, Any]], bool]], set]:
+    """
+    Build the dictionary matcher used by find_local_mentions.
+
+    Unlike NAME_AUTOMATON it keeps the surface forms (generic names, full
+    base names and aliases) and relaxes word boundaries for Chinese names.
+    Returns the automaton, the (record, ambiguous) target of every name id
+    before the alias table is applied, and the keys shared by records with
+    different generic names. Names of the alias table are matched by a
+    separate automaton (see DrugDBSnapshot.bind_aliases), so the pickled
+    snapshot does not depend on them.
     """
-    Build a regex that matches the name as a whole word or token.
+    owners: Dict[str, set] = {}
+    pairs: List[Tuple[str, str]] = []
 
-    This is a simple heuristic:
-      - Case-insensitive
-      - Allows punctuation / whitespace around the name
+    for entry in db:
+        generic_key = _lookup_key(entry.get("generic_name") or "")
+        for n, key in surface_names(entry):
+            owners.setdefault(key, set()).add(generic_key)
+            pairs.append((n, n))
+
+    automaton = NameAutomaton(pairs, min_length=2, cjk_loose=True)
+    shared_keys = {key for key, generics in owners.items() if len(generics) > 1}
+    targets = [
+        _local_target(lookup_index, shared_keys, _lookup_key(automaton.payloads[pid][0]))
+        for pid in range(len(automaton))
+    ]
+    return automaton, targets, shared_keys
+
+
+def _build_fuzzy_index(
+    local_matcher: NameAutomaton,
+    local_targets: List[Tuple[Optional[Dict[str, Any]], bool]],
+) -> FuzzyNameIndex:
+    """
+    Build the typo-tolerant index used by find_by_fuzzy_name and
+    find_local_mentions over the local matcher's names that resolve to a
+    record. Payloads are local matcher name ids, so a fuzzy hit resolves
+    (and is ambiguous) exactly like a dictionary hit on the same name.
     """
-    escaped = re.escape(name)
-    pattern = rf"(?<!\w){escaped}(?!\w)"
-    return re.compile(pattern, flags=re.IGNORECASE)
+    return FuzzyNameIndex(
+        (name, pid)
+        for pid, name in enumerate(local_matcher.names)
+        if local_targets[pid][0] is not None
+    )
 
 
-def _match_single_name_in_text(text: str, name: str) -> bool:
+# ---------------------------------------------------------------------------
+# Snapshot: records plus every derived index
+# ---------------------------------------------------------------------------
+
+# "memory": whole records stay resident. "lazy": records keep only names,
+# aliases and category in memory; label text (record_store.HEAVY_FIELDS) is
+# read on demand from DRUG_DB_RECORDS_PATH, a memory-mapped file written
+# next to the DB, with the DRUG_DB_RECORD_CACHE most recent records decoded.
+DRUG_DB_STORAGE = os.getenv("DRUG_DB_STORAGE", "memory").lower()
+RECORDS_PATH = os.getenv(
+    "DRUG_DB_RECORDS_PATH", os.path.join(BASE_DIR, "data", "otc_db.records.bin")
+)
+RECORD_CACHE_SIZE = int(os.getenv("DRUG_DB_RECORD_CACHE", "64"))
+
+# "json": otc_db.json (or its snapshot) with in-memory indexes. "sqlite":
+# the read-only store at DRUG_DB_SQLITE_PATH, built by
+# scripts/convert_openfda_raw_to_structured.py --sqlite (see sqlite_store);
+# falls back to the JSON when the file is missing or unreadable.
+DRUG_DB_BACKEND = os.getenv("DRUG_DB_BACKEND", "json").lower()
+SQLITE_PATH = os.getenv("DRUG_DB_SQLITE_PATH", os.path.join(BASE_DIR, "data", "otc_db.sqlite"))
+
+# Typo-tolerant fallback ("ibuprofin" -> IBUPROFEN) after the exact lookup
+# and dictionary matcher. A candidate within DRUG_DB_FUZZY_MAX_DISTANCE
+# edits is accepted when its similarity (1 - distance / length) is at least
+# DRUG_DB_FUZZY_ACCEPT; set it above 1 to disable. Names shorter than
+# DRUG_DB_FUZZY_MIN_LENGTH are not corrected, since a typo in a short word
+# is as likely to be another word.
+FUZZY_MAX_DISTANCE = int(os.getenv("DRUG_DB_FUZZY_MAX_DISTANCE", "2"))
+FUZZY_ACCEPT = float(os.getenv("DRUG_DB_FUZZY_ACCEPT", "0.85"))
+FUZZY_MIN_LENGTH = int(os.getenv("DRUG_DB_FUZZY_MIN_LENGTH", "5"))
+
+
+class DrugDBSnapshot:
+    """
+    The records of otc_db.json together with the indexes built from them:
+    NAME_INDEX, NAME_AUTOMATON, LOOKUP_INDEX, the local matcher and the
+    passage index (sentence-level BM25 over label text, used by the context
+    builder to inject only passages relevant to the question).
+
+    Indexes hold references to the record dicts, so a pickled snapshot
+    restores the same sharing without rebuilding anything. With lazy
+    storage the records are the light versions and `store` reads the rest;
+    use full_record to get a record with its label text.
     """
-    Return True if the given name appears in text with loose word boundaries.
 
-    For English this helps avoid matching 'tan' inside 'tangent'.
-    For Chinese this still behaves nicely because there is no word boundary.
+    def __init__(self, db: List[Dict[str, Any]], source: Dict[str, Any], storage: str = "memory"):
+        full_db = db
+        self.store: Optional[RecordStore] = None
+        if storage == "lazy":
+            offsets = write_record_file(RECORDS_PATH, full_db)
+            self.store = RecordStore(RECORDS_PATH, offsets, cache_size=RECORD_CACHE_SIZE)
+            db = [split_record(entry) for entry in full_db]
+
+        self.db = db
+        self.source = source
+        self.storage = storage
+        self.name_index = _build_name_index(db)
+        self.name_automaton = _build_name_automaton(db, self.name_index)
+        self.lookup_index = _build_lookup_index(db)
+        self.local_matcher, self.base_targets, self.shared_keys = _build_local_matcher(db, self.lookup_index)
+        self.fuzzy_index = _build_fuzzy_index(self.local_matcher, self.base_targets)
+        self._index_name_keys()
+        self.passage_index = PassageIndex(
+            db, record_passages, keep_text=self.store is None, sources=full_db
+        )
+        self._index_positions()
+        self.bind_aliases()
+        # Filled in by load_drug_db
+        self.snippets: Dict[str, Dict[str, Any]] = {}
+        self.watched: Tuple[Any, ...] = ()
+        self.loaded_from = "json"
+        self.load_seconds = 0.0
+        self.loaded_at = 0.0
+        self.generation = 0
+
+    @property
+    def version(self) -> str:
+        """Identifies the otc_db.json (size, mtime) and storage this was built from."""
+        raw = json.dumps([self.source, self.storage], sort_keys=True).encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()[:12]
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "generation": self.generation,
+            "records": len(self),
+            "snippets": len(self.snippets),
+            "storage": self.storage,
+            "loaded_from": self.loaded_from,
+            "load_seconds": self.load_seconds,
+            "loaded_at": self.loaded_at,
+        }
+
+    def _index_positions(self) -> None:
+        # Keyed by identity like PassageIndex; rebuilt after unpickling.
+        self.positions: Dict[int, int] = {id(entry): i for i, entry in enumerate(self.db)}
+
+    def _index_name_keys(self) -> None:
+        # lookup_key -> local matcher name ids, to re-resolve the names the
+        # alias table redirects.
+        self.pids_by_key: Dict[str, List[int]] = {}
+        for pid, payload in enumerate(self.local_matcher.payloads):
+            self.pids_by_key.setdefault(_lookup_key(payload[0]), []).append(pid)
+
+    def bind_aliases(self) -> None:
+        """
+        Apply the current alias table (drug_names): re-resolve the local
+        matcher names it redirects and build the automaton over its own
+        names. Runs on every build and unpickle, after load_aliases, and is
+        not part of the pickle.
+        """
+        targets = list(self.base_targets)
+        for alias_key, target_key in synonym_keys().items():
+            for pid in self.pids_by_key.get(alias_key, ()):
+                targets[pid] = _local_target(self.lookup_index, self.shared_keys, target_key)
+        self.local_targets = targets
+        self.alias_matcher = NameAutomaton(
+            ((name, name) for name in alias_names()), min_length=2, cjk_loose=True
+        )
+        self.alias_targets = [
+            _local_target(self.lookup_index, self.shared_keys, resolve_key(payload[0]))
+            for payload in self.alias_matcher.payloads
+        ]
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__)
+        for name in ("positions", "local_targets", "alias_matcher", "alias_targets"):
+            del state[name]
+        state["snippets"] = {}
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._index_positions()
+        self.bind_aliases()
+
+    def __len__(self) -> int:
+        return len(self.db)
+
+    def full_record(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """`entry` with its label text fields (itself unless storage is lazy)."""
+        if self.store is None:
+            return entry
+        pos = self.positions.get(id(entry))
+        if pos is None:
+            return entry
+        return self.store.hydrate(pos, entry)
+
+    # Queries behind the public functions below; sqlite_store.SQLiteDrugDB
+    # implements the same five.
+
+    def lookup(self, name: str) -> Optional[Dict[str, Any]]:
+        return _lookup_in(self.lookup_index, name)
+
+    def drugs_in_text(self, text: str) -> List[Dict[str, Any]]:
+        positions = set()
+        for pid in self.name_automaton.matched_ids(text):
+            positions.update(self.name_automaton.payloads[pid])
+        return [self.db[i] for i in sorted(positions)]
+
+    def preps_by_name(self, name_norm: str) -> List[Dict[str, Any]]:
+        matches: List[Dict[str, Any]] = []
+        for entry in self.db:
+            g = _normalize_name(entry.get("generic_name", ""))
+            if g == name_norm:
+                matches.append(entry)
+                continue
+
+            aliases = entry.get("aliases") or []
+            for alias in aliases:
+                if isinstance(alias, str) and _normalize_name(alias) == name_norm:
+                    matches.append(entry)
+                    break
+
+        return matches
+
+    def local_hits(self, text: str) -> List[Tuple[int, int, Optional[Dict[str, Any]], bool]]:
+        """
+        Longest non-overlapping (start, end, record, ambiguous) hits of the
+        record names and the alias table, leftmost first; a record name wins
+        over an alias on the same span.
+        """
+        hits = [(start, end, self.local_targets[pid]) for start, end, pid in self.local_matcher.iter_matches(text)]
+        hits.extend((start, end, self.alias_targets[pid]) for start, end, pid in self.alias_matcher.iter_matches(text))
+        hits.sort(key=lambda h: (h[0], -h[1]))
+        result: List[Tuple[int, int, Optional[Dict[str, Any]], bool]] = []
+        last_end = -1
+        for start, end, target in hits:
+            if start >= last_end:
+                result.append((start, end, *target))
+                last_end = end
+        return result
+
+    def similar(
+        self, name: str, limit: int, max_distance: int, nearest: bool = False
+    ) -> List[Tuple[str, int, float, Optional[Dict[str, Any]], bool]]:
+        """
+        Fuzzy (name, distance, similarity, record, ambiguous) candidates,
+        closest first (see FuzzyNameIndex.search).
+        """
+        index = self.fuzzy_index
+        return [
+            (index.names[nid], dist, sim, *self.local_targets[index.payloads[nid][0]])
+            for nid, dist, sim in index.search(name, limit, max_distance, nearest)
+        ]
+
+
+# Binary snapshot written by scripts/build_db_snapshot.py. Set
+# DRUG_DB_SNAPSHOT_PATH to an empty string to always load the JSON.
+SNAPSHOT_PATH = os.getenv(
+    "DRUG_DB_SNAPSHOT_PATH", os.path.join(BASE_DIR, "data", "otc_db.snapshot.bin")
+)
+SNAPSHOT_MAGIC = b"HIHDB\x01"
+SNAPSHOT_FORMAT = 2
+
+# Modules whose code shapes the pickled indexes; editing any of them makes
+# existing snapshots stale.
+_SNAPSHOT_CODE = (
+    "drug_db.py", "drug_context.py", "drug_names.py", "fuzzy_index.py", "name_matcher.py",
+    "passage_index.py", "record_store.py",
+)
+
+_source_info = file_info
+
+
+def _code_fingerprint() -> str:
+    h = hashlib.sha256()
+    for name in _SNAPSHOT_CODE:
+        with open(os.path.join(BASE_DIR, name), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def _load_alias_table() -> None:
+    """Install data/aliases_zh.json plus the approved learned aliases."""
+    load_aliases(learned=ALIAS_MEMORY.approved())
+
+
+def _snapshot_header(source: Dict[str, Any], records: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "code": _code_fingerprint(),
+        "source": source,
+        "storage": DRUG_DB_STORAGE,
+        "records": records,
+    }
+
+
+def _records_info() -> Optional[Dict[str, Any]]:
+    """Identity of the records file a lazy snapshot must be paired with."""
+    if DRUG_DB_STORAGE != "lazy":
+        return None
+    return _source_info(RECORDS_PATH) if os.path.exists(RECORDS_PATH) else {}
+
+
+def write_snapshot(path: str = SNAPSHOT_PATH) -> DrugDBSnapshot:
     """
-    if not name or len(name) < 2:
-        return False
+    Build a snapshot from otc_db.json and write it as
+    magic | header length (4 bytes) | JSON header | pickle.
+    The header (format, code fingerprint, source size/mtime, storage mode
+    and, for lazy storage, the records file written alongside) is checked
+    before anything is unpickled. The alias table is not part of it: alias
+    names are bound when a snapshot is loaded (DrugDBSnapshot.bind_aliases).
+    """
+    _load_alias_table()
+    source = _source_info(OTC_DB_PATH)
+    snapshot = DrugDBSnapshot(load_otc_db(), source, DRUG_DB_STORAGE)
+    records = snapshot.store.source if snapshot.store is not None else None
+    header = json.dumps(_snapshot_header(source, records)).encode("utf-8")
+    payload = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp, path)
+    return snapshot
+
+
+def _read_snapshot(path: str) -> Optional[DrugDBSnapshot]:
+    """The snapshot at path, or None if it is missing, stale or unreadable."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                if bytes(view[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+                    return None
+                start = len(SNAPSHOT_MAGIC)
+                (header_len,) = struct.unpack_from("<I", view, start)
+                start += 4
+                header = json.loads(bytes(view[start:start + header_len]))
+                if header != _snapshot_header(_source_info(OTC_DB_PATH), _records_info()):
+                    print(f"[!] 药物库快照已过期，改为加载 JSON: {path}")
+                    return None
+                return pickle.loads(view[start + header_len:])
+            finally:
+                view.release()
+    except (OSError, ValueError, struct.error, pickle.UnpicklingError, EOFError) as e:
+        print(f"[!] 无法读取药物库快照 {path}: {e}")
+        return None
 
-    pattern = _build_word_boundary_pattern(name)
-    return bool(pattern.search(text))
+
+def _watch_state() -> Tuple[Any, ...]:
+    """What reload() compares to decide whether the files on disk changed."""
+    def info(path: str) -> Optional[Dict[str, Any]]:
+        return _source_info(path) if os.path.exists(path) else None
+
+    sqlite = info(SQLITE_PATH) if DRUG_DB_BACKEND == "sqlite" else None
+    return (info(OTC_DB_PATH), info(SNIPPETS_PATH), info(ALIASES_PATH), ALIAS_MEMORY.revision(), sqlite)
+
+
+def _open_sqlite(path: str) -> Optional[SQLiteDrugDB]:
+    """The SQLite store at path, or None (with a warning) if it cannot be used."""
+    if not os.path.exists(path):
+        print(f"[!] 未找到 SQLite 药物库 {path}，改为加载 JSON")
+        return None
+    try:
+        return SQLiteDrugDB(path, cache_size=max(RECORD_CACHE_SIZE, 256))
+    except (sqlite3.Error, ValueError, KeyError) as e:
+        print(f"[!] 无法打开 SQLite 药物库 {path}，改为加载 JSON: {e}")
+        return None
+
+
+def load_drug_db() -> DrugDBSnapshot:
+    """
+    Open the SQLite store (DRUG_DB_BACKEND=sqlite), or load the snapshot if
+    it is current, otherwise parse otc_db.json and build indexes. The result
+    may be a sqlite_store.SQLiteDrugDB, which has the same query interface.
+    """
+    start = time.perf_counter()
+    watched = _watch_state()
+    # Query-time name resolution uses the alias table too, so it is loaded
+    # even when the indexes come from the snapshot or SQLite.
+    _load_alias_table()
+    snapshot = _open_sqlite(SQLITE_PATH) if DRUG_DB_BACKEND == "sqlite" else None
+    if snapshot is None:
+        snapshot = _read_snapshot(SNAPSHOT_PATH)
+        if snapshot is not None:
+            snapshot.loaded_from = "snapshot"
+        else:
+            snapshot = DrugDBSnapshot(load_otc_db(), _source_info(OTC_DB_PATH), DRUG_DB_STORAGE)
+            snapshot.loaded_from = "json"
+    if snapshot.store is not None:
+        # Map the records file now: a later reload may replace it on disk
+        # while requests still read this snapshot.
+        snapshot.store.open()
+    snapshot.snippets = load_snippets()
+    snapshot.watched = watched
+    snapshot.load_seconds = time.perf_counter() - start
+    snapshot.loaded_at = time.time()
+    return snapshot
+
+
+# The active DB. Readers take one reference (db = CURRENT) and use it for
+# the whole request; reload() builds a new snapshot and swaps it in with a
+# single assignment, so in-flight requests finish on the one they started
+# with. The module globals below mirror CURRENT for older callers.
+CURRENT: DrugDBSnapshot
+OTC_DB: List[Dict[str, Any]]
+NAME_INDEX: List[Tuple[str, Dict[str, Any]]]
+NAME_AUTOMATON: NameAutomaton
+LOOKUP_INDEX: Dict[str, Dict[str, Dict[str, Any]]]
+LOCAL_MATCHER: NameAutomaton
+LOCAL_TARGETS: List[Tuple[Optional[Dict[str, Any]], bool]]
+PASSAGE_INDEX: PassageIndex
+SNIPPETS: Dict[str, Dict[str, Any]]
+
+_RELOAD_LOCK = threading.Lock()
+
+
+def _install(snapshot: DrugDBSnapshot) -> None:
+    global CURRENT, OTC_DB, NAME_INDEX, NAME_AUTOMATON, LOOKUP_INDEX
+    global LOCAL_MATCHER, LOCAL_TARGETS, PASSAGE_INDEX, SNIPPETS
+    # The SQLite store has no in-memory record list or indexes; the legacy
+    # globals are then empty and only the query functions work.
+    OTC_DB = getattr(snapshot, "db", [])
+    NAME_INDEX = getattr(snapshot, "name_index", [])
+    NAME_AUTOMATON = getattr(snapshot, "name_automaton", None)
+    LOOKUP_INDEX = getattr(snapshot, "lookup_index", {tier: {} for tier in LOOKUP_TIERS})
+    LOCAL_MATCHER = getattr(snapshot, "local_matcher", None)
+    LOCAL_TARGETS = getattr(snapshot, "local_targets", [])
+    PASSAGE_INDEX = snapshot.passage_index
+    SNIPPETS = snapshot.snippets
+    CURRENT = snapshot
+
+
+def reload(force: bool = False) -> bool:
+    """
+    Load otc_db.json (via the snapshot when current), the snippets and the
+    alias table again if any of them changed on disk or an alias was approved
+    or withdrawn (alias_memory), or always with force, and make the result
+    CURRENT. Everything is built before the swap, off the request path when
+    called from a thread. Returns True if a new DB was installed; on a load
+    error the old DB stays active and the error is raised.
+    """
+    with _RELOAD_LOCK:
+        if not force and _watch_state() == CURRENT.watched:
+            return False
+        snapshot = load_drug_db()
+        snapshot.generation = CURRENT.generation + 1
+        _install(snapshot)
+    print(
+        f"[*] 药物库已重新加载: 版本={snapshot.version}, {len(snapshot)} 条记录, "
+        f"来源={snapshot.loaded_from}, 耗时 {snapshot.load_seconds * 1000:.1f} ms"
+    )
+    return True
+
+
+_install(load_drug_db())
+print(
+    f"[*] 药物库已加载: {len(CURRENT)} 条记录, 来源={CURRENT.loaded_from}, "
+    f"存储={CURRENT.storage}, 耗时 {CURRENT.load_seconds * 1000:.1f} ms"
+)
+
+
+def full_record(entry: Dict[str, Any], db: Optional[DrugDBSnapshot] = None) -> Dict[str, Any]:
+    """
+    The DB record with its label text fields. Records returned by the
+    lookup functions carry only names, aliases and category when
+    DRUG_DB_STORAGE=lazy; pass them through this (with the snapshot they
+    came from) before reading label text.
+    """
+    return (db or CURRENT).full_record(entry)
 
 
 # ---------------------------------------------------------------------------
 # Public query functions
 # ---------------------------------------------------------------------------
 
-def find_drugs_in_text_raw(text: str) -> List[Dict[str, Any]]:
+def find_drugs_in_text_raw(text: str, db: Optional[DrugDBSnapshot] = None) -> List[Dict[str, Any]]:
     """
     Find all preparations mentioned in the text.
 
@@ -144,17 +655,7 @@ def find_drugs_in_text_raw(text: str) -> List[Dict[str, Any]]:
     if not text.strip():
         return []
 
-    matched: List[Dict[str, Any]] = []
-    seen_ids = set()
-
-    for name, entry in NAME_INDEX:
-        if id(entry) in seen_ids:
-            continue
-        if _match_single_name_in_text(text, name):
-            matched.append(entry)
-            seen_ids.add(id(entry))
-
-    return matched
+    return (db or CURRENT).drugs_in_text(fold_variants(text))
 
 
 def group_by_base(preps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -209,7 +710,7 @@ def group_by_base(preps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return result
 
 
-def find_drugs_in_text(text: str) -> List[Dict[str, Any]]:
+def find_drugs_in_text(text: str, db: Optional[DrugDBSnapshot] = None) -> List[Dict[str, Any]]:
     """
     High-level API for the LLM:
 
@@ -219,11 +720,11 @@ def find_drugs_in_text(text: str) -> List[Dict[str, Any]]:
 
     The returned structure is designed to be passed directly to the LLM.
     """
-    raw_matches = find_drugs_in_text_raw(text)
+    raw_matches = find_drugs_in_text_raw(text, db)
     return group_by_base(raw_matches)
 
 
-def find_preps_by_generic_name(name: str) -> List[Dict[str, Any]]:
+def find_preps_by_generic_name(name: str, db: Optional[DrugDBSnapshot] = None) -> List[Dict[str, Any]]:
     """
     Find all preparations whose generic_name or alias matches the given name.
     """
@@ -231,49 +732,242 @@ def find_preps_by_generic_name(name: str) -> List[Dict[str, Any]]:
     if not name_norm:
         return []
 
-    matches: List[Dict[str, Any]] = []
-    for entry in OTC_DB:
-        g = _normalize_name(entry.get("generic_name", ""))
-        if g == name_norm:
-            matches.append(entry)
-            continue
-
-        aliases = entry.get("aliases") or []
-        for alias in aliases:
-            if isinstance(alias, str) and _normalize_name(alias) == name_norm:
-                matches.append(entry)
-                break
+    return (db or CURRENT).preps_by_name(name_norm)
 
-    return matches
 
+@timed("lookup")
+def find_by_generic_name(name: str, db: Optional[DrugDBSnapshot] = None):
+    """
+    Resolve a single (usually LLM-normalized) drug name to one DB record.
 
-def find_by_generic_name(name: str):
+    Uses LOOKUP_INDEX, so the cost does not depend on the DB size. Priority:
+    an exact generic_name match wins over an alias match, which wins over a
+    base_name match; within a tier the earliest record in the DB wins.
+    """
     if not name:
         return None
 
-    SYNONYMS = {
-        "维C": "VITAMIN C",
-        "维生素C": "VITAMIN C",
-        "维他命C": "VITAMIN C",
-        "ASCORBIC ACID": "VITAMIN C",
-        "布洛芬": "IBUPROFEN",
-        "对乙酰氨基酚": "ACETAMINOPHEN",
-        "阿司匹林": "ASPIRIN"
-    }
+    return (db or CURRENT).lookup(name)
 
-    raw_name = name.strip()
 
-    search_name = SYNONYMS.get(raw_name, SYNONYMS.get(raw_name.upper(), raw_name.upper()))
+def _fuzzy_match(
+    name: str, db: DrugDBSnapshot
+) -> Tuple[Optional[Dict[str, Any]], bool, Optional[Tuple[str, int, float]]]:
+    """
+    (record, ambiguous, (matched name, distance, similarity)) for the
+    closest fuzzy candidate of name, or (None, False, None) when no
+    candidate is close enough. The match is ambiguous when the name itself
+    is (see _local_target) or when another candidate at the same distance
+    resolves to a different generic.
+    """
+    length = len(fold(name))
+    if length < FUZZY_MIN_LENGTH or FUZZY_ACCEPT > 1:
+        return None, False, None
+    # Largest distance that can still reach FUZZY_ACCEPT against a name at
+    # most that much longer: d <= (1 - accept) * (length + d)
+    max_distance = min(FUZZY_MAX_DISTANCE, int((1 - FUZZY_ACCEPT) * length / FUZZY_ACCEPT + 1e-9))
+    if max_distance < 1:
+        return None, False, None
+
+    candidates = db.similar(name, 5, max_distance, nearest=True)
+    if not candidates:
+        return None, False, None
+    form, distance, similarity, drug, ambiguous = candidates[0]
+    if drug is None or similarity < FUZZY_ACCEPT:
+        return None, False, None
+
+    generic = drug.get("generic_name")
+    for _, other_distance, _, other, _ in candidates[1:]:
+        if other_distance == distance and other is not None and other.get("generic_name") != generic:
+            ambiguous = True
+    return drug, ambiguous, (form, distance, similarity)
+
+
+@timed("fuzzy_lookup")
+def find_fuzzy_match(name: str, db: Optional[DrugDBSnapshot] = None) -> Optional[Dict[str, Any]]:
+    """
+    Resolve a misspelled drug name ("ibuprofin", "loratidine") to one DB
+    record, for use after find_by_generic_name found nothing, with what it
+    was matched on:
 
-    for drug in OTC_DB:
-        if search_name == (drug.get("generic_name") or "").upper():
-            return drug
-        
-        aliases_upper = [str(a).upper() for a in drug.get("aliases", [])]
-        if search_name in aliases_upper:
-            return drug
-            
-        if search_name in (drug.get("base_name") or "").upper():
-            return drug
+      {"record": dict, "name": str, "distance": int, "similarity": float}
 
-    return None
+    Returns None unless exactly one record is within DRUG_DB_FUZZY_ACCEPT.
+    """
+    drug, ambiguous, match = _fuzzy_match(name or "", db or CURRENT)
+    if drug is None or ambiguous:
+        return None
+    form, distance, similarity = match
+    return {"record": drug, "name": form, "distance": distance, "similarity": similarity}
+
+
+def find_by_fuzzy_name(name: str, db: Optional[DrugDBSnapshot] = None):
+    """The record find_fuzzy_match resolves name to, or None."""
+    match = find_fuzzy_match(name, db=db)
+    return match["record"] if match else None
+
+
+def suggest_drugs(name: str, limit: int = 5, db: Optional[DrugDBSnapshot] = None) -> List[Dict[str, Any]]:
+    """
+    Ranked "did you mean" candidates for a drug name, closest first, one per
+    generic name and regardless of DRUG_DB_FUZZY_ACCEPT:
+
+      [{"name": str, "generic_name": str, "distance": int, "similarity": float}, ...]
+    """
+    result: List[Dict[str, Any]] = []
+    seen = set()
+    for form, distance, similarity, drug, _ in (db or CURRENT).similar(name or "", limit * 2, FUZZY_MAX_DISTANCE):
+        generic = (drug or {}).get("generic_name")
+        if not generic or generic in seen:
+            continue
+        seen.add(generic)
+        result.append({"name": form, "generic_name": generic, "distance": distance, "similarity": similarity})
+    return result[:limit]
+
+
+# Latin-script words considered for fuzzy matching in find_local_mentions,
+# and the longest run of them tried as one name ("vitamin c", "diphenhydramine hcl").
+_FUZZY_WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9-]*")
+_FUZZY_MAX_WORDS = 3
+
+
+def _fuzzy_hits(
+    text: str, covered: List[Tuple[int, int]], db: DrugDBSnapshot
+) -> List[Tuple[int, int, Dict[str, Any], bool]]:
+    """
+    Fuzzy (start, end, record, ambiguous) hits for the words of text outside
+    the dictionary hits in `covered`, preferring the longest run of words
+    at each position. Runs that start, or (beyond one word) end, with a
+    stopword are not tried.
+    """
+    words = [
+        (m.start(), m.end()) for m in _FUZZY_WORD_RE.finditer(text)
+        if not any(s < m.end() and m.start() < e for s, e in covered)
+    ]
+    hits: List[Tuple[int, int, Dict[str, Any], bool]] = []
+    i = 0
+    while i < len(words):
+        step = 1
+        if text[words[i][0]:words[i][1]].lower() in STOPWORDS:
+            i += 1
+            continue
+        for k in range(min(_FUZZY_MAX_WORDS, len(words) - i), 0, -1):
+            run = words[i:i + k]
+            if k > 1 and (
+                text[run[-1][0]:run[-1][1]].lower() in STOPWORDS
+                or any(text[a_end:b_start].strip() for (_, a_end), (b_start, _) in zip(run, run[1:]))
+            ):
+                continue
+            start, end = run[0][0], run[-1][1]
+            drug, ambiguous, _ = _fuzzy_match(text[start:end], db)
+            if drug is not None:
+                hits.append((start, end, drug, ambiguous))
+                step = k
+                break
+        i += step
+    return hits
+
+
+# Words of drug questions that are not drug names. A question is only
+# answered from the dictionary alone when every Latin word outside the hits
+# is a stopword or one of these, and every CJK run of two or more characters
+# is covered by these terms; anything else may be a drug the dictionary
+# does not know, which the LLM extractor has to see.
+_QUESTION_WORDS = frozenset(
+    "about after again all also am another any anything around avoid baby bad bed bedtime been before "
+    "being best better between blood both but breastfeeding child children cold combine cough could "
+    "daily day days did dose doses dosage dosing drink drinking drive driving drowsy drug drugs during "
+    "each eat effect effects elderly else empty every fever fine flu food get give good had headache "
+    "heart help high hour hours hurt infant infants interact interaction interactions just kid kids "
+    "kidney less limit liver long many max maximum medication medications medicine medicines milk mix "
+    "month months more morning most much need night not nursing often okay old once one only other "
+    "our over pain per pill pills please pregnancy pregnant pressure risk risks safe safely same "
+    "she side sick sleep some start stomach stop symptoms tablet tablets take taken takes taking "
+    "tell than then them there they time times too took twice two use used using want water week "
+    "weeks were why would year years".split()
+)
+_QUESTION_TERMS_ZH = frozenset(QUERY_EXPANSIONS) | frozenset(
+    "我 你 他 她 我们 孩子 宝宝 请问 问 是 不 不是 没 没有 有 会 要 想 需要 应该 可以 能 能不能 可不可以 "
+    "吃 吃了 服 服用 用 喝 一 一天 每天 天 几 几次 几片 次 片 粒 颗 小时 和 与 跟 及 或 或者 还 还是 "
+    "又 再 就 都 也 同 同服 的 了 吗 呢 吧 啊 呀 么 什么 怎么 怎么样 为什么 多少 之后 之前 以后 以前 "
+    "后 前 时 时候 期间 药 药物 这 那 这个 那个 在 对 最多 最大 空腹 饭后 饭前 睡前 安全 孕妇 "
+    "哺乳期 老年人 婴幼儿 发炎 肚子 拉肚子 腹泻 失眠 喝酒 饮酒 用量 危险 影响 效果".split()
+)
+_QUESTION_TERMS_ZH_RE = re.compile(
+    "|".join(re.escape(t) for t in sorted(_QUESTION_TERMS_ZH, key=len, reverse=True))
+)
+_CJK_RUN_RE = re.compile(r"[\u3400-\u9fff]+")
+
+
+def _unmatched_terms(text: str, covered: List[Tuple[int, int]]) -> List[str]:
+    """
+    Drug-like leftovers of text outside the `covered` spans: Latin words not
+    in STOPWORDS or _QUESTION_WORDS, and CJK pieces of two or more characters
+    left once the _QUESTION_TERMS_ZH are removed.
+    """
+    chars = list(text)
+    for start, end in covered:
+        chars[start:end] = " " * (end - start)
+    rest = "".join(chars)
+
+    terms = []
+    for m in _FUZZY_WORD_RE.finditer(rest):
+        word = m.group(0).lower()
+        if len(word) >= 3 and word not in STOPWORDS and word not in _QUESTION_WORDS:
+            terms.append(word)
+    for run in _CJK_RUN_RE.findall(rest):
+        terms.extend(piece for piece in _QUESTION_TERMS_ZH_RE.sub(" ", run).split() if len(piece) >= 2)
+    return terms
+
+
+@timed("local_match")
+def find_local_mentions(text: str, db: Optional[DrugDBSnapshot] = None) -> Dict[str, Any]:
+    """
+    Dictionary-only drug extraction, used to skip the LLM extractor.
+
+    Returns:
+
+      {
+        "mentions": [{"raw": str, "normalized": str}, ...],
+        "ambiguous": bool,
+        "unmatched": [str]
+      }
+
+    "mentions" has the same shape as llm_extract.extract_drugs output, with
+    "normalized" set to the generic_name of the resolved record. Words that
+    the dictionary does not know are also tried against the fuzzy index, so
+    a misspelling such as "ibuprofin" still resolves locally. "ambiguous"
+    is True when at least one hit (such as a drug class shared by several
+    records) cannot be pinned to a single generic. "unmatched" lists the
+    words that may name a drug but matched nothing (see _unmatched_terms),
+    including dictionary names that resolve to no record.
+    """
+    text = text or ""
+    db = db or CURRENT
+    mentions: List[Dict[str, str]] = []
+    ambiguous = False
+    seen = set()
+
+    # Matched on the folded text (full-width and traditional forms mapped);
+    # offsets are the same in both.
+    folded = fold_variants(text)
+    hits = db.local_hits(folded)
+    hits = hits + _fuzzy_hits(folded, [(start, end) for start, end, _, _ in hits], db)
+    hits.sort(key=lambda h: h[0])
+
+    resolved = [(start, end) for start, end, drug, _ in hits if drug is not None]
+    unmatched = _unmatched_terms(folded, resolved)
+
+    for start, end, drug, is_ambiguous in hits:
+        if drug is None:
+            continue
+        if is_ambiguous:
+            ambiguous = True
+            continue
+        generic = drug.get("generic_name") or ""
+        if generic in seen:
+            continue
+        seen.add(generic)
+        mentions.append({"raw": text[start:end], "normalized": generic})
+
+    return {"mentions": mentions, "ambiguous": ambiguous, "unmatched": unmatched}
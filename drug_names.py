@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Name normalization shared by the in-memory indexes (drug_db) and the
+# SQLite store (sqlite_store), so that both backends resolve the same names
+# to the same records. Nothing here loads the DB.
+
+LOOKUP_TIERS = ("generic", "alias", "base")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Chinese <-> INN alias table: {"traditional": {char: char}, "aliases":
+# {INN: [names]}}. Loaded by load_aliases (drug_db calls it on every DB
+# load, so edits are picked up by reload).
+ALIASES_PATH = os.getenv("DRUG_ALIASES_PATH", os.path.join(BASE_DIR, "data", "aliases_zh.json"))
+
+# Full-width ASCII forms and the ideographic space, mapped to half-width.
+_FULL_WIDTH: Dict[int, int] = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}
+_FULL_WIDTH[0x3000] = 0x20
+
+# Current alias state, replaced as a whole by load_aliases:
+#   SYNONYMS      alias as written -> INN it resolves to
+#   _VARIANTS     str.translate table: full-width and traditional characters
+#   _SYNONYM_KEYS lookup_key(alias) -> lookup_key(INN), for resolve_key
+#   _ZH_NAMES     folded Chinese alias -> lowercased INN, for normalize_name
+#   _FORMS        lowercased alias -> alias as written, for text matching
+SYNONYMS: Dict[str, str] = {}
+_VARIANTS: Dict[int, int] = dict(_FULL_WIDTH)
+_SYNONYM_KEYS: Dict[str, str] = {}
+_ZH_NAMES: Dict[str, str] = {}
+_FORMS: Dict[str, str] = {}
+
+
+def fold_variants(text: str) -> str:
+    """
+    Map full-width letters, digits and punctuation to half-width and
+    traditional characters of the alias table to simplified ones. Every
+    character maps to exactly one, so offsets into the result are offsets
+    into text.
+    """
+    return (text or "").translate(_VARIANTS)
+
+
+def _has_cjk(text: str) -> bool:
+    return any("\u3400" <= ch <= "\u9fff" for ch in text)
+
+
+def install_aliases(aliases: Iterable[Tuple[str, List[str]]], traditional: Dict[str, str]) -> None:
+    """
+    Make `aliases` ((INN, [names]) pairs) and `traditional` ({char: char})
+    the alias table. Later entries win when a name is listed under two INNs.
+    """
+    global SYNONYMS, _VARIANTS, _SYNONYM_KEYS, _ZH_NAMES, _FORMS
+    variants = dict(_FULL_WIDTH)
+    variants.update({ord(t): ord(s) for t, s in traditional.items() if len(t) == 1 and len(s) == 1})
+
+    synonyms: Dict[str, str] = {}
+    for inn, names in aliases:
+        for name in names:
+            name = name.translate(variants).strip()
+            if name:
+                synonyms[name] = inn
+
+    _VARIANTS = variants
+    _SYNONYM_KEYS = {lookup_key(name): lookup_key(inn) for name, inn in synonyms.items()}
+    _ZH_NAMES = {name.lower(): inn.lower() for name, inn in synonyms.items() if _has_cjk(name)}
+    _FORMS = {name.lower(): name for name in synonyms}
+    SYNONYMS = synonyms
+
+
+def load_aliases(path: str = ALIASES_PATH, learned: Optional[Dict[str, List[str]]] = None) -> None:
+    """
+    Load the alias table at path and install it, together with `learned`
+    ({INN: [names]}, see alias_memory); the file wins where both list a
+    name. A missing file installs the learned names only.
+    """
+    traditional: Dict[str, str] = {}
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        file_aliases = data.get("aliases") if isinstance(data, dict) else None
+        if not isinstance(file_aliases, dict) or not all(isinstance(v, list) for v in file_aliases.values()):
+            raise ValueError("Alias file must contain an \"aliases\" dict of INN -> [names].")
+        traditional = data.get("traditional") or {}
+    else:
+        file_aliases = {}
+    # Later entries win in install_aliases, so learned names go first
+    install_aliases(list((learned or {}).items()) + list(file_aliases.items()), traditional)
+
+
+def alias_names() -> List[str]:
+    """Every name of the current alias table, as written."""
+    return list(SYNONYMS)
+
+
+def alias_forms() -> Dict[str, str]:
+    """Lowercased name -> name as written, for the current alias table (do not modify)."""
+    return _FORMS
+
+
+def synonym_keys() -> Dict[str, str]:
+    """lookup_key(alias) -> lookup_key(INN) for the current alias table (do not modify)."""
+    return _SYNONYM_KEYS
+
+
+def normalize_name(name: str) -> str:
+    """标准化名称：支持中文映射"""
+    if not name: return ""
+
+    n = fold_variants(name).strip().lower()
+
+    return _ZH_NAMES.get(n, n)
+
+
+_KEY_TOKEN_RE = re.compile(r"[^\s,;/()]+")
+
+
+def lookup_key(name: str) -> str:
+    """
+    Normalize a name into an exact-lookup key: variants folded (see
+    fold_variants), uppercase, with whitespace and list separators (comma,
+    semicolon, slash, parentheses) collapsed.
+    """
+    if not name:
+        return ""
+    return " ".join(_KEY_TOKEN_RE.findall(fold_variants(str(name)).upper()))
+
+
+def resolve_key(name: str) -> str:
+    """Lookup key of a query name after applying the alias table."""
+    key = lookup_key(name)
+    return _SYNONYM_KEYS.get(key, key)
+
+
+def index_names(entry: Dict[str, Any]) -> List[str]:
+    """
+    Normalized names of a record for NAME_INDEX, without duplicates:
+    generic_name, base_name, then aliases.
+    """
+    base_name = normalize_name(entry.get("base_name", ""))
+    generic_name = normalize_name(entry.get("generic_name", ""))
+
+    names = []
+    if generic_name:
+        names.append(generic_name)
+    if base_name and base_name != generic_name:
+        names.append(base_name)
+
+    aliases = entry.get("aliases") or []
+    for alias in aliases:
+        if isinstance(alias, str):
+            n = normalize_name(alias)
+            if n:
+                names.append(n)
+
+    # de-duplicate
+    seen = set()
+    unique_names = []
+    for n in names:
+        if n not in seen:
+            seen.add(n)
+            unique_names.append(n)
+    return unique_names
+
+
+def lookup_keys(entry: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+    """
+    (tier, key) pairs of a record for the exact-match tiers:
+
+      - "generic": lookup key of generic_name
+      - "alias":   lookup key of each alias
+      - "base":    every contiguous token span of base_name, so that
+                   "DICLOFENAC" still finds "DICLOFENAC SODIUM"
+    """
+    g = lookup_key(entry.get("generic_name") or "")
+    if g:
+        yield "generic", g
+
+    for a in entry.get("aliases") or []:
+        a_key = lookup_key(a)
+        if a_key:
+            yield "alias", a_key
+
+    tokens = lookup_key(entry.get("base_name") or "").split()
+    for i in range(len(tokens)):
+        for j in range(i + 1, len(tokens) + 1):
+            yield "base", " ".join(tokens[i:j])
+
+
+def surface_names(entry: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    (surface form, lookup key) of a record's generic name, full base name
+    and aliases, as matched by find_local_mentions.
+    """
+    names = [entry.get("generic_name") or "", entry.get("base_name") or ""]
+    names.extend(a for a in entry.get("aliases") or [] if isinstance(a, str))
+    result = []
+    for n in names:
+        key = lookup_key(n)
+        if key:
+            result.append((fold_variants(n).strip(), key))
+    return result
+
+
+load_aliases()
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Grams are taken from the name padded with one space on each side, so a
+# name of length L has L trigrams and its first and last letters are
+# covered as often as the middle ones.
+GRAM_SIZE = 3
+
+
+def fold(text: str) -> str:
+    """Lowercase and collapse whitespace; names and queries are compared folded."""
+    return " ".join((text or "").lower().split())
+
+
+def _grams(folded: str) -> List[str]:
+    padded = f" {folded} "
+    return [padded[i:i + GRAM_SIZE] for i in range(len(padded) - GRAM_SIZE + 1)]
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent
+    transpositions) between a and b, or limit + 1 once it is known to
+    exceed limit. Only the diagonal band of width 2 * limit + 1 is filled.
+    """
+    if a == b:
+        return 0
+    la, lb = len(a), len(b)
+    if abs(la - lb) > limit:
+        return limit + 1
+
+    inf = limit + 1
+    prev2: Optional[List[int]] = None
+    prev = [j if j <= limit else inf for j in range(lb + 1)]
+    for i in range(1, la + 1):
+        ca = a[i - 1]
+        cur = [inf] * (lb + 1)
+        cur[0] = i if i <= limit else inf
+        row_min = cur[0]
+        for j in range(max(1, i - limit), min(lb, i + limit) + 1):
+            cb = b[j - 1]
+            d = prev[j - 1] + (ca != cb)
+            if prev[j] + 1 < d:
+                d = prev[j] + 1
+            if cur[j - 1] + 1 < d:
+                d = cur[j - 1] + 1
+            if prev2 is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb and prev2[j - 2] + 1 < d:
+                d = prev2[j - 2] + 1
+            if d > inf:
+                d = inf
+            cur[j] = d
+            if d < row_min:
+                row_min = d
+        if row_min > limit:
+            return inf
+        prev2, prev = prev, cur
+    return prev[lb]
+
+
+class FuzzyNameIndex:
+    """
+    Typo-tolerant lookup over a fixed set of names.
+
+    Built once from (name, payload) pairs like name_matcher.NameAutomaton.
+    Names are stored as an inverted index from character trigrams to name
+    ids (CSR arrays). A query collects the postings of its trigrams and
+    counts, in one numpy pass, how many trigrams each name shares with it;
+    names that cannot be within max_distance edits (length difference, or
+    fewer shared trigrams than the q-gram bound allows) are dropped there,
+    and the survivors are checked with the exact bounded edit distance,
+    most promising first, until no remaining name can improve the result. The cost depends on how common the query's
+    trigrams are, not on the number of names.
+    """
+
+    def __init__(
+        self,
+        pairs: Iterable[Tuple[str, Any]],
+        max_distance: int = 2,
+        verify_limit: int = 64,
+    ):
+        self.max_distance = max_distance
+        self.verify_limit = verify_limit
+        self.names: List[str] = []
+        self.payloads: List[List[Any]] = []
+
+        name_ids: Dict[str, int] = {}
+        gram_ids: Dict[str, int] = {}
+        postings: List[List[int]] = []
+        gram_counts: List[int] = []
+        for name, payload in pairs:
+            name = fold(name)
+            if not name:
+                continue
+            nid = name_ids.get(name)
+            if nid is None:
+                nid = len(self.names)
+                name_ids[name] = nid
+                self.names.append(name)
+                self.payloads.append([])
+                grams = set(_grams(name))
+                gram_counts.append(len(grams))
+                for g in grams:
+                    gid = gram_ids.get(g)
+                    if gid is None:
+                        gid = gram_ids[g] = len(postings)
+                        postings.append([])
+                    postings[gid].append(nid)
+            self.payloads[nid].append(payload)
+
+        self._gram_ids = gram_ids
+        self._indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        if postings:
+            self._indptr[1:] = np.cumsum([len(p) for p in postings])
+        self._postings = np.fromiter(
+            (nid for p in postings for nid in p), dtype=np.int32, count=int(self._indptr[-1])
+        )
+        self._gram_counts = np.asarray(gram_counts, dtype=np.int32)
+        self._lengths = np.asarray([len(n) for n in self.names], dtype=np.int32)
+        self._max_length = int(self._lengths.max()) if self.names else 0
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def search(
+        self,
+        query: str,
+        limit: int = 5,
+        max_distance: Optional[int] = None,
+        nearest: bool = False,
+    ) -> List[Tuple[int, int, float]]:
+        """
+        Return up to `limit` (name_id, distance, similarity) for names within
+        max_distance edits of query, closest first (ties by name). similarity
+        is 1 - distance / max(len(query), len(name)), so 1.0 is an exact match.
+        With nearest=True only names at the smallest distance found are
+        returned, which lets the search stop much earlier.
+        """
+        q = fold(query)
+        d = self.max_distance if max_distance is None else max_distance
+        if not q or len(q) > self._max_length + d:
+            return []
+
+        grams = set(_grams(q))
+        gids = [self._gram_ids[g] for g in grams if g in self._gram_ids]
+        # An edit (or transposition) touches at most GRAM_SIZE + 1 grams of
+        # either string, so a name within d edits lacks at most this many of
+        # the query's grams; grams no name has count against all of them.
+        # A query with no more grams than that can be within d edits of a
+        # name it shares no gram with, so every name of a close enough
+        # length is a candidate too.
+        short = len(grams) <= (GRAM_SIZE + 1) * d
+        if len(grams) - len(gids) > (GRAM_SIZE + 1) * d or not (gids or short):
+            return []
+        indptr = self._indptr
+        hits = np.concatenate([self._postings[indptr[g]:indptr[g + 1]] for g in gids] or [self._postings[:0]])
+        if short:
+            shared = np.bincount(hits, minlength=len(self.names))
+            ids = np.flatnonzero((shared > 0) | (np.abs(self._lengths - len(q)) <= d))
+            shared = shared[ids]
+        elif len(hits) * 16 < len(self.names):
+            ids, shared = np.unique(hits, return_counts=True)
+        else:
+            # Dense count; cheaper than sorting once postings are long
+            shared = np.bincount(hits, minlength=len(self.names))
+            ids = np.flatnonzero(shared)
+            shared = shared[ids]
+
+        # Lower bound on each name's distance from the trigrams it lacks and
+        # the length difference; names above d are dropped, the rest are
+        # verified cheapest bound first, best overlap first within a bound.
+        counts = self._gram_counts[ids]
+        missing = np.maximum(counts, len(grams)) - shared
+        low = np.maximum(-(-missing // (GRAM_SIZE + 1)), np.abs(self._lengths[ids] - len(q)))
+        keep = low <= d
+        ids, low = ids[keep], low[keep]
+        if not len(ids):
+            return []
+        dice = 2.0 * shared[keep] / (counts[keep] + len(grams))
+        order = np.lexsort((-dice, low))[:self.verify_limit]
+
+        results: List[Tuple[int, int, float]] = []
+        bound = d
+        for nid, nid_low in zip(ids[order].tolist(), low[order].tolist()):
+            if nid_low > bound:
+                break
+            name = self.names[nid]
+            dist = edit_distance(q, name, bound)
+            if dist <= bound:
+                results.append((nid, dist, 1.0 - dist / max(len(q), len(name))))
+                if nearest and dist < bound:
+                    results = [r for r in results if r[1] == dist]
+                    bound = dist
+                if len(results) >= limit:
+                    # Later names can only displace these at an equal or
+                    # smaller distance.
+                    results.sort(key=lambda r: (r[1], -r[2], self.names[r[0]]))
+                    del results[limit:]
+                    bound = results[-1][1]
+        results.sort(key=lambda r: (r[1], -r[2], self.names[r[0]]))
+        return results[:limit]
@@ -1,10 +1,25 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import os
-from typing import Any, Dict, List
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+import drug_db
+from drug_context import CONTEXT_SIGNATURE, build_drug_context, snippet_for
+from llm_cache import TTLCache, canonicalize_question, make_key
+from llm_transport import (
+    PoolStats,
+    build_async_http_client,
+    build_sync_http_client,
+    load_transport_settings,
+    warmup,
+)
+from metrics import CONTEXT_TOKENS, record_stage, timed
 
 # Load environment variables from .env if present
 load_dotenv()
@@ -68,9 +83,40 @@ print(f"[*] 初始化 LLM 客户端: Provider={PROVIDER}, Model={default_model},
 if not api_key:
     raise RuntimeError(f"未找到 {PROVIDER} 的 API Key，请检查 .env 文件")
 
-client = OpenAI(api_key=api_key, base_url=base_url)
+# HTTP transport: pool size, keep-alive, timeouts and HTTP/2 are configurable
+# per provider (see llm_transport.load_transport_settings).
+# POOL_STATS tracks the async pool used by the web app; scripts use the sync
+# client, which has its own pool of the same size.
+TRANSPORT_SETTINGS = load_transport_settings(PROVIDER)
+POOL_STATS = PoolStats(TRANSPORT_SETTINGS["POOL_MAX_CONNECTIONS"])
+SYNC_POOL_STATS = PoolStats(TRANSPORT_SETTINGS["POOL_MAX_CONNECTIONS"])
+
+client = OpenAI(
+    api_key=api_key,
+    base_url=base_url,
+    http_client=build_sync_http_client(TRANSPORT_SETTINGS, SYNC_POOL_STATS),
+)
 DEFAULT_MODEL = default_model
 
+# Async client for the FastAPI endpoints. One pooled HTTP client is shared by
+# every request in the worker, so hundreds of in-flight LLM calls reuse a
+# bounded set of keep-alive connections instead of holding threads.
+async_http_client = build_async_http_client(TRANSPORT_SETTINGS, POOL_STATS)
+aclient = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=async_http_client)
+
+
+async def awarmup() -> int:
+    """Pre-open connections to base_url (called on app startup)."""
+    return await warmup(
+        async_http_client, base_url, TRANSPORT_SETTINGS["WARMUP_CONNECTIONS"], TRANSPORT_SETTINGS["WARMUP_TIMEOUT"]
+    )
+
+
+async def aclose() -> None:
+    """Close the pooled async HTTP client (called on app shutdown)."""
+    await aclient.close()
+
+
 # System prompts for Chinese and English outputs
 SYSTEM_PROMPT_ZH = """
 你是“AI 健康信息调和器”（Health Information Harmonizer）。
@@ -129,71 +175,178 @@ Do NOT output a section titled “Disclaimer”; the system will add it external
 """
 
 
-def _build_drug_context(drug_infos: List[Dict[str, Any]], lang: str) -> str:
-    """Render drug information into a language-aware text block for LLM context."""
-    if not drug_infos:
-        return (
-            "No drug information in local database."
-            if lang == "en"
-            else "未找到相关药物的本地数据库信息。"
-        )
-
-    blocks = []
-    for idx, d in enumerate(drug_infos, start=1):
-        name = d.get("generic_name", "")
-        aliases = ", ".join(d.get("aliases", []))
-        category = d.get("category", "")
-        indications = ", ".join(d.get("indications", []))
-        contraind = ", ".join(d.get("contraindications", []))
-        cautions = ", ".join(d.get("cautions", []))
-        warnings = ", ".join(d.get("important_warnings", []))
-
-        if lang == "zh":
-            block = f"""
-{idx}. 通用名: {name}
-   别名: {aliases}
-   类别: {category}
-   适应证: {indications}
-   禁忌: {contraind}
-   慎用: {cautions}
-   警示: {warnings}
-"""
-        else:
-            block = f"""
-{idx}. Generic name: {name}
-   Aliases: {aliases}
-   Category: {category}
-   Indications: {indications}
-   Contraindications: {contraind}
-   Cautions: {cautions}
-   Warnings: {warnings}
-"""
+# Part of the answer cache key: editing either prompt invalidates answers
+PROMPT_VERSION = hashlib.sha256(
+    (SYSTEM_PROMPT_ZH + SYSTEM_PROMPT_EN).encode("utf-8")
+).hexdigest()[:12]
+
+# Answers for repeated questions about the same drugs. Configure with
+# ANSWER_CACHE_SIZE / _TTL / _PATH / _DISK_SIZE.
+ANSWER_CACHE = TTLCache.from_env("answer", "ANSWER", max_entries=512, ttl=86400.0)
+
+
+def _drug_set_fingerprint(drug_infos: List[Dict[str, Any]], db: drug_db.DrugDBSnapshot) -> str:
+    """
+    Sorted generic names plus a content hash of the records and their
+    snippets. Any change to a record in data/otc_db.json (or to its summary)
+    changes the hash, so answers built on the old text are no longer found.
+    """
+    names = sorted((d.get("generic_name") or "") for d in drug_infos)
+    h = hashlib.sha256()
+    full_records = [db.full_record(d) for d in drug_infos]
+    for d in sorted(full_records, key=lambda d: d.get("generic_name") or ""):
+        h.update(json.dumps(d, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        for lang in ("en", "zh"):
+            h.update(snippet_for(d, lang, db.snippets).encode("utf-8"))
+    return "|".join(names) + "#" + h.hexdigest()
+
+
+def _answer_cache_key(
+    question: str, drug_infos: List[Dict[str, Any]], lang: str, db: drug_db.DrugDBSnapshot
+) -> str:
+    return make_key(
+        PROMPT_VERSION,
+        CONTEXT_SIGNATURE,
+        DEFAULT_MODEL,
+        lang,
+        canonicalize_question(question),
+        _drug_set_fingerprint(drug_infos, db),
+    )
 
-        blocks.append(block.strip())
 
-    return "\n\n".join(blocks)
+def _build_drug_context(
+    drug_infos: List[Dict[str, Any]], lang: str, question: str, db: drug_db.DrugDBSnapshot
+) -> str:
+    """
+    Render drug information into a language-aware text block for LLM context.
+    `db` is the snapshot the records were looked up in.
+    """
+    text, report = build_drug_context(
+        drug_infos,
+        lang,
+        question=question,
+        passage_index=db.passage_index,
+        snippets=db.snippets,
+        hydrate=db.full_record,
+    )
+    CONTEXT_TOKENS.inc(report["tokens_used"], kind="used")
+    CONTEXT_TOKENS.inc(report["tokens_dropped"], kind="dropped")
+    CONTEXT_TOKENS.inc(report["tokens_deduplicated"], kind="deduplicated")
+    return text
 
 
-def ask_glm(question: str, drug_infos: List[Dict[str, Any]], lang: str = "zh") -> str:
-    """Call the LLM with harmonizer prompts and optional drug context."""
+def _build_messages(
+    question: str, drug_infos: List[Dict[str, Any]], lang: str, db: drug_db.DrugDBSnapshot
+) -> List[Dict[str, str]]:
     system_prompt = SYSTEM_PROMPT_EN if lang == "en" else SYSTEM_PROMPT_ZH
-    drug_context = _build_drug_context(drug_infos, lang)
+    drug_context = _build_drug_context(drug_infos, lang, question, db)
 
     if lang == "zh":
         prefix = "下面是系统收录的相关药物资料（如有），请基于这些信息回答：\n\n"
     else:
         prefix = "Here is the drug information available in the local database:\n\n"
 
-    messages = [
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "system", "content": prefix + drug_context},
         {"role": "user", "content": question},
     ]
 
+
+@timed("generate")
+def ask_glm(
+    question: str,
+    drug_infos: List[Dict[str, Any]],
+    lang: str = "zh",
+    db: Optional[drug_db.DrugDBSnapshot] = None,
+) -> str:
+    """
+    Call the LLM with harmonizer prompts and optional drug context. `db` is
+    the drug DB snapshot drug_infos came from (default: the current one).
+    """
+    db = db or drug_db.CURRENT
+    cache_key = _answer_cache_key(question, drug_infos, lang, db)
+    cached = ANSWER_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
     resp = client.chat.completions.create(
         model=DEFAULT_MODEL,
-        messages=messages,
+        messages=_build_messages(question, drug_infos, lang, db),
+        temperature=0.2,
+    )
+
+    answer = resp.choices[0].message.content
+    if answer:
+        ANSWER_CACHE.set(cache_key, answer)
+    return answer
+
+
+@timed("generate")
+async def aask_glm(
+    question: str,
+    drug_infos: List[Dict[str, Any]],
+    lang: str = "zh",
+    db: Optional[drug_db.DrugDBSnapshot] = None,
+) -> str:
+    """Async variant of ask_glm on the shared AsyncOpenAI client."""
+    db = db or drug_db.CURRENT
+    cache_key = _answer_cache_key(question, drug_infos, lang, db)
+    cached = await ANSWER_CACHE.aget(cache_key)
+    if cached is not None:
+        return cached
+
+    resp = await aclient.chat.completions.create(
+        model=DEFAULT_MODEL,
+        messages=_build_messages(question, drug_infos, lang, db),
+        temperature=0.2,
+    )
+
+    answer = resp.choices[0].message.content
+    if answer:
+        await ANSWER_CACHE.aset(cache_key, answer)
+    return answer
+
+
+async def aask_glm_stream(
+    question: str,
+    drug_infos: List[Dict[str, Any]],
+    lang: str = "zh",
+    db: Optional[drug_db.DrugDBSnapshot] = None,
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of aask_glm: yield answer text deltas as they arrive.
+
+    A cached answer is yielded as a single chunk. The full answer is cached
+    once the stream completes.
+    """
+    db = db or drug_db.CURRENT
+    cache_key = _answer_cache_key(question, drug_infos, lang, db)
+    cached = await ANSWER_CACHE.aget(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    start = time.perf_counter()
+    stream = await aclient.chat.completions.create(
+        model=DEFAULT_MODEL,
+        messages=_build_messages(question, drug_infos, lang, db),
         temperature=0.2,
+        stream=True,
     )
 
-    return resp.choices[0].message.content
\ No newline at end of file
+    parts: List[str] = []
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            if not parts:
+                record_stage("first_token", time.perf_counter() - start)
+            parts.append(delta)
+            yield delta
+    record_stage("generate", time.perf_counter() - start)
+
+    answer = "".join(parts)
+    if answer:
+        await ANSWER_CACHE.aset(cache_key, answer)
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def canonicalize_question(text: str) -> str:
+    """
+    Canonical form of a user question for cache keys: NFKC (full-width ->
+    half-width), case-folded, surrounding and repeated whitespace collapsed.
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.casefold().split())
+
+
+def make_key(*parts: str) -> str:
+    """Hash the given key parts into a fixed-size cache key."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache with a per-entry TTL and an optional SQLite tier.
+
+    The in-memory tier is a per-process OrderedDict. When `path` is set,
+    entries are also written to a SQLite file so that restarts and other
+    uvicorn workers on the same host share them; a memory miss falls through
+    to the file. Values must be JSON-serializable.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 1024,
+        ttl: float = 86400.0,
+        path: Optional[str] = None,
+        max_disk_entries: Optional[int] = None,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path or None
+        self.max_disk_entries = max_disk_entries or max_entries * 10
+
+        self._mem: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "disk_hits": 0}
+
+        if self.path:
+            self._init_db()
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, **defaults: Any) -> "TTLCache":
+        """
+        Build a cache configured by <PREFIX>_CACHE_SIZE, <PREFIX>_CACHE_TTL,
+        <PREFIX>_CACHE_PATH and <PREFIX>_CACHE_DISK_SIZE.
+        """
+        size = os.getenv(f"{prefix}_CACHE_SIZE")
+        ttl = os.getenv(f"{prefix}_CACHE_TTL")
+        path = os.getenv(f"{prefix}_CACHE_PATH")
+        disk_size = os.getenv(f"{prefix}_CACHE_DISK_SIZE")
+        return cls(
+            name,
+            max_entries=int(size) if size else defaults.get("max_entries", 1024),
+            ttl=float(ttl) if ttl else defaults.get("ttl", 86400.0),
+            path=path if path is not None else defaults.get("path"),
+            max_disk_entries=int(disk_size) if disk_size else defaults.get("max_disk_entries"),
+        )
+
+    # ------------------------------------------------------------------
+    # SQLite tier
+    # ------------------------------------------------------------------
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)"
+            )
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, Any]]:
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                with conn:
+                    conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            with conn:
+                conn.execute(
+                    "UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+            return row[1], json.loads(row[0])
+        except sqlite3.Error:
+            return None
+
+    def _disk_set(self, key: str, value: Any, expires_at: float, now: float) -> None:
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), expires_at, now),
+                )
+                conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    " SELECT key FROM cache ORDER BY accessed_at DESC"
+                    " LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                )
+        except sqlite3.Error:
+            pass
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value or None; counts a hit or a miss."""
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._mem.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return item[1]
+                del self._mem[key]
+
+        if self.path:
+            item = self._disk_get(key, now)
+            if item is not None:
+                with self._lock:
+                    self._mem_put(key, item)
+                    self.stats["hits"] += 1
+                    self.stats["disk_hits"] += 1
+                return item[1]
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._mem_put(key, (expires_at, value))
+        if self.path:
+            self._disk_set(key, value, expires_at, now)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """
+        Async get: memory hits are served inline, the SQLite tier is read
+        in a worker thread so the event loop is never blocked on the file.
+        """
+        if not self.path:
+            return self.get(key)
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None and item[0] > time.time():
+                self._mem.move_to_end(key)
+                self.stats["hits"] += 1
+                return item[1]
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any) -> None:
+        if not self.path:
+            self.set(key, value)
+            return
+        await asyncio.to_thread(self.set, key, value)
+
+    def _mem_put(self, key: str, item: Tuple[float, Any]) -> None:
+        self._mem[key] = item
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+        if self.path:
+            try:
+                conn = self._conn()
+                with conn:
+                    conn.execute("DELETE FROM cache")
+            except sqlite3.Error:
+                pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and sizes for the /stats endpoint."""
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_ratio": (self.stats["hits"] / total) if total else 0.0,
+                "entries": len(self._mem),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "path": self.path,
+            }
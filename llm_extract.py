@@ -1,9 +1,12 @@
 from typing import List, Dict, Set
+import hashlib
 import json
 import re
 import os
 
-from glm_client import client, DEFAULT_MODEL
+from glm_client import aclient, client, DEFAULT_MODEL
+from llm_cache import TTLCache, canonicalize_question, make_key
+from metrics import timed
 
 # Load whitelist once to save overhead and ensure local compliance
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -30,6 +33,14 @@ Rules:
 {"mentioned_drugs": [{"raw": "...", "normalized": "..."}]}
 """
 
+# Part of the cache key: editing the prompt invalidates cached extractions
+EXTRACT_PROMPT_VERSION = hashlib.sha256(EXTRACT_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+# Extraction runs at temperature 0, so identical questions can reuse the
+# parsed model output. Configure with EXTRACT_CACHE_SIZE / _TTL / _PATH;
+# set EXTRACT_CACHE_PATH to a SQLite file to share hits across workers.
+EXTRACT_CACHE = TTLCache.from_env("extract", "EXTRACT", max_entries=2048, ttl=7 * 86400.0)
+
 def _extract_json_str(text: str) -> str:
     if not text:
         raise ValueError("Model returned empty content.")
@@ -43,40 +54,88 @@ def _extract_json_str(text: str) -> str:
         raise ValueError("No JSON object found.")
     return m.group(0)
 
-def extract_drugs(question: str) -> List[Dict[str, str]]:
+def _parse_mentions(content: str) -> List[Dict[str, str]]:
+    """Parse model output into [{"raw", "normalized"}] before whitelisting."""
+    json_str = _extract_json_str(content)
+    data = json.loads(json_str)
+    mentioned = data.get("mentioned_drugs", [])
+
+    result: List[Dict[str, str]] = []
+    for item in mentioned:
+        raw = str(item.get("raw", "")).strip()
+        norm = str(item.get("normalized", "")).upper().strip()
+
+        if not raw: continue
+        result.append({"raw": raw, "normalized": norm})
+    return result
+
+def _apply_whitelist(mentions: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    whitelist_enabled = bool(GENERIC_WHITELIST)
+
+    result: List[Dict[str, str]] = []
+    for item in mentions:
+        raw, norm = item["raw"], item["normalized"]
+        # Local Validation: Only enforce whitelist when it is present.
+        # If the whitelist file is missing/empty, allow the model output to proceed.
+        if (not whitelist_enabled) or norm in GENERIC_WHITELIST:
+            result.append({"raw": raw, "normalized": norm})
+        else:
+            # Mark as unrecognized for Case 2 fallback in main.py
+            result.append({"raw": raw, "normalized": ""})
+    return result
+
+def _cache_key(question: str) -> str:
+    return make_key(EXTRACT_PROMPT_VERSION, DEFAULT_MODEL, canonicalize_question(question))
+
+def _messages(question: str) -> List[Dict[str, str]]:
     user_prompt = f"Input: {question}\nOutput JSON:"
+    return [
+        {"role": "system", "content": EXTRACT_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+@timed("extract")
+def extract_drugs(question: str) -> List[Dict[str, str]]:
+    cache_key = _cache_key(question)
+    cached = EXTRACT_CACHE.get(cache_key)
+    if cached is not None:
+        # The whitelist is applied after the cache so edits take effect at once
+        return _apply_whitelist(cached)
 
     resp = client.chat.completions.create(
         model=DEFAULT_MODEL,
-        messages=[
-            {"role": "system", "content": EXTRACT_SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ],
+        messages=_messages(question),
         temperature=0
     )
     content = resp.choices[0].message.content
 
     try:
-        json_str = _extract_json_str(content)
-        data = json.loads(json_str)
-        mentioned = data.get("mentioned_drugs", [])
-        
-        result: List[Dict[str, str]] = []
-        for item in mentioned:
-            raw = str(item.get("raw", "")).strip()
-            norm = str(item.get("normalized", "")).upper().strip()
-            
-            if not raw: continue
-            
-            whitelist_enabled = bool(GENERIC_WHITELIST)
-
-            # Local Validation: Only enforce whitelist when it is present.
-            # If the whitelist file is missing/empty, allow the model output to proceed.
-            if (not whitelist_enabled) or norm in GENERIC_WHITELIST:
-                result.append({"raw": raw, "normalized": norm})
-            else:
-                # Mark as unrecognized for Case 2 fallback in main.py
-                result.append({"raw": raw, "normalized": ""})
-        return result
+        mentions = _parse_mentions(content)
     except:
         return []
+
+    EXTRACT_CACHE.set(cache_key, mentions)
+    return _apply_whitelist(mentions)
+
+@timed("extract")
+async def aextract_drugs(question: str) -> List[Dict[str, str]]:
+    """Async variant of extract_drugs on the shared AsyncOpenAI client."""
+    cache_key = _cache_key(question)
+    cached = await EXTRACT_CACHE.aget(cache_key)
+    if cached is not None:
+        return _apply_whitelist(cached)
+
+    resp = await aclient.chat.completions.create(
+        model=DEFAULT_MODEL,
+        messages=_messages(question),
+        temperature=0
+    )
+    content = resp.choices[0].message.content
+
+    try:
+        mentions = _parse_mentions(content)
+    except:
+        return []
+
+    await EXTRACT_CACHE.aset(cache_key, mentions)
+    return _apply_whitelist(mentions)
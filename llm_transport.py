@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+
+# Per-provider transport defaults. Any value can be overridden with
+# <PROVIDER>_<SETTING> (e.g. ZHIPU_POOL_MAX_CONNECTIONS) or LLM_<SETTING>.
+TRANSPORT_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "openai": {"HTTP2": True},
+    "zhipu": {"HTTP2": False},
+    "deepseek": {"HTTP2": False},
+    "gemini": {"HTTP2": True},
+}
+
+COMMON_DEFAULTS: Dict[str, Any] = {
+    "POOL_MAX_CONNECTIONS": 100,
+    "POOL_MAX_KEEPALIVE": 20,
+    "KEEPALIVE_EXPIRY": 60.0,
+    "CONNECT_TIMEOUT": 10.0,
+    "READ_TIMEOUT": 120.0,
+    "POOL_TIMEOUT": 30.0,
+    "HTTP2": False,
+    "WARMUP_CONNECTIONS": 2,
+    "WARMUP_TIMEOUT": 5.0,
+}
+
+
+def _cast(raw: str, default: Any) -> Any:
+    if isinstance(default, bool):
+        return raw.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(raw)
+    if isinstance(default, float):
+        return float(raw)
+    return raw
+
+
+def load_transport_settings(provider: str) -> Dict[str, Any]:
+    """Resolve transport settings for a provider from env and defaults."""
+    defaults = {**COMMON_DEFAULTS, **TRANSPORT_DEFAULTS.get(provider, {})}
+    settings: Dict[str, Any] = {}
+    for name, default in defaults.items():
+        raw = os.getenv(f"{provider.upper()}_{name}") or os.getenv(f"LLM_{name}")
+        settings[name] = _cast(raw, default) if raw else default
+    return settings
+
+
+class PoolStats:
+    """
+    Request and connection accounting for one HTTP client.
+
+    A request counts as in flight from the moment it is handed to the
+    transport until its response body is closed (so streamed completions are
+    counted for their whole duration). With HTTP/2 many in-flight requests
+    share one connection, so pool pressure is read from the httpcore pool
+    itself: "connections" open, "busy_connections" serving at least one
+    request ("saturation" is their share of the limit), "queued" requests
+    not yet assigned a connection, and "waited" requests that arrived while
+    every connection was busy and no new one could be opened, i.e. had to
+    queue.
+    """
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.waited = 0
+        self.pool: Any = None
+        self._lock = threading.Lock()
+
+    def attach(self, pool: Any) -> None:
+        """Read connection and queue state from this httpcore pool."""
+        self.pool = pool
+
+    def _pool_state(self) -> Tuple[int, int, int, bool]:
+        """(open connections, busy ones, queued requests, whether a new request would queue)."""
+        if self.pool is None:
+            return 0, 0, 0, False
+        connections = list(getattr(self.pool, "_connections", ()))
+        busy = sum(1 for c in connections if not c.is_idle())
+        queued = sum(1 for r in list(getattr(self.pool, "_requests", ())) if r.is_queued())
+        full = len(connections) >= self.max_connections and not any(c.is_available() for c in connections)
+        return len(connections), busy, queued, full
+
+    def acquire(self) -> None:
+        _, _, queued, full = self._pool_state()
+        with self._lock:
+            if queued or full:
+                self.waited += 1
+            self.in_flight += 1
+            self.requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        connections, busy, queued, _ = self._pool_state()
+        with self._lock:
+            return {
+                "max_connections": self.max_connections,
+                "connections": connections,
+                "busy_connections": busy,
+                "saturation": busy / self.max_connections,
+                "queued": queued,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "requests": self.requests,
+                "waited_for_connection": self.waited,
+            }
+
+
+class _ReleaseOnClose:
+    """Call `release` exactly once."""
+
+    def __init__(self, release: Callable[[], None]):
+        self._release: Optional[Callable[[], None]] = release
+
+    def __call__(self) -> None:
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+class _TrackedAsyncStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: _ReleaseOnClose):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+
+class _TrackedSyncStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, on_close: _ReleaseOnClose):
+        self._stream = stream
+        self._on_close = on_close
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._on_close()
+
+
+class TrackedAsyncTransport(httpx.AsyncBaseTransport):
+    """AsyncHTTPTransport wrapper that feeds PoolStats."""
+
+    def __init__(self, stats: PoolStats, **kwargs: Any):
+        self.stats = stats
+        self._transport = httpx.AsyncHTTPTransport(**kwargs)
+        stats.attach(getattr(self._transport, "_pool", None))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.acquire()
+        on_close = _ReleaseOnClose(self.stats.release)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            on_close()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TrackedAsyncStream(response.stream, on_close),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class TrackedSyncTransport(httpx.BaseTransport):
+    """HTTPTransport wrapper that feeds PoolStats."""
+
+    def __init__(self, stats: PoolStats, **kwargs: Any):
+        self.stats = stats
+        self._transport = httpx.HTTPTransport(**kwargs)
+        stats.attach(getattr(self._transport, "_pool", None))
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.acquire()
+        on_close = _ReleaseOnClose(self.stats.release)
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            on_close()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TrackedSyncStream(response.stream, on_close),
+            extensions=response.extensions,
+        )
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+def _limits_and_timeout(settings: Dict[str, Any]):
+    limits = httpx.Limits(
+        max_connections=settings["POOL_MAX_CONNECTIONS"],
+        max_keepalive_connections=settings["POOL_MAX_KEEPALIVE"],
+        keepalive_expiry=settings["KEEPALIVE_EXPIRY"],
+    )
+    timeout = httpx.Timeout(
+        settings["READ_TIMEOUT"],
+        connect=settings["CONNECT_TIMEOUT"],
+        pool=settings["POOL_TIMEOUT"],
+    )
+    return limits, timeout
+
+
+def build_async_http_client(settings: Dict[str, Any], stats: PoolStats) -> httpx.AsyncClient:
+    limits, timeout = _limits_and_timeout(settings)
+    transport = TrackedAsyncTransport(stats, limits=limits, http2=settings["HTTP2"])
+    return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+
+def build_sync_http_client(settings: Dict[str, Any], stats: PoolStats) -> httpx.Client:
+    limits, timeout = _limits_and_timeout(settings)
+    transport = TrackedSyncTransport(stats, limits=limits, http2=settings["HTTP2"])
+    return httpx.Client(transport=transport, timeout=timeout)
+
+
+async def warmup(
+    http_client: httpx.AsyncClient, base_url: str, connections: int, timeout: float = 5.0
+) -> int:
+    """
+    Open up to `connections` keep-alive connections to base_url so the first
+    real requests skip DNS/TCP/TLS setup. Any HTTP status counts as success.
+    The whole warmup is bounded by `timeout` seconds, so an unreachable
+    base_url cannot hold up startup. Returns the number of distinct
+    connections the requests went over: with HTTP/2 they are multiplexed on
+    one connection, so that is 1. Failures are not raised.
+    """
+    if connections <= 0:
+        return 0
+
+    async def _one() -> Optional[int]:
+        try:
+            response = await http_client.head(base_url, timeout=timeout)
+        except httpx.HTTPError:
+            return None
+        stream = response.extensions.get("network_stream")
+        return id(stream) if stream is not None else id(response)
+
+    tasks = [asyncio.ensure_future(_one()) for _ in range(connections)]
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    return len({task.result() for task in done if task.result() is not None})
@@ -1,15 +1,74 @@
-from fastapi import FastAPI
+import asyncio
+import hmac
+import json
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import Literal, Optional
+from typing import Literal, Optional, Tuple
+
+import drug_db
+import glm_client
+from alias_memory import ALIAS_MEMORY, STATUSES
+from coalesce import SingleFlight, StreamFanout
+from glm_client import ANSWER_CACHE, aask_glm, aask_glm_stream
+from drug_db import find_by_generic_name, find_fuzzy_match, find_local_mentions
+from llm_extract import EXTRACT_CACHE, aextract_drugs
+from llm_cache import canonicalize_question, make_key
+from metrics import ASK_BRANCH, EXTRACTION_SOURCE, REGISTRY, MetricsMiddleware
+
+# "llm": always run the LLM extractor (default).
+# "local_first": try the in-memory dictionary matcher first and only call the
+# LLM extractor when it finds nothing, the hits are ambiguous, or the
+# question has words left over that may name a drug it does not know.
+ASK_PIPELINE = os.getenv("ASK_PIPELINE", "llm").lower()
+if ASK_PIPELINE not in ("llm", "local_first"):
+    raise RuntimeError(f"Unsupported ASK_PIPELINE: {ASK_PIPELINE}")
+
+# Counters for non-empty /ask and /ask/stream requests (coalesced ones
+# included), exposed on /stats
+PIPELINE_STATS = {"ask_requests": 0, "served_without_extraction": 0}
+
+# Request coalescing for /ask and /ask/stream, keyed on canonical question + lang
+ASK_FLIGHTS = SingleFlight()
+STREAM_FLIGHTS = StreamFanout()
+
+# Seconds between checks of data/otc_db.json (and the snippets file) for
+# changes; a change is loaded in a worker thread and swapped in. 0 disables.
+DRUG_DB_WATCH_INTERVAL = float(os.getenv("DRUG_DB_WATCH_INTERVAL", "30"))
+
+# Token for the /admin endpoints (X-Admin-Token header); unset disables them.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+async def _watch_drug_db(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(drug_db.reload)
+        except Exception as e:
+            print(f"[!] 药物库重新加载失败，继续使用版本 {drug_db.CURRENT.version}: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    opened = await glm_client.awarmup()
+    print(f"[*] LLM 连接预热: {opened}/{glm_client.TRANSPORT_SETTINGS['WARMUP_CONNECTIONS']}")
+    watcher = None
+    if DRUG_DB_WATCH_INTERVAL > 0:
+        watcher = asyncio.create_task(_watch_drug_db(DRUG_DB_WATCH_INTERVAL))
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    await glm_client.aclose()
 
-from glm_client import ask_glm
-from drug_db import find_by_generic_name
-from llm_extract import extract_drugs
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Health Information Harmonizer",
     description="AI 健康信息调和器：对用户提供的健康相关文本做信息过滤、解释、调和和风险提示。",
 )
@@ -21,6 +80,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware, paths=["/ask", "/ask/stream", "/stats", "/metrics", "/"])
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
@@ -29,42 +90,225 @@ class Query(BaseModel):
     lang: Optional[Literal["zh", "en"]] = "zh"
 
 
+class AliasReview(BaseModel):
+    raw: str
+    normalized: str
+    status: Literal["pending", "approved", "rejected"]
+
+
 @app.get("/", response_class=FileResponse)
 def index():
     return FileResponse("static/index.html")
 
 
-@app.post("/ask")
-def ask(query: Query):
-    q = query.question.strip()
-    lang = query.lang or "zh"
+@app.get("/stats")
+def stats():
+    total = PIPELINE_STATS["ask_requests"]
+    local = PIPELINE_STATS["served_without_extraction"]
+    return {
+        "pipeline": ASK_PIPELINE,
+        "ask_requests": total,
+        "served_without_extraction": local,
+        "served_without_extraction_ratio": (local / total) if total else 0.0,
+        "extract_cache": EXTRACT_CACHE.snapshot(),
+        "answer_cache": ANSWER_CACHE.snapshot(),
+        "llm_pool": glm_client.POOL_STATS.snapshot(),
+        "drug_db": drug_db.CURRENT.info(),
+        "alias_memory": ALIAS_MEMORY.snapshot(),
+        "coalescing": {
+            "ask": {**ASK_FLIGHTS.stats, "in_flight": ASK_FLIGHTS.in_flight()},
+            "stream": {**STREAM_FLIGHTS.stats, "in_flight": STREAM_FLIGHTS.in_flight()},
+        },
+    }
+
+
+def _collect_gauges():
+    """Expose the current-state /stats values as Prometheus gauges."""
+    db = drug_db.CURRENT
+    yield ("hih_drug_db_info", "Active drug DB version.", {"version": db.version, "storage": db.storage, "loaded_from": db.loaded_from}, 1)
+    yield ("hih_drug_db_records", "Records in the active drug DB.", {}, len(db))
+    yield ("hih_drug_db_generation", "Drug DB reloads since startup.", {}, db.generation)
+    yield ("hih_drug_db_load_seconds", "Time taken to load the active drug DB.", {}, db.load_seconds)
+    aliases = ALIAS_MEMORY.snapshot()
+    for status in STATUSES:
+        yield ("hih_alias_memory_entries", "Learned aliases by review status.", {"status": status}, aliases[status])
+    for cache in (EXTRACT_CACHE, ANSWER_CACHE):
+        yield ("hih_cache_entries", "Cache entries.", {"cache": cache.name}, cache.snapshot()["entries"])
+    pool = glm_client.POOL_STATS.snapshot()
+    for field in ("max_connections", "connections", "busy_connections", "saturation", "queued", "in_flight", "peak_in_flight"):
+        yield (f"hih_llm_pool_{field}", f"LLM HTTP pool {field}.", {}, pool[field])
+    for name, flights in (("ask", ASK_FLIGHTS), ("stream", STREAM_FLIGHTS)):
+        yield ("hih_coalesce_in_flight", "Distinct questions currently in flight.", {"endpoint": name}, flights.in_flight())
+
+
+def _collect_counters():
+    """Expose the running /stats totals as Prometheus counters (per worker)."""
+    yield ("hih_ask_requests_total", "Non-empty /ask questions processed.", {}, PIPELINE_STATS["ask_requests"])
+    yield ("hih_served_without_extraction_total", "Questions answered without the LLM extractor.", {}, PIPELINE_STATS["served_without_extraction"])
+    for cache in (EXTRACT_CACHE, ANSWER_CACHE):
+        snap = cache.snapshot()
+        for field in ("hits", "misses", "disk_hits"):
+            yield (f"hih_cache_{field}_total", f"Cache {field}.", {"cache": cache.name}, snap[field])
+    pool = glm_client.POOL_STATS.snapshot()
+    yield ("hih_llm_pool_requests_total", "LLM HTTP requests sent.", {}, pool["requests"])
+    yield ("hih_llm_pool_waited_for_connection_total", "LLM HTTP requests that queued for a pool connection.", {}, pool["waited_for_connection"])
+    for name, flights in (("ask", ASK_FLIGHTS), ("stream", STREAM_FLIGHTS)):
+        yield ("hih_coalesce_leaders_total", "Requests that ran the pipeline.", {"endpoint": name}, flights.stats["leaders"])
+        yield ("hih_coalesce_coalesced_total", "Requests served by an identical in-flight request.", {"endpoint": name}, flights.stats["coalesced"])
+
+
+REGISTRY.add_collector(_collect_gauges)
+REGISTRY.add_collector(_collect_counters, kind="counter")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+def _check_admin(token: Optional[str]) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@app.post("/admin/reload-db")
+async def admin_reload_db(force: bool = False, x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Reload the drug DB if its files changed (always with ?force=true). The
+    new DB is built in a worker thread; requests already running finish on
+    the previous one. Applies to the worker that receives the call, so with
+    several workers rely on the file watcher or call it once per worker.
+    """
+    _check_admin(x_admin_token)
+    try:
+        reloaded = await asyncio.to_thread(drug_db.reload, force)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed, previous DB kept: {e}")
+    return {"reloaded": reloaded, "drug_db": drug_db.CURRENT.info()}
+
+
+@app.get("/admin/aliases")
+def admin_aliases(
+    status: Optional[Literal["pending", "approved", "rejected"]] = None,
+    limit: int = 100,
+    x_admin_token: Optional[str] = Header(default=None),
+):
+    """Learned (raw -> normalized) aliases with hit counts, most hits first."""
+    _check_admin(x_admin_token)
+    return {"aliases": ALIAS_MEMORY.entries(status=status, limit=limit), **ALIAS_MEMORY.snapshot()}
+
+
+@app.post("/admin/aliases/review")
+async def admin_review_alias(review: AliasReview, x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Approve, reject or reset a learned alias. Approved aliases are matched
+    locally after the next reload, which this call runs for its own worker;
+    other workers pick the change up through the file watcher.
+    """
+    _check_admin(x_admin_token)
+    entry = await asyncio.to_thread(ALIAS_MEMORY.review, review.raw, review.normalized, review.status)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Alias not found")
+    try:
+        reloaded = await asyncio.to_thread(drug_db.reload)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Alias saved, but reload failed: {e}")
+    return {"alias": entry, "reloaded": reloaded}
+
+
+async def _extract(q: str, db: drug_db.DrugDBSnapshot) -> Tuple[list, str]:
+    """
+    Step 1 of /ask: find drug mentions as [{"raw", "normalized"}], and
+    whether they came from the "local" dictionary or the "llm" extractor.
+
+    In "local_first" mode confident dictionary hits are returned directly and
+    the LLM round trip is skipped. Hits are only confident when nothing
+    drug-like is left unmatched, so that unlisted drugs still reach the
+    "Unlisted" note and the guardrail.
+    """
+    if ASK_PIPELINE == "local_first":
+        local = find_local_mentions(q, db=db)
+        if local["mentions"] and not local["ambiguous"] and not local["unmatched"]:
+            EXTRACTION_SOURCE.inc(source="local")
+            return local["mentions"], "local"
+
+    EXTRACTION_SOURCE.inc(source="llm")
+    return await aextract_drugs(q), "llm"
+
 
-    disclaimer = (
+def _disclaimer(lang: str) -> str:
+    return (
         "本回答仅整合公开健康信息作一般性参考，不替代医疗诊断或治疗。"
         if lang == "zh"
         else "This answer harmonizes public health information for general reference only and does not replace professional diagnosis or treatment."
     )
 
+
+async def _plan(q: str, lang: str) -> dict:
+    """
+    Run extraction and DB lookup for a question and decide which case applies.
+
+    Returns the response fields that are known before generation ("echo",
+    "matched_drugs", "recognized_drugs", "disclaimer", "sources"; a drug
+    found by typo correction adds a source with "matched_by": "fuzzy", the
+    query, the name it matched and the similarity) plus:
+
+      - "known":  matched DB records; non-empty means the LLM must answer
+      - "answer": the fixed answer text when no generation is needed
+      - "note":   suffix appended to a generated answer (unlisted drugs)
+      - "db":     the drug DB snapshot "known" was looked up in
+      - "extraction": "local" or "llm", None for an empty question
+    """
+    db = drug_db.CURRENT
+    plan = {
+        "echo": q, "matched_drugs": [], "recognized_drugs": [],
+        "disclaimer": _disclaimer(lang), "sources": [],
+        "known": [], "answer": "", "note": "", "db": db, "extraction": None,
+    }
+
     if not q:
-        msg = "请描述你看到的健康信息。" if lang == "zh" else "Please describe the health information."
-        return {
-            "echo": q, "matched_drugs": [], "recognized_drugs": [],
-            "analysis": {"summary": msg}, "answer": msg,
-            "disclaimer": disclaimer, "sources": []
-        }
+        ASK_BRANCH.inc(branch="empty")
+        plan["answer"] = "请描述你看到的健康信息。" if lang == "zh" else "Please describe the health information."
+        return plan
 
     # 1. Extraction and Normalization
-    extracted = extract_drugs(q)
+    extracted, source = await _extract(q, db)
+    plan["extraction"] = source
     # Collect all normalized names for frontend display
     normalized_names = [item.get("normalized") for item in extracted if item.get("normalized")]
     
     known = []
     unknown = []
+    # (raw, normalized) pairs the LLM resolved but the dictionary alone could
+    # not; kept in the alias memory for review
+    learned = []
+    # Typo corrections, reported in the sources so they can be audited
+    corrected = []
 
     for item in extracted:
         # norm_name is essential for database lookup
         norm_name = item.get("normalized", "").strip().upper()
-        drug_info = find_by_generic_name(norm_name)
+        drug_info = find_by_generic_name(norm_name, db=db)
+        if source == "llm" and drug_info and item.get("raw") and not find_by_generic_name(item["raw"], db=db):
+            learned.append((item["raw"], norm_name))
+        if not drug_info:
+            # Misspelled names ("IBUPROFIN") before falling into Case 2; the
+            # raw mention is tried only when it differs from the normalized name
+            raw_name = (item.get("raw") or "").strip().upper()
+            for name in dict.fromkeys(n for n in (norm_name, raw_name) if n):
+                fuzzy = find_fuzzy_match(name, db=db)
+                if fuzzy:
+                    drug_info = fuzzy["record"]
+                    corrected.append({
+                        "query": name,
+                        "matched": fuzzy["name"],
+                        "generic_name": drug_info["generic_name"],
+                        "similarity": round(fuzzy["similarity"], 3),
+                    })
+                    print(f"[*] 模糊匹配: {name} -> {drug_info['generic_name']} (相似度 {fuzzy['similarity']:.3f})")
+                    break
         
         if drug_info:
             known.append(drug_info)
@@ -72,28 +316,38 @@ def ask(query: Query):
             # Fallback to raw text if normalization failed
             unknown.append(item.get("raw") or norm_name)
 
+    if learned:
+        await asyncio.to_thread(ALIAS_MEMORY.record, learned)
+
     # 2. Case 1: Match found in local DB
     if known:
-        glm_answer = ask_glm(q, known, lang=lang)
+        ASK_BRANCH.inc(branch="known")
         if unknown:
-            note = f"\n\n【额外提示】未收录：{', '.join(set(unknown))}" if lang == "zh" else f"\n\n[Note] Unlisted: {', '.join(set(unknown))}"
-            glm_answer += note
+            plan["note"] = f"\n\n【额外提示】未收录：{', '.join(set(unknown))}" if lang == "zh" else f"\n\n[Note] Unlisted: {', '.join(set(unknown))}"
 
-        return {
-            "echo": q,
+        plan.update({
+            "known": known,
             "matched_drugs": [d["generic_name"] for d in known],
             "recognized_drugs": normalized_names,
-            "analysis": {"summary": glm_answer},
-            "answer": glm_answer,
-            "disclaimer": disclaimer,
             "sources": [
                 {"name": "本地数据库" if lang=="zh" else "Local DB", "note": "匹配受控来源", "url": None},
                 {"name": "AI 调和解释" if lang=="zh" else "AI Harmonization", "note": "基于结构化数据生成", "url": None}
+            ] + [
+                {
+                    "name": "拼写纠正" if lang == "zh" else "Spelling correction",
+                    "note": f"{c['query']} → {c['generic_name']} ({'相似度' if lang == 'zh' else 'similarity'} {c['similarity']:.2f})",
+                    "url": None,
+                    "matched_by": "fuzzy",
+                    **c,
+                }
+                for c in corrected
             ]
-        }
+        })
+        return plan
 
     # 3. Case 2: Recognized but not in DB (Safety Guardrail)
     if unknown:
+        ASK_BRANCH.inc(branch="unknown_guardrail")
         recognized_list = ', '.join(set(unknown))
         if lang == "zh":
             glm_answer = (
@@ -109,20 +363,133 @@ def ask(query: Query):
             )
             source_note = "Semantic recognition complete, no controlled source matched."
 
-        return {
-            "echo": q,
-            "matched_drugs": [],
+        plan.update({
             "recognized_drugs": normalized_names,
-            "analysis": {"summary": glm_answer},
             "answer": glm_answer,
-            "disclaimer": disclaimer,
             "sources": [{"name": "System Safety Guardrail", "note": source_note, "url": None}]
-        }
+        })
+        return plan
 
     # 4. Case 3: No drug-like entities found
-    msg = "未识别到药物名称。" if lang == "zh" else "No drug names recognized."
+    ASK_BRANCH.inc(branch="no_drug")
+    plan["answer"] = "未识别到药物名称。" if lang == "zh" else "No drug names recognized."
+    return plan
+
+
+def _response(plan: dict, answer: str) -> dict:
     return {
-        "echo": q, "matched_drugs": [], "recognized_drugs": [],
-        "analysis": {"summary": msg}, "answer": msg,
-        "disclaimer": disclaimer, "sources": []
-    }
\ No newline at end of file
+        "echo": plan["echo"],
+        "matched_drugs": plan["matched_drugs"],
+        "recognized_drugs": plan["recognized_drugs"],
+        "analysis": {"summary": answer},
+        "answer": answer,
+        "disclaimer": plan["disclaimer"],
+        "sources": plan["sources"],
+    }
+
+
+def _flight_key(q: str, lang: str) -> str:
+    return make_key(lang, canonicalize_question(q))
+
+
+def _count_request(extraction: Optional[str]) -> None:
+    """Count one /ask or /ask/stream request, coalesced or not."""
+    if extraction is None:
+        return
+    PIPELINE_STATS["ask_requests"] += 1
+    if extraction == "local":
+        PIPELINE_STATS["served_without_extraction"] += 1
+
+
+async def _answer(q: str, lang: str) -> Tuple[Optional[str], dict]:
+    plan = await _plan(q, lang)
+    if plan["known"]:
+        answer = await aask_glm(q, plan["known"], lang=lang, db=plan["db"]) + plan["note"]
+    else:
+        answer = plan["answer"]
+    return plan["extraction"], _response(plan, answer)
+
+
+@app.post("/ask")
+async def ask(query: Query):
+    q = query.question.strip()
+    lang = query.lang or "zh"
+
+    # Identical concurrent questions share one extraction + generation; the
+    # flight key is the canonical question, so each caller gets its own echo.
+    extraction, response = await ASK_FLIGHTS.do(_flight_key(q, lang), lambda: _answer(q, lang))
+    _count_request(extraction)
+    return {**response, "echo": q}
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_events(q: str, lang: str):
+    """
+    (event, data) pairs shared by every subscriber of a question. The first
+    is ("extraction", source), which subscribers count and do not send. A
+    failure anywhere in the pipeline ends the stream with an "error" event
+    carrying a fixed message; the exception itself is only logged.
+    """
+    try:
+        plan = await _plan(q, lang)
+        yield "extraction", plan["extraction"]
+        yield "meta", {k: plan[k] for k in ("echo", "matched_drugs", "recognized_drugs", "sources", "disclaimer")}
+
+        if not plan["known"]:
+            yield "delta", {"text": plan["answer"]}
+            yield "done", _response(plan, plan["answer"])
+            return
+
+        parts = []
+        async for delta in aask_glm_stream(q, plan["known"], lang=lang, db=plan["db"]):
+            parts.append(delta)
+            yield "delta", {"text": delta}
+
+        if plan["note"]:
+            parts.append(plan["note"])
+            yield "delta", {"text": plan["note"]}
+        yield "done", _response(plan, "".join(parts))
+    except Exception as e:
+        print(f"[!] 流式回答失败: {type(e).__name__}: {e}")
+        message = "回答生成失败，请稍后重试。" if lang == "zh" else "Failed to generate an answer, please try again."
+        yield "error", {"message": message}
+
+
+async def _subscriber_events(q: str, lang: str):
+    """SSE text of the shared stream for one caller, with that caller's echo."""
+    async for event, data in STREAM_FLIGHTS.subscribe(_flight_key(q, lang), lambda: _stream_events(q, lang)):
+        if event == "extraction":
+            _count_request(data)
+            continue
+        if "echo" in data:
+            data = {**data, "echo": q}
+        yield _sse(event, data)
+
+
+@app.post("/ask/stream")
+async def ask_stream(query: Query):
+    """
+    Server-Sent Events version of /ask.
+
+    Events, in order:
+      - "meta":  echo, matched_drugs, recognized_drugs, sources, disclaimer
+                 (sent as soon as extraction and lookup are done)
+      - "delta": {"text": ...} answer chunks as the model generates them
+      - "done":  the full response object, same shape as /ask
+      - "error": {"message": ...} if extraction or generation fails; may
+                 come before "meta", and ends the stream
+
+    Concurrent identical questions subscribe to the same token stream; a
+    late subscriber first receives the events already sent.
+    """
+    q = query.question.strip()
+    lang = query.lang or "zh"
+
+    return StreamingResponse(
+        _subscriber_events(q, lang),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
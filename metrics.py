@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Minimal Prometheus text-format metrics. Values are per process: with
+# several uvicorn workers, each worker reports its own series.
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+LabelKey = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelKey, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self.header()
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self.header()
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Iterable[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> (per-bucket counts incl. +Inf, sum)
+        self._values: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[idx] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s[0])) for k, (c, s) in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Tuple[Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]], str]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(
+        self, fn: Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]], kind: str = "gauge"
+    ) -> None:
+        """
+        Register a callback producing (name, help, labels, value) samples at
+        scrape time, for state that already lives elsewhere (cache and pool
+        counters). `kind` is the type of every family it yields: "gauge", or
+        "counter" for running totals (names should end in _total).
+        """
+        self._collectors.append((fn, kind))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+
+        # Group collector samples by metric name, as the text format requires
+        families: Dict[str, Tuple[str, str, List[str]]] = {}
+        for collect, kind in self._collectors:
+            for name, help_text, labels, value in collect():
+                names = tuple(sorted(labels))
+                values = tuple(labels[n] for n in names)
+                sample = f"{name}{_format_labels(names, values)} {_format_value(float(value))}"
+                families.setdefault(name, (help_text, kind, []))[2].append(sample)
+        for name, (help_text, kind, samples) in families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "hih_stage_duration_seconds",
+    "Latency of /ask pipeline stages (extract, lookup, generate).",
+    labels=("stage",),
+))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "hih_stage_errors_total", "Exceptions raised by pipeline stages.", labels=("stage",),
+))
+STAGE_IN_FLIGHT = REGISTRY.register(Gauge(
+    "hih_stage_in_flight", "Pipeline stage calls currently running.", labels=("stage",),
+))
+ASK_BRANCH = REGISTRY.register(Counter(
+    "hih_ask_branch_total",
+    "Branch taken by /ask: known, unknown_guardrail, no_drug or empty.",
+    labels=("branch",),
+))
+EXTRACTION_SOURCE = REGISTRY.register(Counter(
+    "hih_extraction_source_total",
+    "Where drug mentions came from: local dictionary or LLM extractor.",
+    labels=("source",),
+))
+CONTEXT_TOKENS = REGISTRY.register(Counter(
+    "hih_context_tokens_total",
+    "Estimated drug-context tokens: used in prompts, dropped by the budget, removed as duplicates.",
+    labels=("kind",),
+))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "hih_http_request_duration_seconds",
+    "HTTP request latency up to the end of the response body.",
+    labels=("path", "status"),
+))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "hih_http_in_flight", "HTTP requests currently being served.", labels=("path",),
+))
+
+
+# ---------------------------------------------------------------------------
+# Per-request stage timings (Server-Timing)
+# ---------------------------------------------------------------------------
+
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration in the histogram and the current request."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def timed(stage: str) -> Callable:
+    """Decorator timing a sync or async function as a pipeline stage."""
+
+    def decorator(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                STAGE_IN_FLIGHT.inc(stage=stage)
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception:
+                    STAGE_ERRORS.inc(stage=stage)
+                    raise
+                finally:
+                    STAGE_IN_FLIGHT.dec(stage=stage)
+                    record_stage(stage, time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            STAGE_IN_FLIGHT.inc(stage=stage)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                STAGE_ERRORS.inc(stage=stage)
+                raise
+            finally:
+                STAGE_IN_FLIGHT.dec(stage=stage)
+                record_stage(stage, time.perf_counter() - start)
+        return wrapper
+
+    return decorator
+
+
+def server_timing_header(timings: Dict[str, float], total: float) -> str:
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: HTTP latency histogram, in-flight gauge and a
+    Server-Timing header with the stages recorded while handling the request.
+
+    For streamed responses the header is sent with the first byte, so it
+    only carries stages that finished before streaming started.
+    """
+
+    def __init__(self, app: Callable, paths: Iterable[str] = ()):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope.get("path", "")
+        label = path if path in self.paths else "other"
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = {"code": "500"}
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = str(message["status"])
+                header = server_timing_header(timings, time.perf_counter() - start)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", header.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(path=label)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec(path=label)
+            HTTP_SECONDS.observe(time.perf_counter() - start, path=label, status=status["code"])
+            _request_timings.reset(token)
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+
+def _is_word_char(ch: str) -> bool:
+    """Same definition as the regex class \\w for str patterns."""
+    return ch.isalnum() or ch == "_"
+
+
+def _is_cjk_char(ch: str) -> bool:
+    """CJK ideographs (and the full-width forms block) have no word spacing."""
+    code = ord(ch)
+    return (
+        0x3400 <= code <= 0x9FFF
+        or 0xF900 <= code <= 0xFAFF
+        or 0xFF00 <= code <= 0xFFEF
+        or 0x20000 <= code <= 0x2FA1F
+    )
+
+
+def _lower_same_length(text: str) -> str:
+    """
+    Lowercase text without changing its length, so that match offsets
+    still point into the original string (a few characters such as 'İ'
+    lowercase to two code points; those are left as-is).
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+class NameAutomaton:
+    """
+    Aho-Corasick automaton over a fixed set of names.
+
+    Built once from (name, payload) pairs; scanning a text is a single pass
+    regardless of how many names are indexed. A name only matches when it is
+    not directly preceded or followed by a word character, which mirrors the
+    regex (?<!\\w)name(?!\\w) used before. Matching is case-insensitive;
+    names shorter than min_length are ignored.
+
+    With cjk_loose=True a neighbouring CJK character does not count as a word
+    character, since Chinese text has no spaces between words: "布洛芬" is
+    found inside "我吃了布洛芬片" and "维c" inside "维c每天", while "tan" is
+    still rejected inside "tangent".
+    """
+
+    def __init__(
+        self,
+        pairs: Iterable[Tuple[str, Any]],
+        min_length: int = 2,
+        cjk_loose: bool = False,
+    ):
+        self.min_length = min_length
+        self.cjk_loose = cjk_loose
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        self.names: List[str] = []
+        self.payloads: List[List[Any]] = []
+
+        name_ids: Dict[str, int] = {}
+        for name, payload in pairs:
+            name = (name or "").lower()
+            if len(name) < min_length:
+                continue
+            pid = name_ids.get(name)
+            if pid is None:
+                pid = len(self.names)
+                name_ids[name] = pid
+                self.names.append(name)
+                self.payloads.append([])
+                self._insert(name, pid)
+            self.payloads[pid].append(payload)
+
+        self._build_fail_links()
+
+    def _insert(self, name: str, pid: int) -> None:
+        state = 0
+        for ch in name:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] = self._out[state] + (pid,)
+
+    def _build_fail_links(self) -> None:
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """
+        Yield (start, end, name_id) for every occurrence that satisfies the
+        word-boundary rule. Overlapping occurrences are all reported.
+        """
+        if not text or not self.names:
+            return
+
+        lowered = _lower_same_length(text)
+        n = len(lowered)
+        goto, fail, out, names = self._goto, self._fail, self._out, self.names
+        if self.cjk_loose:
+            blocks = lambda c: _is_word_char(c) and not _is_cjk_char(c)  # noqa: E731
+        else:
+            blocks = _is_word_char
+        root = goto[0]
+        state = 0
+
+        for i, ch in enumerate(lowered):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0) if state else root.get(ch, 0)
+            if not out[state]:
+                continue
+
+            end = i + 1
+            if end < n and blocks(lowered[end]):
+                continue
+            for pid in out[state]:
+                start = end - len(names[pid])
+                if start > 0 and blocks(lowered[start - 1]):
+                    continue
+                yield start, end, pid
+
+    def matched_ids(self, text: str) -> List[int]:
+        """Return the distinct name ids found in text, in first-seen order."""
+        seen: Dict[int, None] = {}
+        for _, _, pid in self.iter_matches(text):
+            seen.setdefault(pid, None)
+        return list(seen)
+
+
+def boundary_spans(
+    text: str, min_length: int, max_length: int, cjk_loose: bool = False
+) -> Iterator[Tuple[int, int, str]]:
+    """
+    Every (start, end, lowercased substring) of text that NameAutomaton with
+    the same settings could report for a name of that length. Used to look
+    names up in a table (sqlite_store) with the automaton's matching rules.
+    """
+    lowered = _lower_same_length(text or "")
+    n = len(lowered)
+    if cjk_loose:
+        blocks = lambda c: _is_word_char(c) and not _is_cjk_char(c)  # noqa: E731
+    else:
+        blocks = _is_word_char
+    ends = {e for e in range(1, n + 1) if e == n or not blocks(lowered[e])}
+    for start in range(n):
+        if start > 0 and blocks(lowered[start - 1]):
+            continue
+        for end in range(start + min_length, min(n, start + max_length) + 1):
+            if end in ends:
+                yield start, end, lowered[start:end]
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Label text is English while many questions are Chinese. These common
+# question topics are expanded to the English words used in FDA labels so
+# that retrieval still has something to score.
+QUERY_EXPANSIONS: Dict[str, str] = {
+    "孕": "pregnancy pregnant",
+    "怀孕": "pregnancy pregnant",
+    "哺乳": "breast feeding nursing lactation",
+    "喂奶": "breast feeding nursing",
+    "儿童": "children child pediatric",
+    "孩子": "children child pediatric",
+    "小孩": "children child pediatric",
+    "婴儿": "infants infant",
+    "老人": "elderly geriatric older",
+    "老年": "elderly geriatric older",
+    "肝": "liver hepatic",
+    "肾": "kidney renal",
+    "心脏": "heart cardiovascular",
+    "胃": "stomach gastrointestinal ulcer",
+    "出血": "bleeding",
+    "酒": "alcohol alcoholic drinks",
+    "过敏": "allergic allergy hypersensitivity",
+    "副作用": "side effects adverse reactions",
+    "不良反应": "adverse reactions",
+    "剂量": "dose dosage",
+    "吃多少": "dose dosage",
+    "多久": "days duration",
+    "一起": "interactions taking other drugs",
+    "同时": "interactions taking other drugs",
+    "禁忌": "contraindicated contraindications",
+    "发烧": "fever",
+    "发热": "fever",
+    "头痛": "headache",
+    "疼": "pain",
+    "痛": "pain",
+    "感冒": "cold flu",
+    "咳嗽": "cough",
+    "过量": "overdose",
+    "血压": "blood pressure hypertension",
+    "糖尿病": "diabetes",
+    "哮喘": "asthma",
+    "困": "drowsiness drowsy sleepy",
+    "开车": "driving machinery drowsiness",
+}
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i if in is it "
+    "its me my of on or should that the this to was what when which while who "
+    "will with you your".split()
+)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_CJK_RUN_RE = re.compile(r"[\u3400-\u9fff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased English words (stopwords removed, plural -s stripped) plus
+    CJK character bigrams.
+    """
+    text = (text or "").lower()
+    tokens = []
+    for word in _WORD_RE.findall(text):
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    for run in _CJK_RUN_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def expand_query(question: str) -> str:
+    extra = [en for zh, en in QUERY_EXPANSIONS.items() if zh in (question or "")]
+    return " ".join([question or ""] + extra)
+
+
+class PassageIndex:
+    """
+    BM25 index over sentence-level passages of every record's label text.
+
+    Postings are stored as flat numpy arrays (CSR layout: term -> passage
+    ids and term frequencies), so scoring a query is a handful of vectorized
+    adds. Passages of one record are contiguous, which makes restricting a
+    search to the matched drugs a slice.
+
+    Records are keyed by identity. `sources` (parallel to `records`, default
+    the records themselves) supplies the text to index. With keep_text=False
+    the sentences are not kept; passages_of re-derives them from the full
+    record, so lazily loaded DBs keep only the postings resident.
+    """
+
+    def __init__(
+        self,
+        records: List[Dict[str, Any]],
+        sections_fn: Callable[[Dict[str, Any]], Dict[str, List[str]]],
+        k1: float = 1.2,
+        b: float = 0.75,
+        keep_text: bool = True,
+        sources: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.k1 = k1
+        self.b = b
+        self.sections_fn = sections_fn
+        # (section, sentence) per passage, or None when keep_text is False
+        self.passages: Optional[List[Tuple[str, str]]] = [] if keep_text else None
+        self.records = list(records)
+        self.ranges: List[Tuple[int, int]] = []
+
+        vocab: Dict[str, int] = {}
+        rows: List[int] = []
+        cols: List[int] = []
+        doc_len: List[int] = []
+
+        for source in (sources if sources is not None else records):
+            start = len(doc_len)
+            for section, sentences in sections_fn(source).items():
+                for sentence in sentences:
+                    pid = len(doc_len)
+                    if self.passages is not None:
+                        self.passages.append((section, sentence))
+                    tokens = tokenize(sentence)
+                    doc_len.append(len(tokens))
+                    for tok in tokens:
+                        rows.append(vocab.setdefault(tok, len(vocab)))
+                        cols.append(pid)
+            self.ranges.append((start, len(doc_len)))
+        self._index_records()
+
+        self.vocab = vocab
+        self.doc_len = np.asarray(doc_len, dtype=np.float32)
+        self.avg_len = float(self.doc_len.mean()) if len(doc_len) else 0.0
+
+        # Sort (term, passage) pairs and collapse duplicates into tf counts
+        width = max(len(doc_len), 1)
+        pairs = np.asarray(rows, dtype=np.int64) * width + np.asarray(cols, dtype=np.int64)
+        uniq, tf = np.unique(pairs, return_counts=True)
+        terms = uniq // width
+        self.post_doc = (uniq % width).astype(np.int32)
+        self.post_tf = tf.astype(np.float32)
+        self.term_ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.add.at(self.term_ptr, terms + 1, 1)
+        self.term_ptr = np.cumsum(self.term_ptr)
+
+        df = np.diff(self.term_ptr).astype(np.float32)
+        n = float(len(doc_len))
+        self.idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    def _index_records(self) -> None:
+        # Records are looked up by identity; ids are not stable across
+        # pickling, so this map is rebuilt on load.
+        self.record_range: Dict[int, Tuple[int, int]] = {
+            id(record): span for record, span in zip(self.records, self.ranges)
+        }
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__)
+        del state["record_range"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._index_records()
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    def has_record(self, record: Dict[str, Any]) -> bool:
+        return id(record) in self.record_range
+
+    def passages_of(
+        self, record: Dict[str, Any], pids: List[int], source: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[str, str]]:
+        """
+        (section, sentence) of passage ids returned by search(..., record, ...).
+        An index without kept text reads the sentences from `source`, the
+        full version of `record`.
+        """
+        if self.passages is not None:
+            return [self.passages[pid] for pid in pids]
+        start = self.record_range[id(record)][0]
+        flat = [
+            (section, sentence)
+            for section, sentences in self.sections_fn(source if source is not None else record).items()
+            for sentence in sentences
+        ]
+        return [flat[pid - start] for pid in pids]
+
+    def search(self, question: str, record: Dict[str, Any], k: int) -> List[Tuple[int, float]]:
+        """
+        Return up to k (passage_id, score) pairs of `record` with a positive
+        BM25 score for the (expanded) question, best first.
+        """
+        span = self.record_range.get(id(record))
+        if span is None or span[0] == span[1]:
+            return []
+        start, end = span
+
+        term_ids = {self.vocab[t] for t in tokenize(expand_query(question)) if t in self.vocab}
+        if not term_ids:
+            return []
+
+        # Only the record's passages are scored: each term's postings are
+        # sorted by passage id, so the ones in [start, end) are one slice.
+        local = np.zeros(end - start, dtype=np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[start:end] / max(self.avg_len, 1e-6))
+        for t in term_ids:
+            lo, hi = self.term_ptr[t], self.term_ptr[t + 1]
+            postings = self.post_doc[lo:hi]
+            lo, hi = lo + np.searchsorted(postings, start), lo + np.searchsorted(postings, end)
+            if lo == hi:
+                continue
+            docs = self.post_doc[lo:hi] - start
+            tf = self.post_tf[lo:hi]
+            local[docs] += self.idf[t] * tf * (self.k1 + 1.0) / (tf + norm[docs])
+
+        if k < len(local):
+            top = np.argpartition(-local, k)[:k]
+        else:
+            top = np.arange(len(local))
+        top = top[np.argsort(-local[top], kind="stable")]
+        return [(start + int(i), float(local[i])) for i in top if local[i] > 0]
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Label text fields. In lazy storage they live only in the records file;
+# the in-memory records keep names, aliases and category.
+HEAVY_FIELDS = ("indications", "contraindications", "cautions", "age_note", "important_warnings")
+
+RECORD_FILE_MAGIC = b"HIHREC\x01"
+
+
+def file_info(path: str) -> Dict[str, Any]:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def split_record(record: Dict[str, Any], fields: Sequence[str] = HEAVY_FIELDS) -> Dict[str, Any]:
+    """The record without its heavy fields."""
+    return {k: v for k, v in record.items() if k not in fields}
+
+
+def write_record_file(
+    path: str, records: List[Dict[str, Any]], fields: Sequence[str] = HEAVY_FIELDS
+) -> List[int]:
+    """
+    Write the heavy fields of every record as one compact JSON object per
+    record, back to back after a magic header. Returns n + 1 byte offsets:
+    record i spans offsets[i]:offsets[i + 1].
+    """
+    offsets = [len(RECORD_FILE_MAGIC)]
+    # Several workers may rebuild the file at once; each writes its own tmp.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(RECORD_FILE_MAGIC)
+        for record in records:
+            heavy = {k: record[k] for k in fields if k in record}
+            data = json.dumps(heavy, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    os.replace(tmp, path)
+    return offsets
+
+
+class RecordStore:
+    """
+    Heavy record fields read on demand from a memory-mapped records file
+    (see write_record_file). Only the byte offsets are resident; the pages of
+    the file are shared by every worker through the OS page cache and can be
+    dropped under memory pressure.
+
+    The last `cache_size` hydrated records are kept decoded in an LRU, so
+    follow-up questions about the same drugs do not decode them again.
+    """
+
+    def __init__(self, path: str, offsets: List[int], cache_size: int = 64):
+        self.path = path
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.cache_size = cache_size
+        self.source = file_info(path)
+        self._init_runtime()
+
+    def _init_runtime(self) -> None:
+        self._mm: Optional[mmap.mmap] = None
+        self._cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0}
+
+    # The map, cache and lock are per process; only path and offsets are pickled.
+    def __getstate__(self) -> Dict[str, Any]:
+        return {k: self.__dict__[k] for k in ("path", "offsets", "cache_size", "source")}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._init_runtime()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def open(self) -> mmap.mmap:
+        """Map the records file (done on first use if not called)."""
+        if self._mm is None:
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if mm[:len(RECORD_FILE_MAGIC)] != RECORD_FILE_MAGIC or len(mm) != int(self.offsets[-1]):
+                mm.close()
+                raise ValueError(f"Records file does not match its index: {self.path}")
+            self._mm = mm
+        return self._mm
+
+    def fields(self, pos: int) -> Dict[str, Any]:
+        """Decode the heavy fields of record `pos` from the file (no caching)."""
+        mm = self.open()
+        return json.loads(mm[int(self.offsets[pos]):int(self.offsets[pos + 1])])
+
+    def hydrate(self, pos: int, record: Dict[str, Any]) -> Dict[str, Any]:
+        """`record` (the in-memory part of record `pos`) merged with its heavy fields."""
+        with self._lock:
+            full = self._cache.get(pos)
+            if full is not None:
+                self._cache.move_to_end(pos)
+                self.stats["hits"] += 1
+                return full
+            self.stats["misses"] += 1
+            full = {**record, **self.fields(pos)}
+            if self.cache_size > 0:
+                self._cache[pos] = full
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return full
+
+    def close(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Write the binary drug DB snapshot (data/otc_db.snapshot.bin) from
+data/otc_db.json.
+
+The snapshot holds the records plus every index drug_db builds from them,
+so web workers load it with one unpickle instead of parsing the JSON and
+rebuilding indexes. drug_db falls back to the JSON whenever the snapshot is
+missing or stale (otc_db.json size/mtime or index code changed), so run
+this after every DB update.
+
+With DRUG_DB_STORAGE=lazy the label text is written to
+data/otc_db.records.bin instead and the snapshot keeps only names, aliases,
+category and byte offsets; run it with the same setting the app uses.
+"""
+
+import logging
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+import drug_db  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+def setup_logging(verbose: bool = False) -> None:
+    level = logging.DEBUG if verbose else logging.INFO
+    logging.basicConfig(
+        level=level,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
+
+
+def build_snapshot(verbose: bool = False, path: str = drug_db.SNAPSHOT_PATH) -> None:
+    setup_logging(verbose)
+    if not path:
+        raise SystemExit("DRUG_DB_SNAPSHOT_PATH is empty; snapshots are disabled")
+
+    start = time.perf_counter()
+    snapshot = drug_db.write_snapshot(path)
+    logger.info(
+        "Wrote snapshot of %d records to %s in %.1f ms (%d bytes)",
+        len(snapshot.db), path, (time.perf_counter() - start) * 1000, Path(path).stat().st_size,
+    )
+
+    start = time.perf_counter()
+    loaded = drug_db._read_snapshot(path)
+    if loaded is None:
+        raise SystemExit("Snapshot could not be read back")
+    logger.info("Snapshot loads in %.1f ms", (time.perf_counter() - start) * 1000)
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the binary drug DB snapshot.")
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--output", default=drug_db.SNAPSHOT_PATH, help="snapshot path")
+    args = parser.parse_args()
+    build_snapshot(verbose=args.verbose, path=args.output)
+
+
+if __name__ == "__main__":
+    main()
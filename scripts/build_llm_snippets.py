@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Generate compact English and Chinese summaries of every record in
+data/otc_db.json, once, with the configured LLM (glm_client).
+
+Input:
+  data/otc_db.json
+
+Output:
+  data/otc_db_snippets.json
+    {
+      "IBUPROFEN": {
+        "hash": "...",            # drug_context.record_content_hash(record)
+        "prompt_version": "...",
+        "model": "...",
+        "en": "...",
+        "zh": "..."
+      },
+      ...
+    }
+
+At answer time the context builder uses the snippet for the question's
+language instead of the raw label fields, so the English label text is not
+re-read and re-translated on every request. Snippets whose hash no longer
+matches the record are ignored there and regenerated here.
+
+The run is resumable: records that already have an up-to-date snippet are
+skipped, and progress is written to disk every --save-every records.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = BASE_DIR / "data"
+STRUCTURED_DB_PATH = DATA_DIR / "otc_db.json"
+SNIPPETS_PATH = DATA_DIR / "otc_db_snippets.json"
+
+sys.path.insert(0, str(BASE_DIR))
+
+from drug_context import SNIPPET_SOURCE_FIELDS, record_content_hash  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+SNIPPET_PROMPT = """You summarize US FDA OTC drug label text for a health Q&A assistant.
+Given one drug record (JSON), write two compact summaries of what a consumer
+must know: what it is used for, who must not use it, the most important
+warnings (boxed warnings first), and age-related notes.
+
+Rules:
+- Use only facts present in the record. Do not add doses or advice that is not there.
+- "en": plain English, at most 120 words.
+- "zh": 简体中文，不超过 200 字，药名首次出现时保留英文通用名。
+- Output ONLY a JSON object: {"en": "...", "zh": "..."}
+"""
+
+PROMPT_VERSION = hashlib.sha256(SNIPPET_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+def setup_logging(verbose: bool = False) -> None:
+    level = logging.DEBUG if verbose else logging.INFO
+    logging.basicConfig(
+        level=level,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
+
+
+def load_existing() -> Dict[str, Dict[str, Any]]:
+    if not SNIPPETS_PATH.exists():
+        return {}
+    data = json.loads(SNIPPETS_PATH.read_text(encoding="utf-8"))
+    return data if isinstance(data, dict) else {}
+
+
+def save_snippets(snippets: Dict[str, Dict[str, Any]]) -> None:
+    """Write atomically so an interrupted run never leaves a truncated file."""
+    tmp = SNIPPETS_PATH.with_suffix(".json.tmp")
+    tmp.write_text(
+        json.dumps(snippets, ensure_ascii=False, indent=2, sort_keys=True),
+        encoding="utf-8",
+    )
+    os.replace(tmp, SNIPPETS_PATH)
+
+
+def is_current(entry: Optional[Dict[str, Any]], record: Dict[str, Any]) -> bool:
+    return bool(
+        entry
+        and entry.get("hash") == record_content_hash(record)
+        and entry.get("prompt_version") == PROMPT_VERSION
+        and entry.get("en")
+        and entry.get("zh")
+    )
+
+
+def parse_snippet(content: str) -> Optional[Dict[str, str]]:
+    text = (content or "").strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.lower().startswith("json"):
+            text = text[4:]
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    en, zh = str(data.get("en") or "").strip(), str(data.get("zh") or "").strip()
+    if not en or not zh:
+        return None
+    return {"en": en, "zh": zh}
+
+
+def summarize(record: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    from glm_client import DEFAULT_MODEL, client
+
+    source = {k: record.get(k) for k in SNIPPET_SOURCE_FIELDS}
+    resp = client.chat.completions.create(
+        model=DEFAULT_MODEL,
+        messages=[
+            {"role": "system", "content": SNIPPET_PROMPT},
+            {"role": "user", "content": json.dumps(source, ensure_ascii=False)},
+        ],
+        temperature=0.0,
+    )
+    return parse_snippet(resp.choices[0].message.content)
+
+
+def build_snippets(
+    verbose: bool = False,
+    concurrency: int = 4,
+    save_every: int = 10,
+    limit: Optional[int] = None,
+) -> None:
+    setup_logging(verbose)
+
+    if not STRUCTURED_DB_PATH.exists():
+        raise SystemExit(f"Structured DB not found at {STRUCTURED_DB_PATH}")
+    records: List[Dict[str, Any]] = json.loads(STRUCTURED_DB_PATH.read_text(encoding="utf-8"))
+
+    from glm_client import DEFAULT_MODEL
+
+    snippets = load_existing()
+    # Lookups return the first record per generic_name; later duplicates
+    # fail the hash check at answer time and use their raw fields.
+    todo: List[Dict[str, Any]] = []
+    names = set()
+    for record in records:
+        name = record.get("generic_name") or ""
+        if not name or name in names:
+            continue
+        names.add(name)
+        if not is_current(snippets.get(name), record):
+            todo.append(record)
+    up_to_date = len(names) - len(todo)
+    if limit is not None:
+        todo = todo[:limit]
+
+    logger.info(
+        "%d records, %d up to date, %d to summarize (concurrency=%d)",
+        len(names), up_to_date, len(todo), concurrency,
+    )
+
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        futures = {pool.submit(summarize, r): r for r in todo}
+        for future in as_completed(futures):
+            record = futures[future]
+            name = record["generic_name"]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = None
+                logger.warning("Summarizing %s failed: %s", name, e)
+            if result is None:
+                failed += 1
+                logger.warning("No usable snippet for %s", name)
+                continue
+            snippets[name] = {
+                "hash": record_content_hash(record),
+                "prompt_version": PROMPT_VERSION,
+                "model": DEFAULT_MODEL,
+                **result,
+            }
+            done += 1
+            logger.info("Summarized %d/%d: %s", done + failed, len(todo), name)
+            if done % save_every == 0:
+                save_snippets(snippets)
+
+    # Drop snippets of records that left the DB
+    for name in list(snippets):
+        if name not in names:
+            del snippets[name]
+    save_snippets(snippets)
+    logger.info("Wrote %d snippets to %s (%d failed)", len(snippets), SNIPPETS_PATH, failed)
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Build bilingual LLM-ready summaries of the structured OTC DB."
+    )
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel LLM requests")
+    parser.add_argument("--save-every", type=int, default=10, help="checkpoint interval (records)")
+    parser.add_argument("--limit", type=int, default=None, help="summarize at most N records")
+    args = parser.parse_args()
+    build_snippets(
+        verbose=args.verbose,
+        concurrency=args.concurrency,
+        save_every=max(args.save_every, 1),
+        limit=args.limit,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -20,26 +20,70 @@ Each record in otc_db.json looks like:
 
 No Chinese data is involved. This DB is purely based on openFDA.
 
+Requests run on a thread pool sharing one pooled requests.Session, paced by
+a token bucket (openFDA allows 240 requests per minute per IP or key, and
+1,000 per day without a key). 429 and 5xx responses are retried with
+exponential backoff, honoring Retry-After. The API base URL can be pointed
+at a local stand-in server with --base-url or OPENFDA_BASE_URL.
+
+Every finished generic is appended to a JSONL checkpoint
+(data/otc_db_openfda_raw.checkpoint.jsonl). A run that crashed, was
+interrupted or had failed fetches is marked unfinished in the state file,
+together with its mode, and the next run of the same mode resumes it;
+otherwise a run fetches every name again (names that fail keep their
+previous record). --fresh always starts over.
+With --incremental, names already in the checkpoint are re-fetched only if
+openFDA lists a label for them whose set_id/effective_time differs from the
+stored one (one paged effective_time range query since the last complete
+run), plus any new seed names. The changed names are kept in the state
+until they have been fetched, so a resumed incremental run still re-fetches
+them.
+
+Names are looked up --batch-size at a time: one OR-combined search per
+batch and endpoint, with results assigned back to the seed name that
+exactly equals a result's generic or brand name. Names without such a
+result (ambiguous, or pushed off the page by other names' labels) fall
+back to the single-name query.
+
 openFDA terms (CC0):
 https://open.fda.gov/terms/
 """
 
 import json
 import os
+import random
+import threading
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 SEED_PATH = DATA_DIR / "common_generics_en.txt"
 OTC_DB_PATH = DATA_DIR / "otc_db_openfda_raw.json"
+CHECKPOINT_PATH = DATA_DIR / "otc_db_openfda_raw.checkpoint.jsonl"
+STATE_PATH = DATA_DIR / "otc_db_openfda_raw.state.json"
+
+OPENFDA_BASE_URL = os.getenv("OPENFDA_BASE_URL", "https://api.fda.gov")
+OPENFDA_LABEL_PATH = "/drug/label.json"
+OPENFDA_NDC_PATH = "/drug/ndc.json"
+
+# https://open.fda.gov/apis/authentication/
+OPENFDA_RATE_PER_MINUTE = 240
+OPENFDA_DAILY_LIMIT_NO_KEY = 1000
+# Largest page size and skip offset openFDA accepts
+OPENFDA_MAX_LIMIT = 1000
+OPENFDA_MAX_SKIP = 25000
 
-OPENFDA_LABEL_URL = "https://api.fda.gov/drug/label.json"
-OPENFDA_NDC_URL = "https://api.fda.gov/drug/ndc.json"
+# Name fields searched per endpoint
+LABEL_NAME_FIELDS = ("openfda.generic_name", "openfda.brand_name")
+NDC_NAME_FIELDS = ("generic_name", "brand_name")
 
 logger = logging.getLogger(__name__)
 
@@ -52,49 +96,374 @@ def setup_logging(verbose: bool = False) -> None:
     )
 
 
-def safe_get(url: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    """Wrapper around requests.get with basic error handling."""
-    try:
-        res = requests.get(url, params=params, timeout=15)
-        if res.status_code != 200:
-            logger.warning("openFDA request failed: %s (status=%s)", res.url, res.status_code)
-            return None
-        return res.json()
-    except Exception as e:
-        logger.warning("HTTP error while fetching %s: %s", url, e)
-        return None
-
-
-def query_openfda_label(generic: str, api_key: Optional[str]) -> Optional[Dict[str, Any]]:
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate_per_minute` tokens refill continuously,
+    up to `burst` stored. acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class OpenFDAError(Exception):
+    """A request that still failed after retries (not a 'no match')."""
+
+
+class OpenFDAClient:
+    """
+    Rate-limited openFDA HTTP client with pooled keep-alive connections and
+    retries on 429/5xx and connection errors. Safe to share across threads.
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        base_url: str = OPENFDA_BASE_URL,
+        api_key: Optional[str] = None,
+        rate_per_minute: float = OPENFDA_RATE_PER_MINUTE,
+        pool_size: int = 8,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        timeout: float = 15.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.bucket = TokenBucket(rate_per_minute, burst=pool_size)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    def get(self, path: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        GET base_url + path. Returns the JSON body, or None when openFDA has
+        no match (404). Raises OpenFDAError when the request still fails
+        after retries, so callers can leave that generic for the next run.
+        """
+        params = dict(params)
+        if self.api_key:
+            params["api_key"] = self.api_key
+        url = self.base_url + path
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            self._count("requests")
+            retry_after = None
+            try:
+                res = self.session.get(url, params=params, timeout=self.timeout)
+                if res.status_code == 200:
+                    return res.json()
+                if res.status_code == 404:
+                    return None
+                if res.status_code not in self.RETRY_STATUS:
+                    self._count("failures")
+                    raise OpenFDAError(f"{res.url} (status={res.status_code})")
+                retry_after = res.headers.get("Retry-After")
+                reason = f"status={res.status_code}"
+            except (requests.ConnectionError, requests.Timeout, ValueError) as e:
+                reason = str(e)
+
+            if attempt == self.max_retries:
+                self._count("failures")
+                raise OpenFDAError(f"{url} gave up after {attempt + 1} attempts ({reason})")
+            delay = self._delay(attempt, retry_after)
+            logger.debug("Retrying %s in %.1fs (%s)", url, delay, reason)
+            self._count("retries")
+            time.sleep(delay)
+        raise OpenFDAError(url)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def _name_search(fields: Tuple[str, ...], names: List[str]) -> str:
+    return " OR ".join(f'{field}:"{name.replace(chr(34), "")}"' for name in names for field in fields)
+
+
+def _result_names(result: Dict[str, Any], fields: Tuple[str, ...]) -> List[str]:
+    names = []
+    for field in fields:
+        value: Any = result
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        if isinstance(value, list):
+            names.extend(str(v).lower() for v in value)
+        elif value:
+            names.append(str(value).lower())
+    return names
+
+
+def query_openfda_label(client: OpenFDAClient, generic: str) -> Optional[Dict[str, Any]]:
     params: Dict[str, Any] = {
-        "search": f'openfda.generic_name:"{generic}" OR openfda.brand_name:"{generic}"',
+        "search": _name_search(LABEL_NAME_FIELDS, [generic]),
         "limit": 1,
     }
-    if api_key:
-        params["api_key"] = api_key
 
     logger.info("Label lookup: %s", generic)
-    data = safe_get(OPENFDA_LABEL_URL, params)
+    data = client.get(OPENFDA_LABEL_PATH, params)
     if data and data.get("results"):
         return data["results"][0]
     return None
 
 
-def query_openfda_ndc(generic: str, api_key: Optional[str]) -> Optional[Dict[str, Any]]:
+def query_openfda_ndc(client: OpenFDAClient, generic: str) -> Optional[Dict[str, Any]]:
     params: Dict[str, Any] = {
-        "search": f'generic_name:"{generic}" OR brand_name:"{generic}"',
+        "search": _name_search(NDC_NAME_FIELDS, [generic]),
         "limit": 1,
     }
-    if api_key:
-        params["api_key"] = api_key
 
     logger.info("NDC lookup: %s", generic)
-    data = safe_get(OPENFDA_NDC_URL, params)
+    data = client.get(OPENFDA_NDC_PATH, params)
     if data and data.get("results"):
         return data["results"][0]
     return None
 
 
+def query_openfda_batch(
+    client: OpenFDAClient,
+    path: str,
+    fields: Tuple[str, ...],
+    generics: List[str],
+    per_name: int = 4,
+) -> Tuple[Dict[str, Optional[Dict[str, Any]]], List[str]]:
+    """
+    Look up many names with one OR-combined search and demultiplex the
+    results: each name gets the first (best-scored) result whose generic or
+    brand name equals it. Returns (name.lower() -> result, names to look up
+    one by one). If the page holds every result, names that no result's
+    names even contain are confirmed misses rather than fallbacks.
+    """
+    params: Dict[str, Any] = {
+        "search": _name_search(fields, generics),
+        "limit": min(per_name * len(generics), OPENFDA_MAX_LIMIT),
+    }
+    logger.info("Batch lookup %s: %d names", path, len(generics))
+    data = client.get(path, params)
+    if not data or not data.get("results"):
+        return {g.lower(): None for g in generics}, []
+
+    wanted = {g.lower() for g in generics}
+    found: Dict[str, Optional[Dict[str, Any]]] = {}
+    seen_names = []
+    for result in data["results"]:
+        for name in _result_names(result, fields):
+            seen_names.append(name)
+            if name in wanted and name not in found:
+                found[name] = result
+
+    total = ((data.get("meta") or {}).get("results") or {}).get("total", 0)
+    complete = total <= len(data["results"])
+    unresolved = []
+    for g in generics:
+        key = g.lower()
+        if key in found:
+            continue
+        if complete and not any(key in name for name in seen_names):
+            found[key] = None
+        else:
+            unresolved.append(g)
+    return found, unresolved
+
+
+def fetch_generic(client: OpenFDAClient, generic: str) -> Dict[str, Any]:
+    return {
+        "generic_query": generic,
+        "label_raw": query_openfda_label(client, generic),
+        "ndc_raw": query_openfda_ndc(client, generic),
+    }
+
+
+def fetch_batch(client: OpenFDAClient, generics: List[str]) -> List[Dict[str, Any]]:
+    """fetch_generic for a batch of names, using batched queries where possible."""
+    if len(generics) == 1:
+        return [fetch_generic(client, generics[0])]
+
+    labels, label_rest = query_openfda_batch(client, OPENFDA_LABEL_PATH, LABEL_NAME_FIELDS, generics)
+    ndcs, ndc_rest = query_openfda_batch(client, OPENFDA_NDC_PATH, NDC_NAME_FIELDS, generics)
+    logger.debug(
+        "Batch of %d: %d label and %d NDC names need single lookups",
+        len(generics), len(label_rest), len(ndc_rest),
+    )
+    for generic in label_rest:
+        labels[generic.lower()] = query_openfda_label(client, generic)
+    for generic in ndc_rest:
+        ndcs[generic.lower()] = query_openfda_ndc(client, generic)
+
+    return [
+        {
+            "generic_query": g,
+            "label_raw": labels.get(g.lower()),
+            "ndc_raw": ndcs.get(g.lower()),
+        }
+        for g in generics
+    ]
+
+
+class Checkpoint:
+    """
+    Append-only JSONL of fetched records, one line per generic_query; a
+    later line for the same name replaces an earlier one. A torn last line
+    (crash mid-write) is ignored.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        records: Dict[str, Dict[str, Any]] = {}
+        if not self.path.exists():
+            return records
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Ignoring unreadable checkpoint line in %s", self.path)
+                    continue
+                records[str(record.get("generic_query", "")).lower()] = record
+        return records
+
+    def append(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+
+    def compact(self, records: List[Dict[str, Any]]) -> None:
+        """Rewrite the checkpoint with exactly `records` (atomically)."""
+        tmp = self.path.with_suffix(".jsonl.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+
+    def reset(self) -> None:
+        if self.path.exists():
+            self.path.unlink()
+
+
+def load_state() -> Dict[str, Any]:
+    if not STATE_PATH.exists():
+        return {}
+    return json.loads(STATE_PATH.read_text(encoding="utf-8"))
+
+
+def save_state(state: Dict[str, Any]) -> None:
+    STATE_PATH.write_text(json.dumps(state, indent=2), encoding="utf-8")
+
+
+def load_previous_db() -> Dict[str, Dict[str, Any]]:
+    """Records of the last written DB by lowercased generic_query, fallback for failed fetches."""
+    if not OTC_DB_PATH.exists():
+        return {}
+    try:
+        records = json.loads(OTC_DB_PATH.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning("Ignoring unreadable previous DB %s: %s", OTC_DB_PATH, e)
+        return {}
+    return {
+        str(r.get("generic_query", "")).lower(): r
+        for r in records
+        if isinstance(r, dict) and (r.get("label_raw") or r.get("ndc_raw"))
+    }
+
+
+def _label_names(label: Dict[str, Any]) -> List[str]:
+    ofd = label.get("openfda") or {}
+    return [n.lower() for key in ("generic_name", "brand_name") for n in ofd.get(key) or []]
+
+
+def labels_changed_since(client: OpenFDAClient, since: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Labels whose effective_time is on or after `since` (YYYYMMDD), paged.
+    Returns None when there are more than openFDA lets us page through, in
+    which case the caller should treat everything as changed.
+    """
+    params: Dict[str, Any] = {
+        "search": f"effective_time:[{since} TO 99991231]",
+        "limit": OPENFDA_MAX_LIMIT,
+    }
+    labels: List[Dict[str, Any]] = []
+    skip = 0
+    while True:
+        data = client.get(OPENFDA_LABEL_PATH, {**params, "skip": skip})
+        if not data:
+            return labels
+        labels.extend(data.get("results") or [])
+        total = ((data.get("meta") or {}).get("results") or {}).get("total", 0)
+        skip += OPENFDA_MAX_LIMIT
+        if skip >= total:
+            return labels
+        if skip > OPENFDA_MAX_SKIP:
+            logger.warning("%d labels changed since %s; too many to page, refreshing all", total, since)
+            return None
+
+
+def stale_generics(
+    done: Dict[str, Dict[str, Any]], changed: Optional[List[Dict[str, Any]]]
+) -> List[str]:
+    """
+    Checkpointed names to re-fetch: their stored label's set_id shows up
+    with a different effective_time, or a label with another set_id (or
+    any label, for stored misses) now matches the name.
+    """
+    if changed is None:
+        return [r["generic_query"] for r in done.values()]
+
+    by_set_id = {lbl.get("set_id"): lbl.get("effective_time") for lbl in changed}
+    by_name: Dict[str, set] = {}
+    for lbl in changed:
+        for name in _label_names(lbl):
+            by_name.setdefault(name, set()).add(lbl.get("set_id"))
+
+    stale = []
+    for key, record in done.items():
+        label = record.get("label_raw") or {}
+        set_id = label.get("set_id")
+        if set_id in by_set_id and by_set_id[set_id] != label.get("effective_time"):
+            stale.append(record["generic_query"])
+        elif by_name.get(key, set()) - {set_id}:
+            stale.append(record["generic_query"])
+    return stale
+
+
 def read_seed_list() -> List[str]:
     if not SEED_PATH.exists():
         raise SystemExit(f"Seed list not found at {SEED_PATH}")
@@ -110,33 +479,144 @@ def read_seed_list() -> List[str]:
     return result
 
 
-def build_db(verbose: bool = False, api_key: Optional[str] = None) -> None:
+def build_db(
+    verbose: bool = False,
+    api_key: Optional[str] = None,
+    base_url: str = OPENFDA_BASE_URL,
+    workers: int = 8,
+    rate_per_minute: float = OPENFDA_RATE_PER_MINUTE,
+    incremental: bool = False,
+    fresh: bool = False,
+    lookback_days: int = 30,
+    batch_size: int = 25,
+) -> None:
     setup_logging(verbose)
 
     generics = read_seed_list()
     logger.info("Loaded %d generic names from %s", len(generics), SEED_PATH)
 
-    records: List[Dict[str, Any]] = []
-
-    for idx, generic in enumerate(generics):
-        logger.info("Processing %d/%d: %s", idx + 1, len(generics), generic)
-
-        label = query_openfda_label(generic, api_key=api_key)
-        time.sleep(0.5)  # be gentle without an API key
-        ndc = query_openfda_ndc(generic, api_key=api_key)
-        time.sleep(0.5)
-
-        records.append({
-            "generic_query": generic,
-            "label_raw": label,
-            "ndc_raw": ndc,
-        })
-
+    state = load_state()
+    checkpoint = Checkpoint(CHECKPOINT_PATH)
+    mode = "incremental" if incremental else "full"
+    # Only a run of the same mode is resumed: a full run's checkpoint is not
+    # an incremental run's, and an incremental run's work is its stale list
+    unfinished_mode = state.get("mode", "full")
+    resume = not fresh and bool(state.get("unfinished")) and unfinished_mode == mode
+    if resume:
+        logger.info("Resuming the unfinished %s run started %s", mode, state["unfinished"])
+    else:
+        if state.get("unfinished") and not fresh:
+            logger.info(
+                "Not resuming the unfinished %s run started %s as a %s run",
+                unfinished_mode, state["unfinished"], mode,
+            )
+        if not incremental:
+            # A new full run: every name is fetched again
+            checkpoint.reset()
+    done = checkpoint.load()
+    previous = {} if fresh else load_previous_db()
+    run_date = datetime.now(timezone.utc).strftime("%Y%m%d")
+    run_state: Dict[str, Any] = {
+        "last_run": state.get("last_run"),
+        "unfinished": state["unfinished"] if resume else run_date,
+        "mode": mode,
+    }
+    if resume and "stale" in state:
+        run_state["stale"] = state["stale"]
+    save_state(run_state)
+
+    client = OpenFDAClient(
+        base_url=base_url,
+        api_key=api_key,
+        rate_per_minute=rate_per_minute,
+        pool_size=workers,
+    )
+    start = time.perf_counter()
+    try:
+        todo = [g for g in generics if g.lower() not in done]
+        logger.info("%d generics in checkpoint, %d new", len(generics) - len(todo), len(todo))
+
+        seeds = {g.lower() for g in generics}
+        stale: List[str] = []
+        if incremental and "stale" in run_state:
+            # Changed names the unfinished run had not re-fetched yet
+            stale = [g for g in run_state["stale"] if g.lower() in seeds]
+            logger.info("%d changed generics left from the unfinished run", len(stale))
+            todo.extend(stale)
+        elif incremental and done:
+            last_run = run_state["last_run"]
+            if last_run:
+                # effective_time can predate the day openFDA publishes a
+                # label, so look back a little further than the last run
+                since = (
+                    datetime.strptime(last_run, "%Y%m%d") - timedelta(days=lookback_days)
+                ).strftime("%Y%m%d")
+                changed = labels_changed_since(client, since)
+            else:
+                logger.warning("No previous run recorded; refreshing every checkpointed name")
+                changed = None
+            stale = [g for g in stale_generics(done, changed) if g.lower() in seeds]
+            logger.info("%d checkpointed generics changed upstream", len(stale))
+            todo.extend(stale)
+            # Saved before fetching, so a crashed run still re-fetches them
+            run_state["stale"] = stale
+            save_state(run_state)
+
+        if not api_key and 2 * len(todo) / max(batch_size, 1) > OPENFDA_DAILY_LIMIT_NO_KEY:
+            logger.warning(
+                "at least %d requests needed but openFDA allows %d per day without an API key",
+                2 * len(todo) // max(batch_size, 1), OPENFDA_DAILY_LIMIT_NO_KEY,
+            )
+
+        failed: List[str] = []
+        size = max(batch_size, 1)
+        batches = [todo[i:i + size] for i in range(0, len(todo), size)]
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            futures = {pool.submit(fetch_batch, client, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    batch_records = future.result()
+                except OpenFDAError as e:
+                    # Not checkpointed: the next run fetches them again
+                    failed.extend(batch)
+                    logger.warning("Fetching %s failed: %s", ", ".join(batch), e)
+                    continue
+                for record in batch_records:
+                    checkpoint.append(record)
+                    done[record["generic_query"].lower()] = record
+    finally:
+        client.close()
+
+    # Output follows the seed-list order
+    records = [
+        done.get(g.lower()) or previous.get(g.lower()) or {"generic_query": g, "label_raw": None, "ndc_raw": None}
+        for g in generics
+    ]
     OTC_DB_PATH.write_text(
         json.dumps(records, ensure_ascii=False, indent=2),
         encoding="utf-8",
     )
-    logger.info("Wrote openFDA-based DB to %s", OTC_DB_PATH)
+    checkpoint.compact([done[g.lower()] for g in generics if g.lower() in done])
+    if failed:
+        # The run stays unfinished (the next one of the same mode resumes it,
+        # keeping the changed names that failed) and last_run is not
+        # advanced, so --incremental still covers this run's window.
+        if incremental:
+            failed_keys = {g.lower() for g in failed}
+            run_state["stale"] = [g for g in stale if g.lower() in failed_keys]
+        save_state(run_state)
+    else:
+        # Labels changed after the run started may have been missed by names
+        # fetched early on, so the next window starts at the run's start
+        save_state({"last_run": run_state["unfinished"]})
+    logger.info(
+        "Wrote openFDA-based DB to %s (%d generics, %d fetched in %.1fs; %d requests, %d retries, %d failed)",
+        OTC_DB_PATH, len(records), len(todo) - len(failed), time.perf_counter() - start,
+        client.stats["requests"], client.stats["retries"], len(failed),
+    )
+    if failed:
+        logger.warning("%d generics failed; run again to retry them", len(failed))
 
 
 def main() -> None:
@@ -151,9 +631,53 @@ def main() -> None:
         default=os.getenv("OPENFDA_API_KEY"),
         help="openFDA API key (optional, but recommended).",
     )
+    parser.add_argument(
+        "--base-url",
+        default=OPENFDA_BASE_URL,
+        help="openFDA API base URL (e.g. a local stand-in server for tests).",
+    )
+    parser.add_argument("--workers", type=int, default=8, help="concurrent requests")
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=OPENFDA_RATE_PER_MINUTE,
+        help="maximum requests per minute",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="also re-fetch checkpointed names whose openFDA label changed since the last run",
+    )
+    parser.add_argument(
+        "--lookback-days",
+        type=int,
+        default=30,
+        help="with --incremental, how far before the last run to look for label changes",
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="ignore the checkpoint and any unfinished run, and fetch everything",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=25,
+        help="names per OR-combined openFDA query (1 = one query per name)",
+    )
     args = parser.parse_args()
 
-    build_db(verbose=args.verbose, api_key=args.api_key)
+    build_db(
+        verbose=args.verbose,
+        api_key=args.api_key,
+        base_url=args.base_url,
+        workers=args.workers,
+        rate_per_minute=args.rate,
+        incremental=args.incremental,
+        fresh=args.fresh,
+        lookback_days=args.lookback_days,
+        batch_size=args.batch_size,
+    )
 
 
 if __name__ == "__main__":
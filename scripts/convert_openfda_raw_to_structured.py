@@ -39,18 +39,36 @@ We only use a small subset of openFDA fields:
   - label.warnings / warnings_and_cautions / precautions
   - label.boxed_warning
   - label.pediatric_use / geriatric_use
+
+Either file may instead be JSON Lines (one record per line, chosen by a
+.jsonl suffix via --input/--output). With a JSONL file on either side, or
+--workers > 1, records are streamed: read incrementally, converted in
+batches of --batch-size across a process pool, and written in input order,
+so memory is bounded by the batch size rather than the file size. A JSON
+array output is written in the same layout as the non-streaming path.
+
+With --sqlite the output is also loaded, streamed, into the read-only
+SQLite store (data/otc_db.sqlite) that drug_db serves from when
+DRUG_DB_BACKEND=sqlite: indexed name/alias tables plus FTS5 over the label
+passages.
 """
 
 import json
 import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 
 RAW_DB_PATH = DATA_DIR / "otc_db_openfda_raw.json"
 STRUCTURED_DB_PATH = DATA_DIR / "otc_db.json"
+SQLITE_DB_PATH = DATA_DIR / "otc_db.sqlite"
 
 logger = logging.getLogger(__name__)
 
@@ -171,6 +189,32 @@ def extract_from_label(label: Dict[str, Any], generic_fallback: str) -> Dict[str
     }
 
 
+def empty_record(generic_query: str) -> Dict[str, Any]:
+    generic_name = (generic_query or "UNKNOWN").upper()
+    return {
+        "base_name": generic_name,
+        "generic_name": generic_name,
+        "aliases": [generic_name],
+        "category": "",
+        "indications": [],
+        "contraindications": [],
+        "cautions": [],
+        "age_note": "",
+        "important_warnings": [],
+    }
+
+
+def convert_entry(entry: Any) -> Optional[Dict[str, Any]]:
+    """Convert one raw entry; None for entries that are not dicts."""
+    if not isinstance(entry, dict):
+        return None
+    generic_query = str(entry.get("generic_query") or "").strip()
+    label = entry.get("label_raw") or {}
+    if not label:
+        return empty_record(generic_query)
+    return extract_from_label(label, generic_fallback=generic_query or "unknown")
+
+
 def convert(verbose: bool = False) -> None:
     setup_logging(verbose)
 
@@ -197,33 +241,163 @@ def convert(verbose: bool = False) -> None:
 
         if not label:
             logger.warning("No label_raw for entry %d (generic_query=%s)", idx, generic_query)
-            generic_name = (generic_query or "UNKNOWN").upper()
-            structured.append(
-                {
-                    "base_name": generic_name,
-                    "generic_name": generic_name,
-                    "aliases": [generic_name],
-                    "category": "",
-                    "indications": [],
-                    "contraindications": [],
-                    "cautions": [],
-                    "age_note": "",
-                    "important_warnings": [],
-                }
-            )
+            structured.append(empty_record(generic_query))
             continue
 
         logger.info("Converting %d/%d: generic_query=%s", idx + 1, len(raw_db), generic_query)
         record = extract_from_label(label, generic_fallback=generic_query or "unknown")
         structured.append(record)
 
-    STRUCTURED_DB_PATH.write_text(
-        json.dumps(structured, ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
+    # Written to a temp file and renamed into place, so the app's hot reload
+    # never reads a half-written DB
+    writer = _RecordWriter(STRUCTURED_DB_PATH)
+    try:
+        for record in structured:
+            writer.write(record)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
     logger.info("Wrote structured DB to %s", STRUCTURED_DB_PATH)
 
 
+# ---------------------------------------------------------------------------
+# Streaming mode
+# ---------------------------------------------------------------------------
+
+def iter_raw_entries(path: Path) -> Iterator[Any]:
+    """Entries of a JSONL file, or of a JSON array read incrementally."""
+    if path.suffix == ".jsonl":
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    # Reuse the bulk ingester's incremental JSON reader
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from ingest_openfda_bulk import JSONStream
+
+    with path.open("r", encoding="utf-8") as f:
+        yield from JSONStream(f).array_items()
+
+
+class _RecordWriter:
+    """Write records as JSONL, or as a JSON array laid out like json.dumps(indent=2)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.tmp = path.with_suffix(path.suffix + ".tmp")
+        self.jsonl = path.suffix == ".jsonl"
+        self.count = 0
+        self._f = self.tmp.open("w", encoding="utf-8")
+        if not self.jsonl:
+            self._f.write("[")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self.jsonl:
+            self._f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            body = json.dumps(record, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+            self._f.write(("\n  " if self.count == 0 else ",\n  ") + body)
+        self.count += 1
+
+    def close(self) -> None:
+        if not self.jsonl:
+            self._f.write("\n]" if self.count else "]")
+        self._f.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self) -> None:
+        """Drop the partial output; the existing file at path is left alone."""
+        self._f.close()
+        self.tmp.unlink(missing_ok=True)
+
+
+def _batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def convert_stream(
+    input_path: Path,
+    output_path: Path,
+    workers: int = 1,
+    batch_size: int = 1000,
+    verbose: bool = False,
+) -> None:
+    """
+    Convert input_path to output_path batch by batch. While one batch is
+    being written, the next is already converting in the pool, so at most
+    two batches are held in memory.
+    """
+    setup_logging(verbose)
+
+    if not input_path.exists():
+        raise SystemExit(f"Raw openFDA DB not found at {input_path}")
+
+    writer = _RecordWriter(output_path)
+    skipped = 0
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    chunksize = max(1, batch_size // (max(workers, 1) * 4))
+
+    def submit(batch: List[Any]) -> Iterator[Optional[Dict[str, Any]]]:
+        if pool is None:
+            return iter([convert_entry(e) for e in batch])
+        return pool.map(convert_entry, batch, chunksize=chunksize)
+
+    try:
+        pending: Optional[Iterator[Optional[Dict[str, Any]]]] = None
+        for batch in _batches(iter_raw_entries(input_path), max(batch_size, 1)):
+            current = submit(batch)
+            if pending is not None:
+                skipped += _drain(pending, writer)
+            pending = current
+        if pending is not None:
+            skipped += _drain(pending, writer)
+    except BaseException:
+        # Never install a truncated file: the server's watcher would load it
+        writer.abort()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    writer.close()
+
+    if skipped:
+        logger.warning("Skipped %d non-dict entries", skipped)
+    logger.info("Wrote %d structured records to %s", writer.count, output_path)
+
+
+def _drain(results: Iterator[Optional[Dict[str, Any]]], writer: _RecordWriter) -> int:
+    skipped = 0
+    for record in results:
+        if record is None:
+            skipped += 1
+            continue
+        writer.write(record)
+    logger.info("Converted %d records", writer.count)
+    return skipped
+
+
+def build_sqlite_store(structured_path: Path, sqlite_path: Path) -> None:
+    """Load a structured DB file (.json or .jsonl) into the SQLite store."""
+    sys.path.insert(0, str(BASE_DIR))
+    from record_store import file_info
+    from sqlite_store import build_sqlite
+
+    start = time.perf_counter()
+    count = build_sqlite(iter_raw_entries(structured_path), str(sqlite_path), file_info(str(structured_path)))
+    logger.info(
+        "Wrote SQLite store of %d records to %s in %.1f s (%d bytes)",
+        count, sqlite_path, time.perf_counter() - start, sqlite_path.stat().st_size,
+    )
+
+
 def main() -> None:
     import argparse
 
@@ -231,9 +405,50 @@ def main() -> None:
         description="Convert raw openFDA DB to structured OTC DB schema."
     )
     parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--input", type=Path, default=RAW_DB_PATH, help="raw DB (.json or .jsonl)")
+    parser.add_argument("--output", type=Path, default=STRUCTURED_DB_PATH, help="structured DB (.json or .jsonl)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="converter processes (> 1 enables streaming mode; 0 = one per CPU)",
+    )
+    parser.add_argument("--batch-size", type=int, default=1000, help="records per streamed batch")
+    parser.add_argument(
+        "--sqlite",
+        type=Path,
+        nargs="?",
+        const=SQLITE_DB_PATH,
+        default=None,
+        help="also build the SQLite store (default path: data/otc_db.sqlite)",
+    )
+    parser.add_argument(
+        "--sqlite-only",
+        action="store_true",
+        help="skip the conversion and only build the SQLite store from --output (implies --sqlite)",
+    )
     args = parser.parse_args()
-    convert(verbose=args.verbose)
 
+    if args.sqlite_only:
+        setup_logging(args.verbose)
+        build_sqlite_store(args.output, args.sqlite or SQLITE_DB_PATH)
+        return
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    custom_paths = args.input != RAW_DB_PATH or args.output != STRUCTURED_DB_PATH
+    if workers > 1 or custom_paths or ".jsonl" in (args.input.suffix, args.output.suffix):
+        convert_stream(
+            args.input,
+            args.output,
+            workers=workers,
+            batch_size=args.batch_size,
+            verbose=args.verbose,
+        )
+    else:
+        convert(verbose=args.verbose)
+
+    if args.sqlite is not None:
+        build_sqlite_store(args.output, args.sqlite)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Build data/otc_db_openfda_raw.json from the openFDA bulk drug-label
+download instead of the search API.
+
+Input:
+  The drug-label partitions from https://open.fda.gov/data/downloads/
+  (drug-label-0001-of-00NN.json.zip, ...), already on local disk. Each zip
+  holds one JSON document: {"meta": {...}, "results": [label, ...]}.
+
+Output:
+  data/otc_db_openfda_raw.json, in the format written by
+  build_openfda_db_from_seed_list.py and read by
+  convert_openfda_raw_to_structured.py:
+
+    [
+      {"generic_query": "ibuprofen", "label_raw": {...}, "ndc_raw": null},
+      ...
+    ]
+
+Partitions are stream-parsed: labels are decoded one at a time from a
+bounded text buffer, so memory does not grow with partition size. By
+default only labels whose openfda generic or brand name equals a seed name
+are kept (the newest effective_time per name, generic-name matches
+first). With --all every label is written, streamed straight to the
+output file.
+"""
+
+import io
+import json
+import logging
+import os
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from build_openfda_db_from_seed_list import (
+    DATA_DIR,
+    OTC_DB_PATH,
+    SEED_PATH,
+    read_seed_list,
+    setup_logging,
+)
+
+BULK_DIR = DATA_DIR / "bulk"
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = " \t\r\n"
+_DELIMITERS = ",]}:" + _WHITESPACE
+
+
+class JSONStream:
+    """
+    Incremental reader over a text stream holding one large JSON document.
+    Values are decoded with json.JSONDecoder.raw_decode from a buffer that
+    only keeps the unread part plus one chunk.
+    """
+
+    def __init__(self, stream: TextIO, chunk_size: int = 1 << 20):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ("" at end of input)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos] if self.pos < len(self.buf) else ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r}, found {found!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number cut by the chunk boundary ("-3." of "-3.25") still
+            # decodes; only trust it once a delimiter follows.
+            if (
+                isinstance(obj, (int, float))
+                and not isinstance(obj, bool)
+                and (end == len(self.buf) or self.buf[end] not in _DELIMITERS)
+                and self._fill()
+            ):
+                continue
+            self.pos = end
+            return obj
+
+    def array_items(self) -> Iterator[Any]:
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def iter_results(stream: TextIO) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the items of the top-level "results" array of an openFDA
+    document; other top-level keys (meta) are decoded and skipped.
+    """
+    reader = JSONStream(stream)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == "results":
+            yield from reader.array_items()
+        else:
+            reader.value()
+        if reader.peek() == ",":
+            reader.pos += 1
+            continue
+        reader.expect("}")
+        return
+
+
+def iter_labels(paths: List[Path]) -> Iterator[Dict[str, Any]]:
+    """Labels from .json.zip partitions (every .json member) or plain .json files."""
+    for path in paths:
+        logger.info("Reading %s", path)
+        if path.suffix == ".zip":
+            with zipfile.ZipFile(path) as zf:
+                for member in zf.namelist():
+                    if not member.endswith(".json"):
+                        continue
+                    with zf.open(member) as raw:
+                        yield from iter_results(io.TextIOWrapper(raw, encoding="utf-8"))
+        else:
+            with path.open("r", encoding="utf-8") as f:
+                yield from iter_results(f)
+
+
+def find_partitions(inputs: List[str]) -> List[Path]:
+    paths: List[Path] = []
+    for item in inputs:
+        p = Path(item)
+        if p.is_dir():
+            paths.extend(sorted(p.glob("drug-label-*.json.zip")))
+        else:
+            paths.append(p)
+    return paths
+
+
+def _match_rank(label: Dict[str, Any], name: str) -> Tuple[int, str]:
+    """Prefer labels whose generic name (not just a brand) matches, then the newest."""
+    ofd = label.get("openfda") or {}
+    generic_match = name in [n.lower() for n in ofd.get("generic_name") or []]
+    return (1 if generic_match else 0, str(label.get("effective_time") or ""))
+
+
+def _names(label: Dict[str, Any]) -> List[str]:
+    ofd = label.get("openfda") or {}
+    return [n.lower() for key in ("generic_name", "brand_name") for n in ofd.get(key) or []]
+
+
+def ingest_seed(paths: List[Path], generics: List[str]) -> List[Dict[str, Any]]:
+    wanted = {g.lower() for g in generics}
+    best: Dict[str, Tuple[Tuple[int, str], Dict[str, Any]]] = {}
+    scanned = 0
+    for label in iter_labels(paths):
+        scanned += 1
+        for name in set(_names(label)) & wanted:
+            rank = _match_rank(label, name)
+            if name not in best or rank > best[name][0]:
+                best[name] = (rank, label)
+        if scanned % 10000 == 0:
+            logger.info("Scanned %d labels, %d/%d seed names matched", scanned, len(best), len(wanted))
+
+    logger.info("Scanned %d labels, %d/%d seed names matched", scanned, len(best), len(wanted))
+    return [
+        {
+            "generic_query": g,
+            "label_raw": best[g.lower()][1] if g.lower() in best else None,
+            "ndc_raw": None,
+        }
+        for g in generics
+    ]
+
+
+def ingest_all(paths: List[Path], output: Path) -> int:
+    """Stream every label into the output JSON array; returns the count."""
+    tmp = output.with_suffix(output.suffix + ".tmp")
+    count = 0
+    with tmp.open("w", encoding="utf-8") as out:
+        out.write("[\n")
+        for label in iter_labels(paths):
+            ofd = label.get("openfda") or {}
+            generic = (ofd.get("generic_name") or [""])[0].lower()
+            record = {"generic_query": generic, "label_raw": label, "ndc_raw": None}
+            out.write(("  " if count == 0 else ",\n  ") + json.dumps(record, ensure_ascii=False))
+            count += 1
+            if count % 10000 == 0:
+                logger.info("Wrote %d labels", count)
+        out.write("\n]\n")
+    os.replace(tmp, output)
+    return count
+
+
+def ingest(
+    inputs: List[str],
+    verbose: bool = False,
+    take_all: bool = False,
+    output: Optional[Path] = None,
+) -> None:
+    setup_logging(verbose)
+    output = output or OTC_DB_PATH
+
+    paths = find_partitions(inputs)
+    missing = [p for p in paths if not p.exists()]
+    if not paths or missing:
+        raise SystemExit(f"No bulk partitions found ({', '.join(map(str, missing)) or inputs})")
+
+    if take_all:
+        count = ingest_all(paths, output)
+        logger.info("Wrote %d labels to %s", count, output)
+        return
+
+    generics = read_seed_list()
+    logger.info("Loaded %d generic names from %s", len(generics), SEED_PATH)
+    records = ingest_seed(paths, generics)
+    output.write_text(json.dumps(records, ensure_ascii=False, indent=2), encoding="utf-8")
+    logger.info("Wrote openFDA-based DB to %s", output)
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Build the raw openFDA DB from bulk drug-label zip partitions."
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        default=[str(BULK_DIR)],
+        help="partition files or directories (default: data/bulk/)",
+    )
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--all", action="store_true", help="keep every label, not just seed names")
+    parser.add_argument("--output", type=Path, default=None, help="output path (default: data/otc_db_openfda_raw.json)")
+    args = parser.parse_args()
+    ingest(args.inputs, verbose=args.verbose, take_all=args.all, output=args.output)
+
+
+if __name__ == "__main__":
+    main()
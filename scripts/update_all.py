@@ -5,21 +5,41 @@ from pathlib import Path
 # 获取当前 Python 解释器的路径
 PYTHON_EXE = sys.executable 
 
-def run_update():
+def run_update(snippets: bool = False, incremental: bool = False):
     print(f"开始从 FDA 采集数据 (使用: {PYTHON_EXE})...")
-    result_a = subprocess.run([PYTHON_EXE, "scripts/build_openfda_db_from_seed_list.py", "--verbose"])
+    # 上次运行未完成时从断点续跑，否则全量重新抓取；--incremental 只重新抓取新增或 openFDA 上已更新的药物
+    fetch_args = ["--verbose"] + (["--incremental"] if incremental else [])
+    result_a = subprocess.run([PYTHON_EXE, "scripts/build_openfda_db_from_seed_list.py", *fetch_args])
     
     if result_a.returncode != 0:
         print("采集脚本出错，请检查网络或 common_generics_en.txt 内容。")
         return
 
     print("\n正在将原始数据转换为系统格式...")
-    result_b = subprocess.run([PYTHON_EXE, "scripts/convert_openfda_raw_to_structured.py", "--verbose"])
+    # 同时生成只读 SQLite 库，供 DRUG_DB_BACKEND=sqlite 使用
+    result_b = subprocess.run([PYTHON_EXE, "scripts/convert_openfda_raw_to_structured.py", "--verbose", "--sqlite"])
     
-    if result_b.returncode == 0:
-        print("\n[成功] 数据库已更新！现在可以启动 main.py 了。")
-    else:
+    if result_b.returncode != 0:
         print("\n[失败] 转换过程中出现问题。")
+        return
+
+    if snippets:
+        # 可选：离线生成中英文摘要（需要 LLM API Key），已是最新的记录会被跳过
+        print("\n正在生成中英文药物摘要...")
+        result_c = subprocess.run([PYTHON_EXE, "scripts/build_llm_snippets.py", "--verbose"])
+        if result_c.returncode != 0:
+            print("\n[警告] 摘要生成未完成，问答时将回退到原始字段。可重新运行以续传。")
+
+    # 二进制快照：让各 worker 启动时免去 JSON 解析和建索引
+    result_d = subprocess.run([PYTHON_EXE, "scripts/build_db_snapshot.py"])
+    if result_d.returncode != 0:
+        print("\n[警告] 快照生成失败，服务启动时将直接加载 JSON。")
+
+    print("\n[成功] 数据库已更新！现在可以启动 main.py 了。")
+    print("运行中的服务会在 DRUG_DB_WATCH_INTERVAL 秒内自动加载新数据，也可调用 POST /admin/reload-db。")
 
 if __name__ == "__main__":
-    run_update()
\ No newline at end of file
+    run_update(
+        snippets="--snippets" in sys.argv[1:],
+        incremental="--incremental" in sys.argv[1:],
+    )
\ No newline at end of file
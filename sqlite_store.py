@@ -0,0 +1,457 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from drug_context import record_passages
+from drug_names import (
+    LOOKUP_TIERS,
+    alias_forms,
+    index_names,
+    lookup_key,
+    lookup_keys,
+    normalize_name,
+    resolve_key,
+    surface_names,
+)
+from fuzzy_index import FuzzyNameIndex
+from name_matcher import boundary_spans
+from passage_index import expand_query, tokenize
+from record_store import file_info
+
+# Bump when the schema or the meaning of a table changes; files with another
+# format are not opened.
+SQLITE_FORMAT = 2
+
+# Names below this length are not matched in text (same as the automatons).
+MIN_NAME_LENGTH = 2
+
+# Bound on the number of parameters per IN (...) query.
+_IN_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+
+-- Whole records as JSON, in DB order; passages of record id are the rows
+-- passage_start .. passage_end - 1 of the passages table.
+CREATE TABLE records (
+    id INTEGER PRIMARY KEY,
+    generic_name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    passage_start INTEGER NOT NULL,
+    passage_end INTEGER NOT NULL
+);
+
+-- Exact-match tiers of find_by_generic_name (tier: 0 generic, 1 alias,
+-- 2 base); the first record in DB order wins per key and tier.
+CREATE TABLE lookup (
+    key TEXT NOT NULL,
+    tier INTEGER NOT NULL,
+    record_id INTEGER NOT NULL,
+    PRIMARY KEY (key, tier)
+) WITHOUT ROWID;
+
+-- Lowercased normalized names matched by find_drugs_in_text.
+CREATE TABLE text_names (
+    name TEXT NOT NULL,
+    record_id INTEGER NOT NULL,
+    PRIMARY KEY (name, record_id)
+) WITHOUT ROWID;
+
+-- normalize_name() of generic names and aliases, for find_preps_by_generic_name.
+CREATE TABLE prep_names (
+    name TEXT NOT NULL,
+    record_id INTEGER NOT NULL,
+    PRIMARY KEY (name, record_id)
+) WITHOUT ROWID;
+
+-- Surface forms of the records matched by find_local_mentions, with the
+-- record each one resolves to and whether that resolution is ambiguous.
+-- Names of the alias table (drug_names) are resolved at query time instead,
+-- so that edits to it need no rebuild.
+CREATE TABLE surface (
+    name TEXT PRIMARY KEY,
+    form TEXT NOT NULL,
+    record_id INTEGER,
+    ambiguous INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+-- Lookup key of a surface form -> generic names of the records carrying it.
+CREATE TABLE owners (
+    key TEXT NOT NULL,
+    generic_key TEXT NOT NULL,
+    PRIMARY KEY (key, generic_key)
+) WITHOUT ROWID;
+
+-- Sentence-level label passages. rec holds the token "r<record id>" so a
+-- search can be restricted to one record inside the full-text query.
+CREATE VIRTUAL TABLE passages USING fts5(
+    sentence, rec, section UNINDEXED, tokenize = 'porter unicode61'
+);
+"""
+
+
+def _chunks(items: List[Any], size: int = _IN_CHUNK) -> Iterable[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _resolve_surface(conn: sqlite3.Connection, form: str) -> Optional[Tuple[int, bool]]:
+    """
+    (record id, ambiguous) a surface form resolves to, like
+    drug_db._local_target, or None.
+    """
+    key = resolve_key(form)
+    row = conn.execute(
+        "SELECT record_id FROM lookup WHERE key = ? ORDER BY tier LIMIT 1", (key,)
+    ).fetchone()
+    if row is None:
+        return None
+    is_generic = conn.execute(
+        "SELECT 1 FROM lookup WHERE key = ? AND tier = 0", (key,)
+    ).fetchone() is not None
+    owners = conn.execute("SELECT COUNT(*) FROM owners WHERE key = ?", (key,)).fetchone()[0]
+    return row[0], not is_generic and owners > 1
+
+
+def build_sqlite(
+    records: Iterable[Dict[str, Any]], path: str, source: Optional[Dict[str, Any]] = None
+) -> int:
+    """
+    Write the SQLite drug store for `records` (streamed, in DB order) to
+    path, atomically. `source` identifies the otc_db.json it was built from.
+    Returns the number of records.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(SCHEMA)
+        tier_ids = {tier: i for i, tier in enumerate(LOOKUP_TIERS)}
+
+        count = 0
+        pid = 0
+        max_text, max_surface = 0, 0
+        for record_id, entry in enumerate(records, start=1):
+            start = pid
+            for section, sentences in record_passages(entry).items():
+                for sentence in sentences:
+                    conn.execute(
+                        "INSERT INTO passages (rowid, sentence, rec, section) VALUES (?, ?, ?, ?)",
+                        (pid, sentence, f"r{record_id}", section),
+                    )
+                    pid += 1
+            conn.execute(
+                "INSERT INTO records VALUES (?, ?, ?, ?, ?)",
+                (
+                    record_id,
+                    entry.get("generic_name") or "",
+                    json.dumps(entry, ensure_ascii=False),
+                    start,
+                    pid,
+                ),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO lookup VALUES (?, ?, ?)",
+                ((key, tier_ids[tier], record_id) for tier, key in lookup_keys(entry)),
+            )
+
+            names = [n.lower() for n in index_names(entry) if len(n.lower()) >= MIN_NAME_LENGTH]
+            conn.executemany(
+                "INSERT OR IGNORE INTO text_names VALUES (?, ?)", ((n, record_id) for n in names)
+            )
+            max_text = max([max_text] + [len(n) for n in names])
+
+            preps = [normalize_name(entry.get("generic_name", ""))]
+            preps.extend(normalize_name(a) for a in entry.get("aliases") or [] if isinstance(a, str))
+            conn.executemany(
+                "INSERT OR IGNORE INTO prep_names VALUES (?, ?)",
+                ((n, record_id) for n in preps if n),
+            )
+
+            generic_key = lookup_key(entry.get("generic_name") or "")
+            for form, key in surface_names(entry):
+                conn.execute("INSERT OR IGNORE INTO owners VALUES (?, ?)", (key, generic_key))
+                if len(form.lower()) >= MIN_NAME_LENGTH:
+                    conn.execute("INSERT OR IGNORE INTO surface (name, form) VALUES (?, ?)", (form.lower(), form))
+                    max_surface = max(max_surface, len(form.lower()))
+            count += 1
+
+        # Resolve every surface form the way find_by_generic_name would
+        resolved = []
+        for name, form in conn.execute("SELECT name, form FROM surface").fetchall():
+            target = _resolve_surface(conn, form)
+            if target is not None:
+                resolved.append((target[0], int(target[1]), name))
+        conn.executemany("UPDATE surface SET record_id = ?, ambiguous = ? WHERE name = ?", resolved)
+
+        meta = {
+            "format": str(SQLITE_FORMAT),
+            "records": str(count),
+            "max_text_name": str(max_text),
+            "max_surface_name": str(max_surface),
+            "source": json.dumps(source or {}, sort_keys=True),
+            "built_at": str(time.time()),
+        }
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", meta.items())
+        conn.execute("INSERT INTO passages (passages) VALUES ('optimize')")
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return count
+
+
+class SQLitePassageIndex:
+    """
+    PassageIndex interface (has_record / search / passages_of) over the FTS5
+    passages table, ranked with FTS5's bm25().
+    """
+
+    def __init__(self, store: "SQLiteDrugDB"):
+        self.store = store
+
+    def has_record(self, record: Dict[str, Any]) -> bool:
+        return self.store.record_id(record) is not None
+
+    def search(self, question: str, record: Dict[str, Any], k: int) -> List[Tuple[int, float]]:
+        record_id = self.store.record_id(record)
+        if record_id is None or k <= 0:
+            return []
+        terms = sorted({t for t in tokenize(expand_query(question)) if t.isascii()})
+        if not terms:
+            return []
+        match = f"rec:r{record_id} AND (" + " OR ".join(f'"{t}"' for t in terms) + ")"
+        rows = self.store.conn().execute(
+            "SELECT rowid, bm25(passages, 1.0, 0.0) AS rank FROM passages "
+            "WHERE passages MATCH ? ORDER BY rank LIMIT ?",
+            (match, k),
+        ).fetchall()
+        return [(pid, -rank) for pid, rank in rows]
+
+    def passages_of(
+        self, record: Dict[str, Any], pids: List[int], source: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[str, str]]:
+        if not pids:
+            return []
+        marks = ",".join("?" * len(pids))
+        rows = self.store.conn().execute(
+            f"SELECT rowid, section, sentence FROM passages WHERE rowid IN ({marks})", pids
+        ).fetchall()
+        by_pid = {pid: (section, sentence) for pid, section, sentence in rows}
+        return [by_pid[pid] for pid in pids if pid in by_pid]
+
+
+class SQLiteDrugDB:
+    """
+    Read-only drug store in a single SQLite file built by build_sqlite.
+
+    Implements the query interface of drug_db.DrugDBSnapshot (lookup,
+    drugs_in_text, preps_by_name, local_hits, similar, full_record,
+    passage_index)
+    with indexed tables instead of in-memory indexes, so the resident cost
+    per worker does not grow with the number of labels; the file's pages
+    are shared by every worker through the OS page cache. Text matching
+    looks up every candidate span of the text (name_matcher.boundary_spans)
+    and so follows the automatons' matching rules.
+
+    Records are decoded on demand. The last `cache_size` are kept (and
+    returned as the same dict), which is also what identifies a record to
+    the passage index; a record that has left the cache falls back to its
+    whole text in the context builder. The fuzzy name index behind
+    similar() is built from the surface table on first use.
+    """
+
+    storage = "sqlite"
+    store = None
+
+    def __init__(self, path: str, cache_size: int = 256):
+        self.path = path
+        self.cache_size = max(cache_size, 1)
+        self.source = file_info(path)
+        self._uri = Path(path).resolve().as_uri() + "?mode=ro&immutable=1"
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._records: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._ids: Dict[int, int] = {}
+        self._fuzzy: Optional[FuzzyNameIndex] = None
+
+        meta = dict(self.conn().execute("SELECT key, value FROM meta").fetchall())
+        if meta.get("format") != str(SQLITE_FORMAT):
+            raise ValueError(f"Unsupported SQLite drug store format {meta.get('format')!r}: {path}")
+        self.record_count = int(meta["records"])
+        self.max_text_name = int(meta["max_text_name"])
+        self.max_surface_name = int(meta["max_surface_name"])
+        self.built_from = json.loads(meta["source"])
+
+        self.passage_index = SQLitePassageIndex(self)
+        self.snippets: Dict[str, Dict[str, Any]] = {}
+        self.watched: Tuple[Any, ...] = ()
+        self.loaded_from = "sqlite"
+        self.load_seconds = 0.0
+        self.loaded_at = 0.0
+        self.generation = 0
+
+    def conn(self) -> sqlite3.Connection:
+        """Per-thread read-only connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    @property
+    def version(self) -> str:
+        raw = json.dumps([self.source, self.storage], sort_keys=True).encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()[:12]
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "generation": self.generation,
+            "records": len(self),
+            "snippets": len(self.snippets),
+            "storage": self.storage,
+            "loaded_from": self.loaded_from,
+            "load_seconds": self.load_seconds,
+            "loaded_at": self.loaded_at,
+        }
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    # -- records -----------------------------------------------------------
+
+    def _records_by_id(self, record_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        found: Dict[int, Dict[str, Any]] = {}
+        missing: List[int] = []
+        with self._lock:
+            for rid in record_ids:
+                record = self._records.get(rid)
+                if record is None:
+                    missing.append(rid)
+                else:
+                    self._records.move_to_end(rid)
+                    found[rid] = record
+        for chunk in _chunks(missing):
+            marks = ",".join("?" * len(chunk))
+            rows = self.conn().execute(
+                f"SELECT id, data FROM records WHERE id IN ({marks})", chunk
+            ).fetchall()
+            with self._lock:
+                for rid, data in rows:
+                    record = self._records.get(rid)
+                    if record is None:
+                        record = json.loads(data)
+                        self._records[rid] = record
+                        self._ids[id(record)] = rid
+                        while len(self._records) > self.cache_size:
+                            _, old = self._records.popitem(last=False)
+                            self._ids.pop(id(old), None)
+                    found[rid] = record
+        return found
+
+    def _records_in_order(self, record_ids: List[int]) -> List[Dict[str, Any]]:
+        found = self._records_by_id(record_ids)
+        return [found[rid] for rid in record_ids if rid in found]
+
+    def record_id(self, record: Dict[str, Any]) -> Optional[int]:
+        with self._lock:
+            return self._ids.get(id(record))
+
+    def full_record(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        return entry
+
+    # -- queries -----------------------------------------------------------
+
+    def lookup(self, name: str) -> Optional[Dict[str, Any]]:
+        key = resolve_key(name)
+        if not key:
+            return None
+        row = self.conn().execute(
+            "SELECT record_id FROM lookup WHERE key = ? ORDER BY tier LIMIT 1", (key,)
+        ).fetchone()
+        return self._records_in_order([row[0]])[0] if row else None
+
+    def preps_by_name(self, name_norm: str) -> List[Dict[str, Any]]:
+        rows = self.conn().execute(
+            "SELECT record_id FROM prep_names WHERE name = ? ORDER BY record_id", (name_norm,)
+        ).fetchall()
+        return self._records_in_order([r[0] for r in rows])
+
+    def _matching(self, table: str, columns: str, names: List[str]) -> List[Tuple[Any, ...]]:
+        rows: List[Tuple[Any, ...]] = []
+        for chunk in _chunks(sorted(set(names))):
+            marks = ",".join("?" * len(chunk))
+            rows.extend(self.conn().execute(
+                f"SELECT {columns} FROM {table} WHERE name IN ({marks})", chunk
+            ).fetchall())
+        return rows
+
+    def drugs_in_text(self, text: str) -> List[Dict[str, Any]]:
+        spans = [s for _, _, s in boundary_spans(text, MIN_NAME_LENGTH, self.max_text_name)]
+        rows = self._matching("text_names", "record_id", spans)
+        return self._records_in_order(sorted({r[0] for r in rows}))
+
+    def local_hits(self, text: str) -> List[Tuple[int, int, Optional[Dict[str, Any]], bool]]:
+        forms = alias_forms()
+        max_length = max([self.max_surface_name] + [len(n) for n in forms])
+        spans = list(boundary_spans(text, MIN_NAME_LENGTH, max_length, cjk_loose=True))
+        rows = self._matching("surface", "name, record_id, ambiguous", [s for _, _, s in spans])
+        targets = {name: (rid, bool(amb)) for name, rid, amb in rows}
+        for _, _, name in spans:
+            if name in forms and name not in targets:
+                rid, amb = _resolve_surface(self.conn(), forms[name]) or (None, False)
+                targets[name] = (rid, amb)
+
+        hits = sorted(((s, e, name) for s, e, name in spans if name in targets), key=lambda h: (h[0], -h[1]))
+        chosen = []
+        last_end = -1
+        for start, end, name in hits:
+            if start >= last_end:
+                chosen.append((start, end, name))
+                last_end = end
+
+        records = self._records_by_id([targets[n][0] for _, _, n in chosen if targets[n][0] is not None])
+        return [
+            (start, end, records.get(targets[name][0]) if targets[name][0] is not None else None, targets[name][1])
+            for start, end, name in chosen
+        ]
+
+    def _fuzzy_index(self) -> FuzzyNameIndex:
+        index = self._fuzzy
+        if index is None:
+            rows = self.conn().execute(
+                "SELECT name, record_id, ambiguous FROM surface WHERE record_id IS NOT NULL"
+            ).fetchall()
+            index = self._fuzzy = FuzzyNameIndex((name, (rid, bool(amb))) for name, rid, amb in rows)
+        return index
+
+    def similar(
+        self, name: str, limit: int, max_distance: int, nearest: bool = False
+    ) -> List[Tuple[str, int, float, Optional[Dict[str, Any]], bool]]:
+        index = self._fuzzy_index()
+        found = [
+            (index.names[nid], dist, sim, *index.payloads[nid][0])
+            for nid, dist, sim in index.search(name, limit, max_distance, nearest)
+        ]
+        records = self._records_by_id([rid for _, _, _, rid, _ in found])
+        return [(form, dist, sim, records.get(rid), amb) for form, dist, sim, rid, amb in found]
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Importing drug_db opens the learned-alias store; keep test runs from
+# creating data/alias_memory.sqlite.
+os.environ.setdefault("ALIAS_MEMORY_PATH", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,71 @@
+import pytest
+
+import drug_db
+from drug_names import alias_forms
+from sqlite_store import SQLiteDrugDB, build_sqlite
+
+
+def canon(record):
+    return record and (record.get("generic_name"), record.get("base_name"))
+
+
+@pytest.fixture(scope="module")
+def records():
+    return drug_db.load_otc_db()
+
+
+@pytest.fixture(scope="module")
+def backends(records, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("sqlite") / "otc_db.sqlite")
+    build_sqlite(records, path)
+    store = SQLiteDrugDB(path)
+    yield drug_db.DrugDBSnapshot(records, {}), store
+    store.close()
+
+
+@pytest.fixture(scope="module")
+def names(records):
+    found = set(alias_forms())
+    for record in records:
+        for name in [record.get("generic_name"), record.get("base_name")] + list(record.get("aliases") or []):
+            if isinstance(name, str) and name:
+                found.update({name, name.lower(), name.upper(), f" {name} "})
+    return sorted(found) + ["", "x", "not a drug", "ibuprofin", "泰诺林", "維C"]
+
+
+def questions(records):
+    generics = sorted({r.get("generic_name") for r in records if r.get("generic_name")})
+    return [
+        "Can I take Advil with Tylenol?",
+        "我吃了布洛芬片和维c每天",
+        "loratadine, cetirizine; or fexofenadine (allegra)",
+        "vitamin c 500 or vitamin c?",
+        "is ibuprofin ok with aspirin 81",
+        "",
+    ] + [f"is {g} safe for kids?" for g in generics] + [f"{a} and {b}" for a, b in zip(generics, generics[1:])]
+
+
+def test_backends_have_the_same_records(records, backends):
+    json_db, sqlite_db = backends
+    assert len(json_db) == len(sqlite_db) == len(records)
+
+
+def test_lookup_parity(backends, names):
+    json_db, sqlite_db = backends
+    for name in names:
+        assert canon(json_db.lookup(name)) == canon(sqlite_db.lookup(name)), name
+
+
+def test_local_hits_parity(records, backends):
+    json_db, sqlite_db = backends
+    for text in questions(records):
+        expected = [(s, e, canon(r), a) for s, e, r, a in json_db.local_hits(text)]
+        got = [(s, e, canon(r), a) for s, e, r, a in sqlite_db.local_hits(text)]
+        assert got == expected, text
+
+
+def test_drugs_in_text_parity(records, backends):
+    json_db, sqlite_db = backends
+    for text in questions(records):
+        expected = [canon(r) for r in json_db.drugs_in_text(text)]
+        assert [canon(r) for r in sqlite_db.drugs_in_text(text)] == expected, text
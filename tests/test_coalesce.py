@@ -0,0 +1,243 @@
+import asyncio
+
+import pytest
+
+from coalesce import SingleFlight, StreamFanout
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# ---------------------------------------------------------------------------
+# SingleFlight
+# ---------------------------------------------------------------------------
+
+def test_single_flight_shares_one_call():
+    async def main():
+        flights = SingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return "answer"
+
+        callers = [asyncio.ensure_future(flights.do("q", work)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert flights.in_flight() == 1
+        release.set()
+        assert await asyncio.gather(*callers) == ["answer"] * 5
+        assert calls == [1]
+        assert flights.stats == {"leaders": 1, "coalesced": 4}
+        assert flights.in_flight() == 0
+
+    run(main())
+
+
+def test_single_flight_error_reaches_every_caller_and_is_not_kept():
+    async def main():
+        flights = SingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def fail():
+            calls.append(1)
+            await release.wait()
+            raise ValueError("boom")
+
+        callers = [asyncio.ensure_future(flights.do("q", fail)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert [type(r) for r in results] == [ValueError] * 3
+        assert flights.in_flight() == 0
+
+        async def ok():
+            calls.append(2)
+            return "fresh"
+
+        assert await flights.do("q", ok) == "fresh"
+        assert calls == [1, 2]
+
+    run(main())
+
+
+def test_single_flight_cancelled_caller_does_not_cancel_the_others():
+    async def main():
+        flights = SingleFlight()
+        release = asyncio.Event()
+        finished = []
+
+        async def work():
+            await release.wait()
+            finished.append(1)
+            return "answer"
+
+        leader = asyncio.ensure_future(flights.do("q", work))
+        follower = asyncio.ensure_future(flights.do("q", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await follower == "answer"
+        assert leader.cancelled()
+        assert finished == [1]
+
+    run(main())
+
+
+def test_single_flight_work_finishes_when_every_caller_is_cancelled():
+    async def main():
+        flights = SingleFlight()
+        release = asyncio.Event()
+        finished = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            finished.set()
+            return "answer"
+
+        caller = asyncio.ensure_future(flights.do("q", work))
+        await asyncio.sleep(0)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        release.set()
+        await asyncio.wait_for(finished.wait(), 1)
+        await asyncio.sleep(0)
+        assert flights.in_flight() == 0
+
+    run(main())
+
+
+def test_single_flight_cancelled_work_cancels_its_callers():
+    async def main():
+        flights = SingleFlight()
+
+        async def work():
+            raise asyncio.CancelledError()
+
+        callers = [asyncio.ensure_future(flights.do("q", work)) for _ in range(2)]
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert all(isinstance(r, asyncio.CancelledError) for r in results)
+        assert flights.in_flight() == 0
+
+    run(main())
+
+
+# ---------------------------------------------------------------------------
+# StreamFanout
+# ---------------------------------------------------------------------------
+
+async def collect(stream):
+    return [item async for item in stream]
+
+
+def test_fanout_every_subscriber_gets_every_item():
+    async def main():
+        fanout = StreamFanout()
+        step = asyncio.Event()
+        produced = []
+
+        async def producer():
+            produced.append(1)
+            yield "a"
+            await step.wait()
+            yield "b"
+            yield "c"
+
+        first = asyncio.ensure_future(collect(fanout.subscribe("q", producer)))
+        await asyncio.sleep(0.01)
+        # A late subscriber replays what was already sent
+        late = asyncio.ensure_future(collect(fanout.subscribe("q", producer)))
+        await asyncio.sleep(0.01)
+        step.set()
+        assert await first == ["a", "b", "c"]
+        assert await late == ["a", "b", "c"]
+        assert produced == [1]
+        assert fanout.stats == {"leaders": 1, "coalesced": 1}
+        assert fanout.in_flight() == 0
+
+    run(main())
+
+
+def test_fanout_error_reaches_every_subscriber_after_its_items():
+    async def main():
+        fanout = StreamFanout()
+        step = asyncio.Event()
+
+        async def producer():
+            yield "a"
+            await step.wait()
+            raise ValueError("boom")
+
+        async def read(stream):
+            items = []
+            try:
+                async for item in stream:
+                    items.append(item)
+            except ValueError as e:
+                items.append(f"error: {e}")
+            return items
+
+        readers = [asyncio.ensure_future(read(fanout.subscribe("q", producer))) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        step.set()
+        assert await asyncio.gather(*readers) == [["a", "error: boom"]] * 3
+        assert fanout.in_flight() == 0
+
+        async def fresh():
+            yield "again"
+
+        # The failed stream is not replayed to later subscribers
+        assert await collect(fanout.subscribe("q", fresh)) == ["again"]
+
+    run(main())
+
+
+def test_fanout_subscriber_leaving_early_does_not_stop_the_others():
+    async def main():
+        fanout = StreamFanout()
+        step = asyncio.Event()
+
+        async def producer():
+            yield "a"
+            await step.wait()
+            yield "b"
+
+        async def first_only(stream):
+            async for item in stream:
+                await stream.aclose()
+                return item
+
+        quitter = asyncio.ensure_future(first_only(fanout.subscribe("q", producer)))
+        stayer = asyncio.ensure_future(collect(fanout.subscribe("q", producer)))
+        assert await quitter == "a"
+        step.set()
+        assert await stayer == ["a", "b"]
+
+    run(main())
+
+
+def test_fanout_cancelled_subscriber_does_not_stop_the_others():
+    async def main():
+        fanout = StreamFanout()
+        step = asyncio.Event()
+
+        async def producer():
+            yield "a"
+            await step.wait()
+            yield "b"
+
+        cancelled = asyncio.ensure_future(collect(fanout.subscribe("q", producer)))
+        stayer = asyncio.ensure_future(collect(fanout.subscribe("q", producer)))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        step.set()
+        assert await stayer == ["a", "b"]
+        assert cancelled.cancelled()
+
+    run(main())
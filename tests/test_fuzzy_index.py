@@ -0,0 +1,94 @@
+import os
+import random
+
+import pytest
+
+from fuzzy_index import FuzzyNameIndex, edit_distance, fold
+
+SEED_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "common_generics_en.txt")
+
+
+def osa_distance(a, b):
+    """Unbounded optimal string alignment distance, the textbook way."""
+    d = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) + 1):
+        d[i][0] = i
+    for j in range(len(b) + 1):
+        d[0][j] = j
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d[i][j] = min(d[i][j], d[i - 2][j - 2] + 1)
+    return d[len(a)][len(b)]
+
+
+def brute_force(names, query, limit, max_distance):
+    q = fold(query)
+    results = []
+    for name in names:
+        dist = edit_distance(q, name, max_distance)
+        if dist <= max_distance:
+            results.append((name, dist, 1.0 - dist / max(len(q), len(name))))
+    results.sort(key=lambda r: (r[1], -r[2], r[0]))
+    return results[:limit]
+
+
+def mutate(rng, word, edits):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    for _ in range(edits):
+        i = rng.randrange(len(word) + 1)
+        op = rng.choice("ids t")
+        if op == "i" or not word:
+            word = word[:i] + rng.choice(letters) + word[i:]
+        elif op == "d" and i < len(word):
+            word = word[:i] + word[i + 1:]
+        elif op == "s" and i < len(word):
+            word = word[:i] + rng.choice(letters) + word[i + 1:]
+        elif op == "t" and i + 1 < len(word):
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word
+
+
+@pytest.fixture(scope="module")
+def names():
+    with open(SEED_PATH, encoding="utf-8") as f:
+        seeds = [fold(line) for line in f if line.strip() and not line.startswith("#")]
+    # Near-duplicates make ties and crowded neighbourhoods likely
+    rng = random.Random(3)
+    return sorted(set(seeds + [mutate(rng, s, 1) for s in seeds]))
+
+
+def test_edit_distance_matches_reference():
+    rng = random.Random(1)
+    for _ in range(2000):
+        a = "".join(rng.choice("abc") for _ in range(rng.randint(0, 7)))
+        b = "".join(rng.choice("abc") for _ in range(rng.randint(0, 7)))
+        limit = rng.randint(0, 3)
+        assert edit_distance(a, b, limit) == min(osa_distance(a, b), limit + 1), (a, b, limit)
+
+
+@pytest.mark.parametrize("max_distance", [1, 2, 3])
+def test_search_matches_brute_force(names, max_distance):
+    index = FuzzyNameIndex(((n, n) for n in names), max_distance=max_distance, verify_limit=len(names))
+    rng = random.Random(max_distance)
+    queries = [mutate(rng, rng.choice(names), rng.randint(0, max_distance + 1)) for _ in range(300)]
+    queries += ["", "x", "zzzzzz", "vitamin", "ibuprofen sodium"]
+    for query in queries:
+        expected = brute_force(names, query, 5, max_distance)
+        got = [(index.names[nid], dist, sim) for nid, dist, sim in index.search(query, 5)]
+        assert got == expected, query
+
+
+def test_nearest_returns_only_the_closest(names):
+    index = FuzzyNameIndex(((n, n) for n in names), max_distance=2, verify_limit=len(names))
+    rng = random.Random(11)
+    for _ in range(300):
+        query = mutate(rng, rng.choice(names), rng.randint(1, 3))
+        expected = brute_force(names, query, 5, 2)
+        if expected:
+            best = expected[0][1]
+            expected = [r for r in expected if r[1] == best]
+        got = [(index.names[nid], dist, sim) for nid, dist, sim in index.search(query, 5, nearest=True)]
+        assert got == expected, query
@@ -0,0 +1,67 @@
+import random
+import re
+
+from name_matcher import NameAutomaton
+
+
+def regex_matches(names, text, min_length=2):
+    """Every (start, end, name) the per-name regex (?<!\\w)name(?!\\w) finds, overlaps included."""
+    found = set()
+    for name in {n.lower() for n in names}:
+        if len(name) < min_length:
+            continue
+        pattern = re.compile(rf"(?<!\w)(?={re.escape(name)}(?!\w))", re.IGNORECASE)
+        for m in pattern.finditer(text):
+            found.add((m.start(), m.start() + len(name), name))
+    return found
+
+
+def automaton_matches(automaton, text):
+    return {(start, end, automaton.names[pid]) for start, end, pid in automaton.iter_matches(text)}
+
+
+def test_word_boundaries():
+    automaton = NameAutomaton([("tan", 0), ("Advil", 1), ("vitamin c", 2)])
+    assert automaton_matches(automaton, "a tangent") == set()
+    assert automaton_matches(automaton, "ADVIL, tan.") == {(0, 5, "advil"), (7, 10, "tan")}
+    assert automaton_matches(automaton, "vitamin c/advil") == {(0, 9, "vitamin c"), (10, 15, "advil")}
+    assert automaton_matches(automaton, "vitamin cs") == set()
+
+
+def test_short_names_and_payloads():
+    automaton = NameAutomaton([("a", 0), ("AB", 1), ("ab", 2)], min_length=2)
+    assert automaton.names == ["ab"]
+    assert automaton.payloads == [[1, 2]]
+    assert automaton.matched_ids("x ab a") == [0]
+
+
+def test_cjk_loose():
+    names = [("布洛芬", 0), ("维c", 1), ("tan", 2)]
+    loose = NameAutomaton(names, cjk_loose=True)
+    strict = NameAutomaton(names)
+    assert automaton_matches(loose, "我吃了布洛芬片和维c每天") == {(3, 6, "布洛芬"), (8, 10, "维c")}
+    assert automaton_matches(strict, "我吃了布洛芬片和维c每天") == set()
+    assert automaton_matches(loose, "tangent") == set()
+
+
+def test_matches_regex_semantics():
+    rng = random.Random(7)
+    alphabet = "ab_ -.1"
+    for _ in range(300):
+        names = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 6))]
+        automaton = NameAutomaton((name, i) for i, name in enumerate(names))
+        for _ in range(5):
+            pieces = names + [name.upper() for name in names] + list(alphabet)
+            text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+            assert automaton_matches(automaton, text) == regex_matches(names, text), (names, text)
+
+
+def test_matches_regex_on_drug_names():
+    names = ["ibuprofen", "Advil", "vitamin C", "vitamin c 500", "C", "aspirin", "aspirin 81"]
+    automaton = NameAutomaton((name, i) for i, name in enumerate(names))
+    for text in (
+        "Can I take Advil (ibuprofen) with aspirin 81?",
+        "vitamin c 500mg or vitamin C 500",
+        "ibuprofen-aspirin, ibuprofen_aspirin, xibuprofen",
+    ):
+        assert automaton_matches(automaton, text) == regex_matches(names, text), text